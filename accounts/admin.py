@@ -7,10 +7,11 @@ from .models import Specialization, User
 @admin.register(User)
 class UserAdmin(DjangoUserAdmin):
     fieldsets = DjangoUserAdmin.fieldsets + (
-        ("Rôle et contact", {"fields": ("role", "phone", "specialization", "marketplace_visible")}),
+        ("Rôle et contact", {"fields": ("role", "phone", "specializations", "marketplace_visible")}),
     )
+    filter_horizontal = DjangoUserAdmin.filter_horizontal + ("specializations",)
     list_display = ("username", "email", "role", "specialization", "marketplace_visible")
-    list_filter = ("role", "marketplace_visible")
+    list_filter = ("role", "marketplace_visible", "specializations")
 
 
 @admin.register(Specialization)
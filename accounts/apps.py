@@ -1,5 +1,5 @@
 from django.apps import AppConfig
-from django.db.models.signals import post_migrate
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_delete
 
 
 class AccountsConfig(AppConfig):
@@ -7,6 +7,20 @@ class AccountsConfig(AppConfig):
     name = 'accounts'
 
     def ready(self):
-        from .signals import create_default_superuser  # noqa: WPS433
+        from .models import Specialization, User  # noqa: WPS433
+        from .signals import (  # noqa: WPS433
+            create_default_superuser,
+            specialization_deleted,
+            specialization_deleting,
+            specialization_saved,
+            user_changed,
+            user_specializations_changed,
+        )
 
         post_migrate.connect(create_default_superuser, sender=self)
+        post_save.connect(specialization_saved, sender=Specialization)
+        pre_delete.connect(specialization_deleting, sender=Specialization)
+        post_delete.connect(specialization_deleted, sender=Specialization)
+        m2m_changed.connect(user_specializations_changed, sender=User.specializations.through)
+        post_save.connect(user_changed, sender=User)
+        post_delete.connect(user_changed, sender=User)
@@ -0,0 +1,72 @@
+"""
+Authentication backend serving the session's User from the cache.
+
+``AuthenticationMiddleware`` loads the logged-in user on every request;
+:class:`CachedModelBackend` reads the row from the shared cache instead of
+the database. Entries are stored under a per-user version that
+``accounts.signals`` bumps once a change to the user is committed (profile,
+role, password, specializations): a request that read the old row
+concurrently can only store it under the abandoned version, and a password
+change still logs out the other sessions at once.
+"""
+import time
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+
+from gp_immo import metrics
+
+USER_TIMEOUT = 60 * 60
+# Bump when the User model changes, so that rows pickled by the previous code are ignored.
+SCHEMA = 1
+
+
+def _version_key(user_id) -> str:
+    return f"accounts:user:{user_id}:version"
+
+
+def version(user_id) -> int:
+    key = _version_key(user_id)
+    current = cache.get(key)
+    if current is None:
+        # Start from the clock, not 0, so entries of an evicted version never come back.
+        cache.add(key, time.time_ns(), None)
+        current = cache.get(key)
+    return current
+
+
+def invalidate(user_id):
+    def bump():
+        try:
+            cache.incr(_version_key(user_id))
+        except ValueError:
+            # Evicted: the next read starts a new version anyway.
+            pass
+
+    transaction.on_commit(bump)
+
+
+def cached_user(user_id):
+    key = f"accounts:user:{user_id}:{SCHEMA}:{version(user_id)}"
+    user = cache.get(key)
+    metrics.record_cache("user", hits=user is not None, misses=user is None)
+    if user is None:
+        UserModel = get_user_model()
+        try:
+            user = UserModel._default_manager.get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        cache.set(key, user, USER_TIMEOUT)
+    return user
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        user = cached_user(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        return await sync_to_async(self.get_user)(user_id)
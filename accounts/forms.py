@@ -1,11 +1,17 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 
-from .models import Specialization, User
+from . import taxonomy
+from .models import User
 
 
-def specialization_queryset():
-    return Specialization.objects.all()
+def specialization_field(required):
+    return forms.TypedMultipleChoiceField(
+        label="Spécialisations",
+        coerce=int,
+        required=required,
+        widget=forms.CheckboxSelectMultiple,
+    )
 
 
 class ProprietaireSignupForm(UserCreationForm):
@@ -25,12 +31,7 @@ class ProprietaireSignupForm(UserCreationForm):
 
 class PrestataireSignupForm(UserCreationForm):
     phone = forms.CharField(label="Téléphone", required=False)
-    specialization = forms.ModelChoiceField(
-        label="Spécialisation",
-        queryset=Specialization.objects.none(),
-        required=True,
-        empty_label="Choisir une spécialisation",
-    )
+    specializations = specialization_field(required=True)
     marketplace_visible = forms.BooleanField(
         label="Visible sur le marketplace",
         required=False,
@@ -39,50 +40,43 @@ class PrestataireSignupForm(UserCreationForm):
 
     class Meta(UserCreationForm.Meta):
         model = User
-        fields = ["username", "email", "phone", "specialization", "marketplace_visible"]
+        fields = ["username", "email", "phone", "marketplace_visible"]
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        qs = specialization_queryset()
-        self.fields["specialization"].queryset = qs
-        if not qs.exists():
-            self.fields["specialization"].empty_label = "Aucune spécialisation enregistrée"
+        choices = taxonomy.choices()
+        self.fields["specializations"].choices = choices
+        if not choices:
+            self.fields["specializations"].help_text = "Aucune spécialisation enregistrée"
 
     def save(self, commit=True):
         user: User = super().save(commit=False)
         user.role = User.Role.PRESTATAIRE
-        selected = self.cleaned_data.get("specialization")
-        user.specialization = selected.name if selected else ""
         user.marketplace_visible = self.cleaned_data.get("marketplace_visible", True)
         if commit:
             user.save()
+            user.specializations.set(self.cleaned_data["specializations"])
         return user
 
 
 class ProfileForm(forms.ModelForm):
     class Meta:
         model = User
-        fields = ["email", "phone", "specialization", "marketplace_visible"]
+        fields = ["email", "phone", "marketplace_visible"]
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        qs = specialization_queryset()
-        if qs.exists():
-            self.fields["specialization"] = forms.ModelChoiceField(
-                queryset=qs,
-                required=False,
-                label="Spécialisation",
-                empty_label="Choisir une spécialisation",
-                initial=None,
-            )
-            if isinstance(self.instance, User) and self.instance.specialization:
-                self.fields["specialization"].initial = qs.filter(name=self.instance.specialization).first()
+        choices = taxonomy.choices()
+        if choices:
+            self.fields["specializations"] = specialization_field(required=False)
+            self.fields["specializations"].choices = choices
+            if self.instance.pk:
+                self.fields["specializations"].initial = list(
+                    self.instance.specializations.values_list("id", flat=True)
+                )
 
     def save(self, commit=True):
-        user: User = super().save(commit=False)
-        selected = self.cleaned_data.get("specialization")
-        if isinstance(selected, Specialization):
-            user.specialization = selected.name
-        if commit:
-            user.save()
+        user: User = super().save(commit=commit)
+        if commit and "specializations" in self.cleaned_data:
+            user.specializations.set(self.cleaned_data["specializations"])
         return user
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_specialization'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='specialization',
+            name='normalized_name',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=120),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='search_name',
+            field=models.CharField(blank=True, editable=False, max_length=150),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='specializations',
+            field=models.ManyToManyField(blank=True, related_name='prestataires', to='accounts.specialization', verbose_name='spécialisations'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('marketplace_visible', True), ('role', 'PRESTATAIRE')), fields=['search_name', 'id'], name='user_marketplace_idx'),
+        ),
+    ]
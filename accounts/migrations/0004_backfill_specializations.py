@@ -0,0 +1,36 @@
+from django.db import migrations
+
+from accounts.text import normalize
+
+
+def backfill(apps, schema_editor):
+    Specialization = apps.get_model('accounts', 'Specialization')
+    User = apps.get_model('accounts', 'User')
+
+    for specialization in Specialization.objects.all():
+        specialization.normalized_name = normalize(specialization.name)
+        specialization.save(update_fields=['normalized_name'])
+
+    by_name = {s.name.lower(): s for s in Specialization.objects.all()}
+    for user in User.objects.all().iterator():
+        user.search_name = normalize(user.username)
+        user.save(update_fields=['search_name'])
+        label = user.specialization.strip()
+        if not label:
+            continue
+        specialization = by_name.get(label.lower())
+        if specialization is None:
+            specialization = Specialization.objects.create(name=label, normalized_name=normalize(label))
+            by_name[label.lower()] = specialization
+        user.specializations.add(specialization)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_user_specializations'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_updated_at(apps, schema_editor):
+    apps.get_model('accounts', 'User').objects.update(updated_at=models.F('date_joined'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_backfill_specializations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,8 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
+from .text import normalize
+
 
 class User(AbstractUser):
     class Role(models.TextChoices):
@@ -10,8 +12,27 @@ class User(AbstractUser):
 
     phone = models.CharField(max_length=30, blank=True)
     role = models.CharField(max_length=20, choices=Role.choices, default=Role.PROPRIETAIRE)
+    # Display label kept in sync with ``specializations`` (see accounts.signals).
     specialization = models.CharField(max_length=100, blank=True)
+    specializations = models.ManyToManyField(
+        "Specialization",
+        blank=True,
+        related_name="prestataires",
+        verbose_name="spécialisations",
+    )
     marketplace_visible = models.BooleanField(default=True)
+    search_name = models.CharField(max_length=150, blank=True, editable=False)
+    # Version of the row for the cached template fragments (logins save last_login only and leave it).
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(
+                fields=["search_name", "id"],
+                condition=models.Q(role="PRESTATAIRE", marketplace_visible=True),
+                name="user_marketplace_idx",
+            ),
+        ]
 
     def is_proprietaire(self) -> bool:
         return self.role == self.Role.PROPRIETAIRE
@@ -25,15 +46,24 @@ class User(AbstractUser):
             return f"{base} - {self.specialization}"
         return base
 
+    def save(self, *args, **kwargs):
+        self.search_name = normalize(self.username)
+        super().save(*args, **kwargs)
+
     def __str__(self) -> str:
         return self.display_name()
 
 
 class Specialization(models.Model):
     name = models.CharField(max_length=120, unique=True)
+    normalized_name = models.CharField(max_length=120, blank=True, db_index=True, editable=False)
 
     class Meta:
         ordering = ["name"]
 
+    def save(self, *args, **kwargs):
+        self.normalized_name = normalize(self.name)
+        super().save(*args, **kwargs)
+
     def __str__(self) -> str:
         return self.name
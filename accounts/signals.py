@@ -1,5 +1,6 @@
 from django.contrib.auth import get_user_model
 
+from . import backends, taxonomy
 from .models import Specialization
 
 DEFAULT_SPECIALIZATIONS = ["Plomberie", "Menuiserie", "Carrelage"]
@@ -17,3 +18,42 @@ def create_default_superuser(sender, **kwargs):
 
     for name in DEFAULT_SPECIALIZATIONS:
         Specialization.objects.get_or_create(name=name)
+
+
+def refresh_specialization_label(user):
+    ids = user.specializations.values_list("id", flat=True)
+    label = ", ".join(taxonomy.names(ids))[:100]
+    if label != user.specialization:
+        user.specialization = label
+        user.save(update_fields=["specialization", "updated_at"])
+
+
+def user_specializations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        refresh_specialization_label(instance)
+    elif pk_set:
+        for user in get_user_model().objects.filter(pk__in=pk_set):
+            refresh_specialization_label(user)
+
+
+def specialization_saved(sender, instance, created, raw=False, **kwargs):
+    taxonomy.invalidate()
+    if not created and not raw:
+        for user in instance.prestataires.all():
+            refresh_specialization_label(user)
+
+
+def specialization_deleting(sender, instance, **kwargs):
+    instance._affected_users = list(instance.prestataires.all())
+
+
+def specialization_deleted(sender, instance, **kwargs):
+    taxonomy.invalidate()
+    for user in getattr(instance, "_affected_users", []):
+        refresh_specialization_label(user)
+
+
+def user_changed(sender, instance, **kwargs):
+    backends.invalidate(instance.pk)
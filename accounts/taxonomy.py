@@ -0,0 +1,86 @@
+"""
+In-process cache of the specialization taxonomy.
+
+The list is tiny and read on every signup/profile form and marketplace
+search, so each process keeps it in memory. A version number in the shared
+cache, bumped by the Specialization signals, tells other processes to reload.
+"""
+import time
+from dataclasses import dataclass
+
+from django.core.cache import cache
+
+from .models import Specialization
+from .text import normalize, similarity, trigrams
+
+VERSION_KEY = "accounts:specializations:version"
+RECHECK_SECONDS = 5
+MIN_SIMILARITY = 0.3
+
+
+@dataclass(frozen=True)
+class Entry:
+    id: int
+    name: str
+    normalized: str
+    grams: frozenset
+
+
+class _State:
+    entries = None
+    version = None
+    checked_at = 0.0
+
+
+_state = _State()
+
+
+def entries():
+    now = time.monotonic()
+    if _state.entries is not None and now - _state.checked_at < RECHECK_SECONDS:
+        return _state.entries
+    version = cache.get(VERSION_KEY, 0)
+    if _state.entries is None or version != _state.version:
+        _state.entries = [
+            Entry(pk, name, normalized, frozenset(trigrams(normalized)))
+            for pk, name, normalized in Specialization.objects.values_list("id", "name", "normalized_name")
+        ]
+        _state.version = version
+    _state.checked_at = now
+    return _state.entries
+
+
+def invalidate():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+    _state.entries = None
+
+
+def choices():
+    return [(entry.id, entry.name) for entry in entries()]
+
+
+def names(ids):
+    wanted = set(ids)
+    return [entry.name for entry in entries() if entry.id in wanted]
+
+
+def match(query: str):
+    """
+    Ids of specializations whose name (or one of its words) starts with the
+    query, or that are close enough by trigram similarity to absorb typos.
+    """
+    needle = normalize(query)
+    if not needle:
+        return []
+    grams = trigrams(needle)
+    matched = []
+    for entry in entries():
+        words = entry.normalized.split()
+        if entry.normalized.startswith(needle) or any(word.startswith(needle) for word in words):
+            matched.append(entry.id)
+        elif similarity(grams, entry.grams) >= MIN_SIMILARITY:
+            matched.append(entry.id)
+    return matched
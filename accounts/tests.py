@@ -1,3 +1,36 @@
+from django.core.cache import cache
 from django.test import TestCase
 
-# Create your tests here.
+from . import taxonomy
+from .models import Specialization
+from .text import normalize
+
+
+class TaxonomyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for name in ("Plomberie", "Électricité", "Peinture intérieure"):
+            Specialization.objects.get_or_create(name=name)
+
+    def setUp(self):
+        cache.clear()
+        taxonomy.invalidate()
+
+    def names(self, query):
+        return taxonomy.names(taxonomy.match(query))
+
+    def test_normalize(self):
+        self.assertEqual(normalize("  Électricité   Générale! "), "electricite generale")
+        self.assertEqual(normalize(None), "")
+
+    def test_prefixes_words_and_typos(self):
+        self.assertEqual(self.names("elec"), ["Électricité"])
+        self.assertEqual(self.names("interieure"), ["Peinture intérieure"])
+        self.assertEqual(self.names("plombrie"), ["Plomberie"])
+        self.assertEqual(self.names("zzz"), [])
+        self.assertEqual(self.names(""), [])
+
+    def test_new_specializations_are_seen(self):
+        self.assertEqual(self.names("serr"), [])
+        Specialization.objects.create(name="Serrurerie")
+        self.assertEqual(self.names("serr"), ["Serrurerie"])
@@ -0,0 +1,147 @@
+"""
+Read replicas.
+
+``ReplicaRouter`` sends reads to one of ``GP_IMMO_DB_REPLICAS`` and every
+write to ``default``. Reads go to the primary instead when:
+
+* the request is not GET/HEAD/OPTIONS, or has written to the database;
+* the client wrote during the last ``GP_IMMO_PRIMARY_PIN_SECONDS`` (the
+  middleware sets a short-lived cookie after a write, so the next pages
+  read their own writes whatever the replication lag);
+* the view is decorated with :func:`use_primary`, or the code runs inside
+  ``with primary():``.
+
+The state lives in a context variable, so it follows the request into
+``sync_to_async`` threads and async views.
+"""
+import asyncio
+import contextvars
+import functools
+import random
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PRIMARY = DEFAULT_DB_ALIAS
+PIN_COOKIE = "gp_primary"
+_pinned = contextvars.ContextVar("gp_immo_primary_pinned", default=False)
+_wrote = contextvars.ContextVar("gp_immo_primary_wrote", default=False)
+
+
+def replicas():
+    return getattr(settings, "GP_IMMO_DB_REPLICAS", [])
+
+
+def pin_seconds():
+    return getattr(settings, "GP_IMMO_PRIMARY_PIN_SECONDS", 5)
+
+
+@contextmanager
+def primary():
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+def note_write():
+    """Record a write done on behalf of this context (e.g. by the SQLite writer thread)."""
+    _wrote.set(True)
+
+
+def use_primary(view):
+    """Serve every query of ``view`` from the primary (e.g. views polling fresh writes)."""
+    if asyncio.iscoroutinefunction(view):
+
+        @functools.wraps(view)
+        async def wrapper(*args, **kwargs):
+            with primary():
+                return await view(*args, **kwargs)
+
+    else:
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            with primary():
+                return view(*args, **kwargs)
+
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db:
+            # Related rows come from where their instance was read.
+            return instance._state.db
+        if _pinned.get() or _wrote.get() or not replicas():
+            return PRIMARY
+        return random.choice(replicas())
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *replicas()}
+        return obj1._state.db in databases and obj2._state.db in databases
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
+
+
+class PrimaryPinMiddleware:
+    """Pins unsafe requests, and the clients that wrote a moment ago, to the primary."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        tokens = self._pin(request)
+        try:
+            response = self.get_response(request)
+            wrote = _wrote.get()
+        finally:
+            self._unpin(tokens)
+        return self._respond(response, wrote)
+
+    async def __acall__(self, request):
+        tokens = self._pin(request)
+        try:
+            response = await self.get_response(request)
+            wrote = _wrote.get()
+        finally:
+            self._unpin(tokens)
+        return self._respond(response, wrote)
+
+    @staticmethod
+    def _pin(request):
+        try:
+            pinned_until = float(request.COOKIES.get(PIN_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        pinned = request.method not in ("GET", "HEAD", "OPTIONS") or pinned_until > time.time()
+        return _pinned.set(pinned), _wrote.set(False)
+
+    @staticmethod
+    def _unpin(tokens):
+        _pinned.reset(tokens[0])
+        _wrote.reset(tokens[1])
+
+    @staticmethod
+    def _respond(response, wrote):
+        if wrote and replicas():
+            seconds = pin_seconds()
+            response.set_cookie(PIN_COOKIE, f"{time.time() + seconds:.0f}", max_age=seconds, httponly=True, samesite="Lax")
+        return response
@@ -0,0 +1,265 @@
+"""
+Per-view performance metrics.
+
+``MetricsMiddleware`` measures every request and aggregates the figures per
+URL name, in process: latency, number of SQL queries and time spent in them,
+repeated statements (the same SQL run several times with different
+parameters, the N+1 signature), response size and cache hits/misses. Queries
+are counted with an execute wrapper on the request thread's connections (for
+an async request, those of its ``sync_to_async`` thread); application caches
+report their lookups with :func:`record_cache`, and conditional GETs count as
+"http" cache hits (304) or misses.
+
+:func:`metrics_view` serves the aggregates at ``/metrics`` in the Prometheus
+text format. Each worker process keeps its own figures, so scrape every
+worker (or run one). Requests running more queries than
+``GP_IMMO_QUERY_BUDGET`` (or their entry in ``GP_IMMO_QUERY_BUDGETS``) are
+logged with their most repeated statements.
+"""
+import contextvars
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+METRICS = {
+    "gp_immo_requests_total": ("counter", "Requêtes traitées."),
+    "gp_immo_request_duration_seconds": ("histogram", "Durée des requêtes.", LATENCY_BUCKETS),
+    "gp_immo_request_queries": ("histogram", "Requêtes SQL par requête HTTP.", QUERY_BUCKETS),
+    "gp_immo_request_sql_seconds_total": ("counter", "Temps passé dans les requêtes SQL."),
+    "gp_immo_request_repeated_queries_total": ("counter", "Requêtes SQL répétées (même SQL, autres paramètres)."),
+    "gp_immo_requests_over_query_budget_total": ("counter", "Requêtes HTTP au-delà du budget de requêtes SQL."),
+    "gp_immo_response_size_bytes": ("histogram", "Taille des réponses.", SIZE_BUCKETS),
+    "gp_immo_cache_lookups_total": ("counter", "Consultations des caches."),
+}
+
+_current = contextvars.ContextVar("gp_immo_metrics_request", default=None)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.histograms = {}
+
+    def inc(self, name, labels, value=1):
+        self.counters[name, labels] += value
+
+    def observe(self, name, labels, value):
+        histogram = self.histograms.get((name, labels))
+        if histogram is None:
+            histogram = self.histograms[name, labels] = Histogram(METRICS[name][2])
+        histogram.observe(value)
+
+    def render(self) -> str:
+        samples = defaultdict(list)
+        with self.lock:
+            for (name, labels), value in self.counters.items():
+                samples[name].append(f"{name}{_labels(labels)} {value:g}")
+            for (name, labels), histogram in self.histograms.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    samples[name].append(f"{name}_bucket{_labels(labels + (('le', f'{bound:g}'),))} {cumulative}")
+                samples[name].append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+                samples[name].append(f"{name}_sum{_labels(labels)} {histogram.sum:g}")
+                samples[name].append(f"{name}_count{_labels(labels)} {histogram.count}")
+        lines = []
+        for name, (kind, description, *_) in METRICS.items():
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}", *sorted(samples[name])]
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def _labels(labels) -> str:
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels) + "}"
+
+
+class RequestStats:
+    """What one request did; also the execute wrapper counting its queries."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.statements = Counter()
+        self.cache = Counter()
+        self.size = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.queries += 1
+            self.statements[sql] += 1
+
+    def repeated(self) -> int:
+        return sum(count - 1 for count in self.statements.values() if count > 1)
+
+
+def record_cache(name, hits=0, misses=0):
+    """Count lookups of the application cache ``name`` for the current request."""
+    stats = _current.get()
+    if stats is not None:
+        stats.cache[name, "hit"] += hits
+        stats.cache[name, "miss"] += misses
+
+
+def query_budget(view):
+    return getattr(settings, "GP_IMMO_QUERY_BUDGETS", {}).get(view, getattr(settings, "GP_IMMO_QUERY_BUDGET", None))
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats, wrappers = self._start()
+        token = _current.set(stats)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            wrappers.close()
+            raise
+        finally:
+            _current.reset(token)
+        return self._respond(request, response, stats, wrappers)
+
+    async def __acall__(self, request):
+        # The queries run in the request's sync_to_async thread, on that thread's connections.
+        stats, wrappers = await sync_to_async(self._start)()
+        token = _current.set(stats)
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            wrappers.close()
+            raise
+        finally:
+            _current.reset(token)
+        return self._respond(request, response, stats, wrappers)
+
+    @staticmethod
+    def _start():
+        stats = RequestStats()
+        wrappers = ExitStack()
+        for connection in connections.all():
+            wrappers.enter_context(connection.execute_wrapper(stats))
+        return stats, wrappers
+
+    def _respond(self, request, response, stats, wrappers):
+        if response.streaming and not response.has_header("Content-Length") and not response.is_async:
+            # The body (and its queries) is produced after this returns: finish on close.
+            response.streaming_content = self._counting(stats, response.streaming_content)
+            response._resource_closers.append(lambda: self._finish(request, response, stats, wrappers))
+        else:
+            wrappers.close()
+            self._finish(request, response, stats, None)
+        return response
+
+    @staticmethod
+    def _counting(stats, content):
+        stats.size = 0
+        for chunk in content:
+            stats.size += len(chunk)
+            yield chunk
+
+    def _finish(self, request, response, stats, wrappers):
+        if wrappers is not None:
+            wrappers.close()
+        duration = time.perf_counter() - stats.started
+        match = request.resolver_match
+        view = match.view_name if match else "<aucune>"
+        if stats.size is None:
+            if response.has_header("Content-Length"):
+                stats.size = int(response["Content-Length"])
+            elif not response.streaming:
+                stats.size = len(response.content)
+        if "If-None-Match" in request.headers or "If-Modified-Since" in request.headers:
+            stats.cache["http", "hit" if response.status_code == 304 else "miss"] += 1
+        repeated = stats.repeated()
+        budget = query_budget(view)
+        over_budget = budget is not None and stats.queries > budget
+        labels = (("view", view),)
+        with registry.lock:
+            registry.inc("gp_immo_requests_total", labels + (("method", request.method), ("status", response.status_code)))
+            registry.observe("gp_immo_request_duration_seconds", labels, duration)
+            registry.observe("gp_immo_request_queries", labels, stats.queries)
+            registry.inc("gp_immo_request_sql_seconds_total", labels, stats.sql_time)
+            if repeated:
+                registry.inc("gp_immo_request_repeated_queries_total", labels, repeated)
+            if over_budget:
+                registry.inc("gp_immo_requests_over_query_budget_total", labels)
+            if stats.size is not None:
+                registry.observe("gp_immo_response_size_bytes", labels, stats.size)
+            for (name, result), count in stats.cache.items():
+                if count:
+                    registry.inc("gp_immo_cache_lookups_total", labels + (("cache", name), ("result", result)), count)
+        if over_budget:
+            top = "".join(
+                f"\n  {count} × {sql[:200]}" for sql, count in stats.statements.most_common(3) if count > 1
+            )
+            logger.warning(
+                "%s %s (%s) : %d requêtes SQL pour un budget de %d, %.1f ms de SQL, %d répétées%s",
+                request.method, request.path, view, stats.queries, budget, stats.sql_time * 1000, repeated, top,
+            )
+
+
+def _allowed(request) -> bool:
+    token = getattr(settings, "GP_IMMO_METRICS_TOKEN", "")
+    if token and constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return True
+    if request.META.get("REMOTE_ADDR") in getattr(settings, "GP_IMMO_METRICS_ALLOWED_IPS", ()):
+        return True
+    return request.user.is_staff
+
+
+def metrics_view(request):
+    if not _allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -37,13 +38,17 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'rest_framework',
+    'rest_framework.authtoken',
     # Project apps
     'accounts.apps.AccountsConfig',
     'immo.apps.ImmoConfig',
 ]
 
 MIDDLEWARE = [
+    'gp_immo.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'gp_immo.db.PrimaryPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -70,6 +75,22 @@ TEMPLATES = [
     },
 ]
 
+# Production template rendering (automatic with DEBUG off, or
+# GP_IMMO_PRODUCTION_TEMPLATES=1): no debug annotations on the compiled
+# templates, and templates compiled once per process by the cached loader,
+# without the development auto-reload. The list rows are cached separately,
+# per object version, by {% cachedfor %} (immo.templatetags.fragment_tags).
+GP_IMMO_PRODUCTION_TEMPLATES = not DEBUG or bool(os.environ.get('GP_IMMO_PRODUCTION_TEMPLATES'))
+if GP_IMMO_PRODUCTION_TEMPLATES:
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['debug'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
 WSGI_APPLICATION = 'gp_immo.wsgi.application'
 
 
@@ -83,6 +104,89 @@ DATABASES = {
     }
 }
 
+# SQLite production mode: WAL journal, busy timeout, larger page cache and mmap
+# on every connection, write transactions opened with BEGIN IMMEDIATE (no
+# read-to-write lock upgrade failing with "database is locked") and small
+# writes funnelled through one writer thread (gp_immo.writequeue).
+# `manage.py benchmark_sqlite` compares it with the stock configuration.
+GP_IMMO_SQLITE_PRODUCTION = bool(os.environ.get('GP_IMMO_SQLITE_PRODUCTION'))
+GP_IMMO_SQLITE_PRODUCTION_OPTIONS = {
+    'timeout': 20,
+    'transaction_mode': 'IMMEDIATE',
+    'init_command': (
+        'PRAGMA journal_mode=WAL;'
+        'PRAGMA synchronous=NORMAL;'
+        'PRAGMA busy_timeout=20000;'
+        'PRAGMA cache_size=-65536;'
+        'PRAGMA mmap_size=268435456;'
+        'PRAGMA temp_store=MEMORY'
+    ),
+}
+if GP_IMMO_SQLITE_PRODUCTION:
+    DATABASES['default']['OPTIONS'] = GP_IMMO_SQLITE_PRODUCTION_OPTIONS
+GP_IMMO_SQLITE_WRITE_QUEUE = GP_IMMO_SQLITE_PRODUCTION
+
+# Read replica: reads are routed to it by gp_immo.db.ReplicaRouter. Locally,
+# GP_IMMO_SQLITE_REPLICA=db-replica.sqlite3 and `manage.py sync_replica` stand in
+# for streaming replication.
+if os.environ.get('GP_IMMO_SQLITE_REPLICA'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / os.environ['GP_IMMO_SQLITE_REPLICA'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['gp_immo.db.ReplicaRouter']
+GP_IMMO_DB_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+# How long a client that wrote keeps reading from the primary.
+GP_IMMO_PRIMARY_PIN_SECONDS = 5
+
+
+# Cache
+# The dashboard panels, search facets and public prestataire pages are
+# invalidated through version keys and deletions in this cache, so several
+# worker processes must share it: set GP_IMMO_REDIS_URL (needs the redis
+# package) in production. The local-memory default only suits one process.
+
+if os.environ.get('GP_IMMO_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['GP_IMMO_REDIS_URL'],
+            'KEY_PREFIX': 'gp_immo',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+
+# Fast authenticated requests (GP_IMMO_FAST_AUTH=cache or cookie): sessions
+# read from the cache (written through to the database) or kept in a signed
+# cookie, the session's User read from a per-user cache
+# (accounts.backends.CachedModelBackend) and flash messages kept in a cookie,
+# so a simple logged-in GET reaches its view without a query. Needs the shared
+# cache in production (see CACHES). Signed-cookie sessions cannot be revoked
+# server-side, except by a password change.
+GP_IMMO_FAST_AUTH = os.environ.get('GP_IMMO_FAST_AUTH', '')
+if GP_IMMO_FAST_AUTH:
+    SESSION_ENGINE = {
+        'cache': 'django.contrib.sessions.backends.cached_db',
+        'cookie': 'django.contrib.sessions.backends.signed_cookies',
+    }[GP_IMMO_FAST_AUTH]
+    MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+    # ModelBackend stays for the sessions opened before the switch.
+    AUTHENTICATION_BACKENDS = [
+        'accounts.backends.CachedModelBackend',
+        'django.contrib.auth.backends.ModelBackend',
+    ]
+# Sessions are only written when their data changed.
+SESSION_SAVE_EVERY_REQUEST = False
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -124,7 +228,58 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    # Deduplicated uploads of the immo models, stored under MEDIA_ROOT/blobs/.
+    'blobs': {'BACKEND': 'immo.storage.ContentAddressedStorage'},
+}
+
 AUTH_USER_MODEL = 'accounts.User'
+
+# Offline geocoding of Bien addresses: CSV with name,latitude,longitude columns.
+GP_IMMO_GEOCODER = 'immo.geo.gazetteer_geocode'
+GP_IMMO_GAZETTEER_PATH = BASE_DIR / 'data' / 'gazetteer.csv'
+
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'rest_framework.authentication.TokenAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+    ],
+    'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.IsAuthenticated'],
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+}
+
+# Pub/sub backend of the messaging push channel (immo.realtime). The in-memory
+# broker only reaches clients connected to the same process.
+GP_IMMO_PUBSUB_BACKEND = 'immo.realtime.InMemoryBroker'
+# Origins (e.g. 'https://app.example.com') allowed to open the messaging
+# WebSocket besides the site itself (Origin matching the Host header).
+GP_IMMO_WS_ALLOWED_ORIGINS = []
+
+# Processes resizing BienMedia images (immo.media); 0 resizes after commit in
+# the request thread.
+GP_IMMO_MEDIA_WORKERS = 2
+
+# Resumable uploads (immo.uploads): partial files are assembled here, outside
+# MEDIA_ROOT but on the same disk so finalizing is a rename.
+GP_IMMO_UPLOAD_DIR = BASE_DIR / 'tmp' / 'uploads'
+GP_IMMO_UPLOAD_MAX_SIZE = 2 * 1024 ** 3
+
+# Media files are served by immo.views.media_file after an access check.
+# Set to "nginx" (X-Accel-Redirect to an internal location aliased to
+# MEDIA_ROOT) or "apache" (X-Sendfile) to let the front server stream them.
+GP_IMMO_MEDIA_ACCEL = None
+GP_IMMO_MEDIA_ACCEL_PREFIX = '/protected-media/'
+# Per-view metrics (gp_immo.metrics), served at /metrics to the allowed
+# addresses, to staff users and to "Authorization: Bearer <token>".
+GP_IMMO_METRICS_TOKEN = os.environ.get('GP_IMMO_METRICS_TOKEN', '')
+GP_IMMO_METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+# Requests running more SQL queries are logged; per URL name overrides, None
+# disables the check.
+GP_IMMO_QUERY_BUDGET = 30
+GP_IMMO_QUERY_BUDGETS = {}
+
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'dashboard'
 LOGOUT_REDIRECT_URL = 'login'
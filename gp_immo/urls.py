@@ -17,8 +17,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import include, path
 
+from gp_immo.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('accounts/', include('accounts.urls')),
+    path('api/v1/', include('immo.api')),
+    path('metrics', metrics_view, name='metrics'),
     path('', include('immo.urls')),
 ]
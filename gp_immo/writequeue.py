@@ -0,0 +1,117 @@
+"""
+Single-writer queue for SQLite.
+
+SQLite takes one write lock per database. With many request threads, each
+small write transaction queues on that lock and retries after its busy
+timeout, which is where the latency spikes and "database is locked" errors
+come from. With ``GP_IMMO_SQLITE_WRITE_QUEUE`` on, :func:`run` hands a write
+to one writer thread instead. The thread takes whatever is queued (up to
+``MAX_BATCH`` jobs), runs each job in a savepoint of a single transaction and
+commits once, so a burst of small writes costs one lock and one fsync. A
+failing job only rolls back its own savepoint.
+
+Without the setting, or inside a transaction of the caller (whose lock the
+queue would wait for), :func:`run` calls the function inline.
+"""
+import contextvars
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from . import db
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH = 64
+
+
+class WriteQueue:
+    def __init__(self, using=DEFAULT_DB_ALIAS, max_batch=MAX_BATCH):
+        self.using = using
+        self.max_batch = max_batch
+        self.jobs = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def submit(self, function, *args, **kwargs) -> Future:
+        future = Future()
+        # The job sees the caller's context variables (e.g. the replica pin).
+        context = contextvars.copy_context()
+        self.jobs.put((future, context, function, args, kwargs))
+        self._start()
+        return future
+
+    def run(self, function, *args, **kwargs):
+        return self.submit(function, *args, **kwargs).result()
+
+    def _start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._loop, name=f"sqlite-writer-{self.using}", daemon=True)
+                self.thread.start()
+
+    def _take(self):
+        batch = [self.jobs.get()]
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self.jobs.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            # The thread keeps its connection: reconnecting would redo the pragmas for every batch.
+            self._write(self._take())
+
+    def _write(self, batch):
+        results = []
+        try:
+            with transaction.atomic(using=self.using):
+                for future, context, function, args, kwargs in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        with transaction.atomic(using=self.using):
+                            results.append((future, context.run(function, *args, **kwargs), None))
+                    except Exception as exc:
+                        results.append((future, None, exc))
+        except Exception as exc:
+            logger.exception("Échec du lot d'écritures SQLite")
+            for future, *_ in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for future, result, exc in results:
+            if exc is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exc)
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_queue(using=DEFAULT_DB_ALIAS) -> WriteQueue:
+    with _queues_lock:
+        if using not in _queues:
+            _queues[using] = WriteQueue(using)
+        return _queues[using]
+
+
+def enabled() -> bool:
+    return getattr(settings, "GP_IMMO_SQLITE_WRITE_QUEUE", False)
+
+
+def run(function, *args, using=DEFAULT_DB_ALIAS, **kwargs):
+    """Run a small write through the writer thread when the queue is on, inline otherwise."""
+    if not enabled() or connections[using].in_atomic_block:
+        return function(*args, **kwargs)
+    result = get_queue(using).run(function, *args, **kwargs)
+    db.note_write()
+    return result
@@ -0,0 +1,212 @@
+"""
+Read-only JSON API (``/api/v1/``).
+
+Every endpoint is scoped to the requesting user like the HTML views, pages
+with the keyset cursors of ``immo.pagination``, trims its output with
+``?fields=`` and loads related rows up front, so a page costs the same
+handful of queries whatever its size. GET responses carry an ETag of their
+body and are answered with 304 when ``If-None-Match`` matches.
+
+``sync/`` serves the offline clients: the rows changed and deleted since
+the token of their previous call (see ``immo.sync``).
+"""
+import hashlib
+
+from django.db.models import Q
+from django.http import HttpResponseNotModified
+from django.urls import path
+from django.utils.http import quote_etag
+from rest_framework import viewsets
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.routers import DefaultRouter
+from rest_framework.views import APIView
+
+from . import sync
+from .models import Bien, BienMedia, Contract, InterventionReport, Message, Payment, PrestataireAssignment
+from .pagination import InvalidCursor, keyset_paginate
+from .serializers import (
+    BienMediaSerializer,
+    BienSerializer,
+    ContractSerializer,
+    InterventionReportSerializer,
+    MessageSerializer,
+    PaymentSerializer,
+    PrestataireAssignmentSerializer,
+    requested_fields,
+)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class KeysetPagination(BasePagination):
+    """``?cursor=`` / ``?page_size=`` pagination on the view's ``keyset_fields``."""
+
+    def paginate_queryset(self, queryset, request, view=None):
+        try:
+            page_size = min(int(request.query_params.get("page_size", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+        except ValueError:
+            page_size = DEFAULT_PAGE_SIZE
+        fields = getattr(view, "keyset_fields", ("created_at", "id"))
+        try:
+            self.page = keyset_paginate(queryset, request.query_params.get("cursor"), fields, max(page_size, 1))
+        except InvalidCursor:
+            raise NotFound("Curseur invalide.")
+        self.request = request
+        return self.page.items
+
+    def get_next_link(self):
+        if not self.page.has_next:
+            return None
+        params = self.request.query_params.copy()
+        params["cursor"] = self.page.next_cursor
+        return self.request.build_absolute_uri(f"{self.request.path}?{params.urlencode()}")
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+
+class ScopedViewSet(viewsets.ReadOnlyModelViewSet):
+    pagination_class = KeysetPagination
+    keyset_fields = ("created_at", "id")
+    select = ()
+    prefetch = {}
+
+    def scope(self, user):
+        raise NotImplementedError
+
+    def get_queryset(self):
+        queryset = self.scope(self.request.user).select_related(*self.select)
+        wanted = requested_fields(self.request)
+        for field, lookup in self.prefetch.items():
+            if not wanted or field in wanted:
+                queryset = queryset.prefetch_related(lookup)
+        return queryset
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method not in ("GET", "HEAD") or response.status_code != 200:
+            return response
+        response.render()
+        etag = quote_etag(hashlib.sha256(response.content).hexdigest()[:32])
+        if_none_match = request.headers.get("If-None-Match", "")
+        if etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+            response = HttpResponseNotModified()
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        response["Vary"] = "Accept, Cookie, Authorization"
+        return response
+
+
+def visible_biens(user):
+    if user.is_prestataire():
+        return Bien.objects.filter(prestataires__prestataire=user, prestataires__active=True).distinct()
+    return Bien.objects.filter(owner=user)
+
+
+def visible_contracts(user):
+    return Contract.objects.filter(owner=user)
+
+
+def visible_payments(user):
+    if user.is_prestataire():
+        return Payment.objects.filter(prestataire=user)
+    return Payment.objects.filter(Q(contract__owner=user) | Q(bien__owner=user))
+
+
+def visible_messages(user):
+    return Message.objects.filter(Q(sender=user) | Q(receiver=user))
+
+
+def visible_assignments(user):
+    if user.is_prestataire():
+        return PrestataireAssignment.objects.filter(prestataire=user)
+    return PrestataireAssignment.objects.filter(bien__owner=user)
+
+
+class BienViewSet(ScopedViewSet):
+    serializer_class = BienSerializer
+    prefetch = {"media": "media"}
+
+    def scope(self, user):
+        return visible_biens(user)
+
+
+class BienMediaViewSet(ScopedViewSet):
+    serializer_class = BienMediaSerializer
+    keyset_fields = ("uploaded_at", "id")
+
+    def scope(self, user):
+        return BienMedia.objects.filter(bien__in=visible_biens(user).values("pk"))
+
+
+class ContractViewSet(ScopedViewSet):
+    serializer_class = ContractSerializer
+    select = ("bien",)
+
+    def scope(self, user):
+        return visible_contracts(user)
+
+
+class PaymentViewSet(ScopedViewSet):
+    serializer_class = PaymentSerializer
+
+    def scope(self, user):
+        return visible_payments(user)
+
+
+class MessageViewSet(ScopedViewSet):
+    serializer_class = MessageSerializer
+
+    def scope(self, user):
+        return visible_messages(user)
+
+
+class InterventionReportViewSet(ScopedViewSet):
+    serializer_class = InterventionReportSerializer
+    select = ("bien",)
+
+    def scope(self, user):
+        return InterventionReport.objects.filter(Q(prestataire=user) | Q(bien__owner=user))
+
+
+class SyncView(APIView):
+    """``GET sync/?since=<token>``: changes and deletions since the previous call."""
+
+    sources = {
+        "biens": (visible_biens, BienSerializer),
+        "contrats": (visible_contracts, ContractSerializer),
+        "paiements": (visible_payments, PaymentSerializer),
+        "messages": (visible_messages, MessageSerializer),
+        "assignments": (visible_assignments, PrestataireAssignmentSerializer),
+    }
+
+    def get(self, request):
+        scopes = {name: scope(request.user) for name, (scope, _) in self.sources.items()}
+        scopes["biens"] = scopes["biens"].prefetch_related("media")
+        scopes["contrats"] = scopes["contrats"].select_related("bien")
+
+        def serialize(name, rows):
+            serializer_class = self.sources[name][1]
+            return serializer_class(rows, many=True, context={"request": request}).data
+
+        payload = sync.changes(request.user, request.query_params.get("since"), scopes, serialize)
+        response = Response(payload)
+        response["Cache-Control"] = "private, no-store"
+        return response
+
+
+router = DefaultRouter()
+router.register("biens", BienViewSet, basename="api-bien")
+router.register("medias", BienMediaViewSet, basename="api-media")
+router.register("contrats", ContractViewSet, basename="api-contrat")
+router.register("paiements", PaymentViewSet, basename="api-paiement")
+router.register("messages", MessageViewSet, basename="api-message")
+router.register("rapports", InterventionReportViewSet, basename="api-rapport")
+
+urlpatterns = [
+    path("sync/", SyncView.as_view(), name="api-sync"),
+    *router.urls,
+]
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ImmoConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'immo'
+
+    def ready(self):
+        from . import signals  # noqa: F401, WPS433
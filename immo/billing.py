@@ -0,0 +1,103 @@
+"""
+Recurring rent generation and overdue sweeping, both set-based so a run
+over every active contract stays in seconds.
+"""
+import datetime
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import dashboard, ledger
+from .ledger import month_bounds
+from .models import Contract, Payment
+
+CHUNK_SIZE = 2000
+
+
+def rent_due_date(contract_start, period):
+    # Rent falls due on the contract's anniversary day, capped to the month length.
+    start, end = month_bounds(period)
+    day = min(contract_start.day, end.day)
+    return max(start.replace(day=day), contract_start)
+
+
+def _billed(period_start, contract_ids) -> set:
+    return set(
+        Payment.objects.filter(
+            payment_type=Payment.PaymentType.LOYER, period=period_start, contract_id__in=contract_ids
+        ).values_list("contract_id", flat=True)
+    )
+
+
+def generate_rent(period, chunk_size=CHUNK_SIZE) -> int:
+    """
+    Create the PENDING LOYER payment of ``period`` for every ACTIVE contract
+    running during that month. Contracts already billed for the period are
+    skipped, and the (contract, period) constraint guards against concurrent
+    runs, so the job can be replayed safely. Returns the number actually
+    inserted.
+    """
+    start, end = month_bounds(period)
+    contracts = (
+        Contract.objects.filter(status=Contract.Status.ACTIVE, start_date__lte=end)
+        .filter(Q(end_date__isnull=True) | Q(end_date__gte=start))
+        .order_by("id")
+    )
+    created, owner_ids, last_id = 0, set(), 0
+    while True:
+        with transaction.atomic():
+            # Locking the chunk's contracts makes overlapping runs wait for each other.
+            chunk = list(
+                contracts.filter(id__gt=last_id)
+                .select_for_update()
+                .values_list("id", "bien_id", "owner_id", "rent", "start_date")[:chunk_size]
+            )
+            if not chunk:
+                break
+            last_id = chunk[-1][0]
+            contract_ids = [row[0] for row in chunk]
+            billed = _billed(start, contract_ids)
+            payments = [
+                Payment(
+                    contract_id=contract_id,
+                    bien_id=bien_id,
+                    amount=rent,
+                    due_date=rent_due_date(start_date, start),
+                    status=Payment.Status.PENDING,
+                    payment_type=Payment.PaymentType.LOYER,
+                    period=start,
+                )
+                for contract_id, bien_id, owner_id, rent, start_date in chunk
+                if contract_id not in billed
+            ]
+            if not payments:
+                continue
+            Payment.objects.bulk_create(payments, ignore_conflicts=True)
+            # ignore_conflicts hides the rows it skipped: count the contracts billed since.
+            new = _billed(start, contract_ids) - billed
+        created += len(new)
+        owner_ids.update(row[2] for row in chunk if row[0] in new)
+    if created:
+        # bulk_create skips the Payment signals: refresh what they maintain.
+        ledger.rebuild(months=[start])
+        dashboard.invalidate(owner_ids, "paiements")
+    return created
+
+
+def mark_overdue(today=None) -> int:
+    """Move PENDING payments past their due date to LATE in one UPDATE."""
+    today = today or datetime.date.today()
+    overdue = Payment.objects.filter(status=Payment.Status.PENDING, due_date__lt=today)
+    months = list(overdue.dates("due_date", "month"))
+    if not months:
+        return 0
+    owner_ids = set()
+    for contract_owner, bien_owner in overdue.values_list("contract__owner_id", "bien__owner_id").distinct():
+        owner_ids.update((contract_owner, bien_owner))
+    with transaction.atomic():
+        # update() skips auto_now: bump updated_at for the sync clients.
+        updated = overdue.update(status=Payment.Status.LATE, updated_at=timezone.now())
+        ledger.rebuild(months=months)
+    dashboard.invalidate(owner_ids, "paiements")
+    return updated
@@ -0,0 +1,68 @@
+"""
+Reference counts of the content-addressed media blobs (``immo.storage``).
+
+The file signals in ``immo.signals`` call :func:`retain` when a row starts
+pointing at a file and :func:`release` when it stops (update or delete). A
+blob is removed from disk once the transaction that dropped its last
+reference commits, while its row is locked. Files saved before the
+content-addressed storage have no count and are deleted with their only row.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import BienMedia, BienMediaVariant, InterventionReport, MediaBlob, Message, OwnerStatement
+from .storage import blob_digest, blob_storage
+
+FILE_FIELDS = {
+    BienMedia: ("file",),
+    BienMediaVariant: ("file",),
+    Message: ("attachment",),
+    InterventionReport: ("attachment",),
+    OwnerStatement: ("html", "pdf"),
+}
+
+
+def retain(name, count=1, content=None):
+    """
+    Count ``count`` more references to ``name``. ``content`` is the file that
+    was saved under it: if the blob lost its last reference and was deleted
+    since the storage found it on disk, it is written again.
+    """
+    digest = blob_digest(name)
+    if not digest:
+        return
+    blobs = MediaBlob.objects.filter(name=name)
+    if blobs.update(refcount=F("refcount") + count):
+        return
+    storage = blob_storage()
+    if not storage.exists(name):
+        if content is None:
+            raise FileNotFoundError(f"Blob absent : {name}")
+        content.seek(0)
+        storage.save(name, content)
+    try:
+        with transaction.atomic():
+            MediaBlob.objects.create(name=name, sha256=digest, size=storage.size(name), refcount=count)
+    except IntegrityError:
+        blobs.update(refcount=F("refcount") + count)
+
+
+def _delete_if_unreferenced(name):
+    with transaction.atomic():
+        # The row stays locked until the file is gone: a concurrent retain() either
+        # counts the reference first, or finds no row and no file and writes it again.
+        blob = MediaBlob.objects.select_for_update().filter(name=name, refcount__lte=0).first()
+        if blob is None:
+            return
+        blob.delete()
+        blob_storage().delete(name)
+
+
+def release(name):
+    if not name:
+        return
+    if not blob_digest(name):
+        transaction.on_commit(lambda: blob_storage().delete(name))
+        return
+    MediaBlob.objects.filter(name=name, refcount__gt=0).update(refcount=F("refcount") - 1)
+    transaction.on_commit(lambda: _delete_if_unreferenced(name))
@@ -0,0 +1,68 @@
+from django.db.models import F, Q
+
+from gp_immo import writequeue
+from . import realtime
+from .models import Conversation
+from .pagination import decode_cursor, keyset_filter, keyset_paginate
+
+PREVIEW_LENGTH = 140
+INBOX_ORDER = ("last_activity", "id")
+
+
+def preview(message) -> str:
+    text = " ".join((message.content or "").split())
+    if not text and message.attachment:
+        text = "Pièce jointe"
+    return text[:PREVIEW_LENGTH]
+
+
+def for_user(user):
+    return Conversation.objects.filter(Q(user_low=user) | Q(user_high=user))
+
+
+def inbox_page(user, cursor=None, per_page=30):
+    """
+    One page of the user's threads, most recent first. An OR of both sides of
+    the pair can use neither (user, last_activity, id) index, so each side is
+    read from its own index and cut to the page before they are merged.
+    """
+    sides = []
+    for side in ("user_low", "user_high"):
+        threads = Conversation.objects.filter(**{side: user}).order_by(*(f"-{name}" for name in INBOX_ORDER))
+        if cursor:
+            threads = threads.filter(keyset_filter(INBOX_ORDER, decode_cursor(cursor, Conversation, INBOX_ORDER)))
+        sides.append(threads.values("pk")[: per_page + 1])
+    threads = Conversation.objects.filter(Q(pk__in=sides[0]) | Q(pk__in=sides[1])).select_related("user_low", "user_high")
+    return keyset_paginate(threads, cursor, INBOX_ORDER, per_page)
+
+
+def thread_between(first_id, second_id, create=False):
+    low, high = Conversation.pair(first_id, second_id)
+    if create:
+        return Conversation.objects.get_or_create(user_low_id=low, user_high_id=high)[0]
+    return Conversation.objects.filter(user_low_id=low, user_high_id=high).first()
+
+
+def record_message(message):
+    """Move the thread to this message and count it unread for the receiver."""
+    changes = {
+        "last_message": message,
+        "last_message_preview": preview(message),
+        "last_activity": message.created_at,
+    }
+    thread = Conversation.objects.filter(pk=message.conversation_id)
+    if message.sender_id != message.receiver_id:
+        low, _ = Conversation.pair(message.sender_id, message.receiver_id)
+        unread_field = "unread_low" if message.receiver_id == low else "unread_high"
+        changes[unread_field] = F(unread_field) + 1
+    thread.update(**changes)
+
+
+def mark_read(user, other_id) -> int:
+    low, high = Conversation.pair(user.pk, other_id)
+    field = "unread_low" if user.pk == low else "unread_high"
+    unread = Conversation.objects.filter(user_low_id=low, user_high_id=high, **{f"{field}__gt": 0})
+    updated = writequeue.run(unread.update, **{field: 0})
+    if updated:
+        realtime.publish_read(user.pk, other_id)
+    return updated
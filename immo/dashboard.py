@@ -0,0 +1,103 @@
+"""
+Dashboard panels, one bounded query each, cached per user and panel.
+
+The signals in ``immo.signals`` call :func:`invalidate` with the users and
+panels a changed row appears in, so a warm dashboard costs no query at all.
+"""
+from django.core.cache import cache
+from django.db import transaction
+
+from gp_immo import metrics
+from .models import Bien, Contract, InterventionReport, Message, Payment, PrestataireAssignment
+
+PANEL_TIMEOUT = 60 * 15
+BIENS_LIMIT = 6
+RECENT_LIMIT = 5
+ASSIGNMENTS_LIMIT = 10
+MESSAGES_LIMIT = 6
+
+OWNER_PANELS = ("biens", "contrats", "paiements", "assignments", "last_messages")
+PRESTATAIRE_PANELS = ("missions", "rapports", "last_messages")
+
+
+def _biens(user):
+    return Bien.objects.filter(owner=user).order_by("-created_at", "-id")[:BIENS_LIMIT]
+
+
+def _contrats(user):
+    return Contract.objects.filter(owner=user).select_related("bien").order_by("-created_at")[:RECENT_LIMIT]
+
+
+def _paiements(user):
+    # Two indexed branches instead of an OR across two joins.
+    by_contract = Payment.objects.filter(contract__owner=user)
+    by_bien = Payment.objects.filter(bien__owner=user)
+    return by_contract.union(by_bien).order_by("-created_at")[:RECENT_LIMIT]
+
+
+def _assignments(user):
+    return (
+        PrestataireAssignment.objects.filter(bien__owner=user, active=True)
+        .select_related("bien", "prestataire")
+        .order_by("-created_at")[:ASSIGNMENTS_LIMIT]
+    )
+
+
+def _missions(user):
+    return (
+        PrestataireAssignment.objects.filter(prestataire=user, active=True)
+        .select_related("bien__owner")
+        .order_by("-created_at")[:ASSIGNMENTS_LIMIT]
+    )
+
+
+def _rapports(user):
+    return (
+        InterventionReport.objects.filter(prestataire=user)
+        .select_related("bien")
+        .order_by("-created_at")[:RECENT_LIMIT]
+    )
+
+
+def _last_messages(user):
+    sent = Message.objects.filter(sender=user).order_by().values_list("id", "created_at")
+    received = Message.objects.filter(receiver=user).order_by().values_list("id", "created_at")
+    latest = sent.union(received).order_by("-created_at")[:MESSAGES_LIMIT]
+    ids = [message_id for message_id, _ in latest]
+    return Message.objects.filter(id__in=ids).select_related("sender", "receiver").order_by("-created_at")
+
+
+PANELS = {
+    "biens": _biens,
+    "contrats": _contrats,
+    "paiements": _paiements,
+    "assignments": _assignments,
+    "missions": _missions,
+    "rapports": _rapports,
+    "last_messages": _last_messages,
+}
+
+
+def panel_key(user_id, name) -> str:
+    return f"dashboard:{user_id}:{name}"
+
+
+def panels(user) -> dict:
+    names = OWNER_PANELS if user.is_proprietaire() else PRESTATAIRE_PANELS
+    keys = {panel_key(user.pk, name): name for name in names}
+    cached = cache.get_many(keys)
+    result = {keys[key]: value for key, value in cached.items()}
+    missing = {}
+    for key, name in keys.items():
+        if name not in result:
+            result[name] = missing[key] = list(PANELS[name](user))
+    metrics.record_cache("dashboard", hits=len(cached), misses=len(missing))
+    if missing:
+        cache.set_many(missing, PANEL_TIMEOUT)
+    return result
+
+
+def invalidate(user_ids, *names):
+    keys = [panel_key(user_id, name) for user_id in set(user_ids) if user_id for name in names]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
@@ -1,13 +1,29 @@
 from django import forms
 
 from accounts.models import User
-from .models import Bien, BienMedia, Contract, InterventionReport, Message, Payment, PrestataireAssignment
+from .models import (
+    Bien,
+    BienMedia,
+    Contract,
+    InterventionReport,
+    Message,
+    Payment,
+    PrestataireAssignment,
+    UploadSession,
+)
 
 
 class MultiFileInput(forms.ClearableFileInput):
     allow_multiple_selected = True
 
 
+class MultipleFileField(forms.FileField):
+    def clean(self, data, initial=None):
+        if isinstance(data, (list, tuple)):
+            return [super(MultipleFileField, self).clean(item, initial) for item in data] or super().clean(None, initial)
+        return super().clean(data, initial)
+
+
 class BienForm(forms.ModelForm):
     class Meta:
         model = Bien
@@ -18,8 +34,87 @@ class BienForm(forms.ModelForm):
             "furnished",
             "price",
             "address",
+            "latitude",
+            "longitude",
             "description",
         ]
+        help_texts = {
+            "latitude": "Optionnel : déduite de l'adresse si un répertoire de lieux est configuré.",
+        }
+
+    def clean(self):
+        cleaned = super().clean()
+        latitude, longitude = cleaned.get("latitude"), cleaned.get("longitude")
+        if (latitude is None) != (longitude is None):
+            raise forms.ValidationError("Renseignez la latitude et la longitude ensemble.")
+        if latitude is not None and not -90 <= latitude <= 90:
+            self.add_error("latitude", "Latitude hors limites.")
+        if longitude is not None and not -180 <= longitude <= 180:
+            self.add_error("longitude", "Longitude hors limites.")
+        return cleaned
+
+
+class BienImportForm(forms.Form):
+    file = forms.FileField(
+        label="Fichier",
+        help_text="CSV (séparateur , ou ;) ou XLSX, une ligne d'en-tête avec les noms de colonnes de l'export.",
+        widget=forms.ClearableFileInput(attrs={"accept": ".csv,.xlsx"}),
+    )
+
+    def clean_file(self):
+        uploaded = self.cleaned_data["file"]
+        if not uploaded.name.lower().endswith((".csv", ".txt", ".xlsx", ".xlsm")):
+            raise forms.ValidationError("Format attendu : CSV ou XLSX.")
+        return uploaded
+
+
+class BienSearchForm(forms.Form):
+    FURNISHED_CHOICES = [("", "Indifférent"), ("1", "Meublé"), ("0", "Non meublé")]
+
+    q = forms.CharField(
+        label="Recherche",
+        required=False,
+        max_length=200,
+        widget=forms.TextInput(attrs={"type": "search", "placeholder": "Titre, quartier, description..."}),
+    )
+    property_type = forms.ChoiceField(label="Type", required=False)
+    listing_status = forms.ChoiceField(label="Statut", required=False)
+    furnished = forms.TypedChoiceField(
+        label="Ameublement",
+        required=False,
+        choices=FURNISHED_CHOICES,
+        coerce=lambda value: value == "1",
+        empty_value=None,
+    )
+    price_min = forms.DecimalField(label="Prix min", required=False, min_value=0, max_digits=12, decimal_places=2)
+    price_max = forms.DecimalField(label="Prix max", required=False, min_value=0, max_digits=12, decimal_places=2)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.apply_facets({})
+
+    def clean(self):
+        cleaned = super().clean()
+        price_min, price_max = cleaned.get("price_min"), cleaned.get("price_max")
+        if price_min is not None and price_max is not None and price_min > price_max:
+            raise forms.ValidationError("Le prix minimum dépasse le prix maximum.")
+        return cleaned
+
+    def apply_facets(self, facets):
+        def with_count(name, value, label):
+            if name not in facets:
+                return label
+            return f"{label} ({facets[name].get(value, 0)})"
+
+        self.fields["property_type"].choices = [("", "Tous les types")] + [
+            (value, with_count("property_type", value, label)) for value, label in Bien.PropertyType.choices
+        ]
+        self.fields["listing_status"].choices = [("", "Tous les statuts")] + [
+            (value, with_count("listing_status", value, label)) for value, label in Bien.ListingStatus.choices
+        ]
+        self.fields["furnished"].choices = [self.FURNISHED_CHOICES[0]] + [
+            (value, with_count("furnished", value == "1", label)) for value, label in self.FURNISHED_CHOICES[1:]
+        ]
 
 
 class PrestataireAssignmentForm(forms.ModelForm):
@@ -54,6 +149,17 @@ class MessageForm(forms.ModelForm):
         }
 
 
+class UploadSessionForm(forms.Form):
+    target = forms.ChoiceField(choices=UploadSession.Target.choices)
+    bien = forms.IntegerField(required=False)
+    receiver = forms.IntegerField(required=False)
+    filename = forms.CharField(max_length=255)
+    size = forms.IntegerField(min_value=1)
+    content_type = forms.CharField(max_length=100, required=False)
+    chunk_size = forms.IntegerField(required=False, min_value=1)
+    sha256 = forms.RegexField(regex=r"^[0-9a-fA-F]{64}$", required=False)
+
+
 class InterventionReportForm(forms.ModelForm):
     class Meta:
         model = InterventionReport
@@ -61,7 +167,7 @@ class InterventionReportForm(forms.ModelForm):
 
 
 class BienMediaUploadForm(forms.Form):
-    files = forms.FileField(
+    files = MultipleFileField(
         label="Photos/Videos",
         widget=MultiFileInput(attrs={"multiple": True}),
         help_text="Jusqu'a 10 fichiers (images ou videos).",
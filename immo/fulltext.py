@@ -0,0 +1,175 @@
+"""
+Accent-insensitive full-text index over Bien.title, description and address.
+
+SQLite uses an FTS5 table (unicode61 tokenizer with diacritics removed),
+PostgreSQL a tsvector table with a GIN index built with the ``fr_unaccent``
+configuration (unaccent + french stemming). Both tables are created by
+migration 0005 and kept in sync by the Bien signals in ``immo.signals``.
+"""
+import re
+
+from django.db import connection, connections
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+SNIPPET_START = "\x02"
+SNIPPET_END = "\x03"
+MAX_TERMS = 8
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def query_terms(query: str):
+    return _WORD.findall(query or "")[:MAX_TERMS]
+
+
+def render_snippet(raw: str):
+    if not raw:
+        return ""
+    html = escape(raw).replace(SNIPPET_START, "<mark>").replace(SNIPPET_END, "</mark>")
+    return mark_safe(html)
+
+
+class SQLiteBackend:
+    table = "immo_bien_fts"
+
+    def index(self, biens):
+        rows = [(b.pk, b.title, b.description, b.address) for b in biens]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {self.table} WHERE rowid = %s", [(row[0],) for row in rows])
+            cursor.executemany(
+                f"INSERT INTO {self.table} (rowid, title, description, address) VALUES (%s, %s, %s, %s)",
+                rows,
+            )
+
+    def remove(self, ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {self.table} WHERE rowid = %s", [(pk,) for pk in ids])
+
+    def rebuild(self) -> int:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+            cursor.execute(
+                f"INSERT INTO {self.table} (rowid, title, description, address) "
+                "SELECT id, title, description, address FROM immo_bien"
+            )
+            cursor.execute(f"INSERT INTO {self.table} ({self.table}) VALUES ('optimize')")
+            cursor.execute(f"SELECT count(*) FROM {self.table}")
+            return cursor.fetchone()[0]
+
+    def match(self, terms, scope, limit, using):
+        # Every term must match; the last one is a prefix so results show up while typing.
+        expression = " ".join(f'"{term}"' for term in terms[:-1])
+        expression = f'{expression} "{terms[-1]}"*'.strip()
+        params = [SNIPPET_START, SNIPPET_END, expression]
+        sql = (
+            f"SELECT rowid, bm25({self.table}, 5.0, 1.0, 2.0) AS score, "
+            f"snippet({self.table}, -1, %s, %s, '…', 16) "
+            f"FROM {self.table} WHERE {self.table} MATCH %s"
+        )
+        if scope:
+            sql += f" AND rowid IN ({scope[0]})"
+            params.extend(scope[1])
+        with connections[using].cursor() as cursor:
+            cursor.execute(f"{sql} ORDER BY score LIMIT %s", [*params, limit])
+            return cursor.fetchall()
+
+
+class PostgresBackend:
+    table = "immo_bien_search"
+    config = "fr_unaccent"
+
+    def _document_sql(self):
+        return (
+            f"setweight(to_tsvector('{self.config}', coalesce(%s, '')), 'A') || "
+            f"setweight(to_tsvector('{self.config}', coalesce(%s, '')), 'B') || "
+            f"setweight(to_tsvector('{self.config}', coalesce(%s, '')), 'C')"
+        )
+
+    def index(self, biens):
+        rows = [(b.pk, b.title, b.address, b.description) for b in biens]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {self.table} (bien_id, document) VALUES (%s, {self._document_sql()}) "
+                "ON CONFLICT (bien_id) DO UPDATE SET document = EXCLUDED.document",
+                rows,
+            )
+
+    def remove(self, ids):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE bien_id = ANY(%s)", [list(ids)])
+
+    def rebuild(self) -> int:
+        document = self._document_sql() % ("b.title", "b.address", "b.description")
+        with connection.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {self.table}")
+            cursor.execute(f"INSERT INTO {self.table} (bien_id, document) SELECT b.id, {document} FROM immo_bien b")
+            return cursor.rowcount
+
+    def match(self, terms, scope, limit, using):
+        expression = " & ".join(f"{term}:*" for term in terms)
+        options = f"StartSel={SNIPPET_START}, StopSel={SNIPPET_END}, MaxWords=24, MinWords=8, MaxFragments=1"
+        params = [options, expression]
+        sql = (
+            f"SELECT s.bien_id, ts_rank(s.document, q.query) AS score, "
+            f"ts_headline('{self.config}', b.title || ' — ' || b.address || ' — ' || b.description, q.query, %s) "
+            f"FROM {self.table} s JOIN immo_bien b ON b.id = s.bien_id, "
+            f"to_tsquery('{self.config}', %s) AS q(query) "
+            "WHERE s.document @@ q.query"
+        )
+        if scope:
+            sql += f" AND s.bien_id IN ({scope[0]})"
+            params.extend(scope[1])
+        with connections[using].cursor() as cursor:
+            cursor.execute(f"{sql} ORDER BY score DESC LIMIT %s", [*params, limit])
+            return cursor.fetchall()
+
+
+_BACKENDS = {"sqlite": SQLiteBackend, "postgresql": PostgresBackend}
+
+
+def get_backend():
+    backend = _BACKENDS.get(connection.vendor)
+    return backend() if backend else None
+
+
+def index_biens(biens):
+    backend = get_backend()
+    if backend:
+        backend.index(biens)
+
+
+def remove_biens(ids):
+    backend = get_backend()
+    if backend:
+        backend.remove(ids)
+
+
+def search(query, queryset, limit=50):
+    """
+    Ranked Bien instances from ``queryset`` matching ``query``, each with
+    ``search_rank`` and an HTML-safe ``search_snippet`` attribute.
+    """
+    terms = query_terms(query)
+    backend = get_backend()
+    if not terms or backend is None:
+        return []
+    # Match and load from the same database (a replica when routed to one).
+    queryset = queryset.using(queryset.db)
+    # An unfiltered queryset needs no scoping subquery (public listings).
+    scope = queryset.order_by().values("pk").query.sql_with_params() if queryset.query.where else None
+    rows = backend.match(terms, scope, limit, queryset.db)
+    biens = queryset.in_bulk([row[0] for row in rows])
+    results = []
+    for pk, rank, snippet in rows:
+        bien = biens.get(pk)
+        if bien is None:
+            continue
+        bien.search_rank = rank
+        bien.search_snippet = render_snippet(snippet)
+        results.append(bien)
+    return results
@@ -0,0 +1,196 @@
+"""
+Geohash spatial index for biens.
+
+Each located Bien stores the geohash of its coordinates. A viewport is
+covered by a handful of geohash cells whose prefixes become indexed range
+scans (``geohash >= cell AND geohash < cell + "~"``), so map queries never
+scan the whole table.
+"""
+import csv
+import math
+import unicodedata
+from functools import lru_cache
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils.module_loading import import_string
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 12
+MAX_COVER_CELLS = 16
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+
+def encode(latitude: float, longitude: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        value, interval = (longitude, lng_range) if even else (latitude, lat_range)
+        middle = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+
+def valid_coordinates(latitude, longitude) -> bool:
+    return (
+        math.isfinite(latitude) and math.isfinite(longitude) and -90 <= latitude <= 90 and -180 <= longitude <= 180
+    )
+
+
+def cell_size(precision: int):
+    """(height, width) in degrees of a geohash cell."""
+    total_bits = 5 * precision
+    lng_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+
+def _cell_steps(south, west, north, east, precision):
+    height, width = cell_size(precision)
+    rows = math.floor((north + 90) / height) - math.floor((south + 90) / height) + 1
+    cols = math.floor((east + 180) / width) - math.floor((west + 180) / width) + 1
+    return rows, cols, height, width
+
+
+def cover(south, west, north, east, max_cells=MAX_COVER_CELLS):
+    """
+    Geohash cells covering the bounding box, at the finest precision that
+    needs no more than ``max_cells`` cells. Viewports that fall in the same
+    cells share the same cover, which is what makes them cacheable.
+    """
+    if not all(map(math.isfinite, (south, west, north, east))) or south > north or west > east:
+        raise ValueError("Boîte englobante invalide.")
+    # Clamped to the globe, so even the coarsest cover stays a few cells.
+    south, north = max(south, -90.0), min(north, 90.0)
+    west, east = max(west, -180.0), min(east, 180.0)
+    precision = 1
+    for candidate in range(1, GEOHASH_PRECISION + 1):
+        rows, cols, _, _ = _cell_steps(south, west, north, east, candidate)
+        if rows * cols > max_cells:
+            break
+        precision = candidate
+    rows, cols, height, width = _cell_steps(south, west, north, east, precision)
+    first_lat = (math.floor((south + 90) / height) + 0.5) * height - 90
+    first_lng = (math.floor((west + 180) / width) + 0.5) * width - 180
+    cells = set()
+    for row in range(rows):
+        for col in range(cols):
+            lat = min(first_lat + row * height, 90.0)
+            lng = min(first_lng + col * width, 180.0)
+            cells.add(encode(lat, lng, precision))
+    return sorted(cells)
+
+
+def cells_filter(cells) -> Q:
+    condition = Q()
+    for cell in cells:
+        condition |= Q(geohash__gte=cell, geohash__lt=f"{cell}~")
+    return condition
+
+
+def haversine_km(lat1, lng1, lat2, lng2) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def in_cells(queryset, cells):
+    return queryset.filter(cells_filter(cells))
+
+
+def within_bbox(queryset, south, west, north, east):
+    return in_cells(queryset, cover(south, west, north, east)).filter(
+        latitude__gte=south,
+        latitude__lte=north,
+        longitude__gte=west,
+        longitude__lte=east,
+    )
+
+
+def within_radius(queryset, latitude, longitude, radius_km, limit=200):
+    """
+    Biens within ``radius_km``, nearest first, each with a ``distance_km``
+    attribute. The database orders candidates on an equirectangular
+    approximation; the exact great-circle distance is applied afterwards.
+    """
+    d_lat = radius_km / KM_PER_DEGREE
+    lng_scale = max(math.cos(math.radians(latitude)), 1e-6)
+    d_lng = d_lat / lng_scale
+    candidates = (
+        within_bbox(queryset, latitude - d_lat, longitude - d_lng, latitude + d_lat, longitude + d_lng)
+        .annotate(
+            distance_sq=(F("latitude") - latitude) * (F("latitude") - latitude)
+            + (F("longitude") - longitude) * (F("longitude") - longitude) * (lng_scale * lng_scale)
+        )
+        .filter(distance_sq__lte=(d_lat * 1.01) ** 2)
+        .order_by("distance_sq")[:limit]
+    )
+    results = []
+    for bien in candidates:
+        bien.distance_km = haversine_km(latitude, longitude, bien.latitude, bien.longitude)
+        if bien.distance_km <= radius_km:
+            results.append(bien)
+    return results
+
+
+def normalize_place(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join("".join(ch if ch.isalnum() else " " for ch in stripped.lower()).split())
+
+
+@lru_cache(maxsize=1)
+def load_gazetteer(path):
+    """
+    Gazetteer CSV with ``name,latitude,longitude`` columns (one place per
+    line, e.g. neighbourhoods and towns). Returns {normalized name: (lat, lng)}.
+    """
+    places = {}
+    with open(path, newline="", encoding="utf-8") as handle:
+        for row in csv.DictReader(handle):
+            try:
+                places[normalize_place(row["name"])] = (float(row["latitude"]), float(row["longitude"]))
+            except (KeyError, TypeError, ValueError):
+                continue
+    return places
+
+
+def gazetteer_geocode(address: str):
+    """
+    Offline geocoder: the most specific gazetteer place named in the address
+    (longest run of words first, e.g. "akwa nord" before "akwa").
+    """
+    path = getattr(settings, "GP_IMMO_GAZETTEER_PATH", None)
+    if not path or not address:
+        return None
+    try:
+        places = load_gazetteer(str(path))
+    except FileNotFoundError:
+        return None
+    words = normalize_place(address).split()
+    for size in range(min(4, len(words)), 0, -1):
+        for start in range(len(words) - size + 1):
+            coordinates = places.get(" ".join(words[start:start + size]))
+            if coordinates:
+                return coordinates
+    return None
+
+
+def geocode(address: str):
+    geocoder = getattr(settings, "GP_IMMO_GEOCODER", None)
+    if not geocoder:
+        return None
+    return import_string(geocoder)(address)
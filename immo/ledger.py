@@ -0,0 +1,143 @@
+"""
+Materialized payment ledger.
+
+Every Payment contributes its amount to one LedgerEntry slice
+(owner, bien, month of due_date, payment_type, status). Signals move the
+amount between slices as payments change; :func:`rebuild` recomputes a
+part of the ledger from the payments when it may have drifted (bulk
+updates, restores).
+"""
+import calendar
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+
+from .models import Bien, Contract, LedgerEntry, Payment
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def month_bounds(day):
+    start = month_start(day)
+    return start, start.replace(day=calendar.monthrange(start.year, start.month)[1])
+
+
+def payment_slice(payment):
+    """The ledger slice of a payment, or None when no bien/owner can be resolved."""
+    bien_id = payment.bien_id
+    if bien_id is None and payment.contract_id:
+        bien_id = Contract.objects.filter(pk=payment.contract_id).values_list("bien_id", flat=True).first()
+    if bien_id is None or payment.due_date is None:
+        return None
+    owner_id = Bien.objects.filter(pk=bien_id).values_list("owner_id", flat=True).first()
+    if owner_id is None:
+        return None
+    return {
+        "owner_id": owner_id,
+        "bien_id": bien_id,
+        "month": month_start(payment.due_date),
+        "payment_type": payment.payment_type,
+        "status": payment.status,
+    }
+
+
+def apply(slice_, amount, count):
+    if slice_ is None:
+        return
+    entries = LedgerEntry.objects.filter(**slice_)
+    updated = entries.update(total=F("total") + amount, count=F("count") + count)
+    if updated:
+        if count < 0:
+            entries.filter(count__lte=0).delete()
+        return
+    if count < 0:
+        # The slice is already gone (e.g. its bien is being deleted).
+        return
+    try:
+        with transaction.atomic():
+            LedgerEntry.objects.create(total=amount, count=count, **slice_)
+    except IntegrityError:
+        entries.update(total=F("total") + amount, count=F("count") + count)
+
+
+def payment_rows(payments):
+    """Ledger slices aggregated from a Payment queryset."""
+    return (
+        payments.annotate(
+            ledger_bien=Coalesce("bien_id", "contract__bien_id"),
+            ledger_owner=Coalesce("bien__owner_id", "contract__bien__owner_id"),
+            ledger_month=TruncMonth("due_date"),
+        )
+        .filter(ledger_bien__isnull=False, ledger_owner__isnull=False)
+        .order_by()
+        .values("ledger_owner", "ledger_bien", "ledger_month", "payment_type", "status")
+        .annotate(total=Sum("amount"), count=Count("id"))
+    )
+
+
+def rebuild(owner_ids=None, months=None, batch_size=1000) -> int:
+    """
+    Recompute the ledger, or only the given owners and/or months. Returns
+    the number of slices written.
+    """
+    entries = LedgerEntry.objects.all()
+    payments = Payment.objects.all()
+    if owner_ids is not None:
+        owner_ids = list(owner_ids)
+        entries = entries.filter(owner_id__in=owner_ids)
+        payments = payments.annotate(
+            scope_owner=Coalesce("bien__owner_id", "contract__bien__owner_id")
+        ).filter(scope_owner__in=owner_ids)
+    if months is not None:
+        months = sorted({month_start(month) for month in months})
+        entries = entries.filter(month__in=months)
+        in_months = Q()
+        for month in months:
+            start, end = month_bounds(month)
+            in_months |= Q(due_date__gte=start, due_date__lte=end)
+        payments = payments.filter(in_months)
+    with transaction.atomic():
+        entries.delete()
+        rows = [
+            LedgerEntry(
+                owner_id=row["ledger_owner"],
+                bien_id=row["ledger_bien"],
+                month=row["ledger_month"],
+                payment_type=row["payment_type"],
+                status=row["status"],
+                total=row["total"],
+                count=row["count"],
+            )
+            for row in payment_rows(payments).iterator()
+        ]
+        LedgerEntry.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+def year_entries(owner, year):
+    return LedgerEntry.objects.filter(owner=owner, month__year=year)
+
+
+def rent_roll(owner, year):
+    """
+    Rent (LOYER) per bien and month for one year, plus totals per payment
+    type and status, read from the ledger only.
+    """
+    statuses = [value for value, _ in Payment.Status.choices]
+    rows, totals = {}, {}
+    entries = year_entries(owner, year).select_related("bien").order_by("bien__title", "bien_id", "month")
+    for entry in entries:
+        type_totals = totals.setdefault(entry.payment_type, dict.fromkeys(statuses, 0))
+        type_totals[entry.status] += entry.total
+        if entry.payment_type != Payment.PaymentType.LOYER:
+            continue
+        row = rows.setdefault(entry.bien_id, {"bien": entry.bien, "months": [dict.fromkeys(statuses, 0) for _ in range(12)]})
+        row["months"][entry.month.month - 1][entry.status] += entry.total
+    labels = dict(Payment.PaymentType.choices)
+    return {
+        "rows": list(rows.values()),
+        "totals": [(labels.get(payment_type, payment_type), values) for payment_type, values in totals.items()],
+    }
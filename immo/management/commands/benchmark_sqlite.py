@@ -0,0 +1,108 @@
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections, transaction
+
+from gp_immo.writequeue import WriteQueue
+
+
+def _write(alias, thread_id, value):
+    # Read then write, like sending a message (conversation lookup, insert, counter update).
+    with connections[alias].cursor() as cursor:
+        cursor.execute("SELECT total FROM bench_counter WHERE id = 1")
+        cursor.execute("INSERT INTO bench_event (thread, value) VALUES (%s, %s)", [thread_id, value])
+        cursor.execute("UPDATE bench_counter SET total = total + 1 WHERE id = 1")
+
+
+def _read(alias):
+    with connections[alias].cursor() as cursor:
+        cursor.execute("SELECT count(*) FROM bench_event")
+        return cursor.fetchone()[0]
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure le débit d'écritures SQLite concurrentes : configuration d'origine, mode production "
+        "(WAL, BEGIN IMMEDIATE) et mode production avec file d'écriture, sur des bases temporaires."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--operations", type=int, default=200, help="Écritures par thread.")
+        parser.add_argument("--reads", type=int, default=2, help="Lectures par écriture.")
+
+    def handle(self, *args, **options):
+        scenarios = [
+            ("origine", {}, False),
+            ("production", settings.GP_IMMO_SQLITE_PRODUCTION_OPTIONS, False),
+            ("production + file", settings.GP_IMMO_SQLITE_PRODUCTION_OPTIONS, True),
+        ]
+        self.stdout.write(
+            f"{options['threads']} threads × {options['operations']} écritures, {options['reads']} lectures par écriture"
+        )
+        self.stdout.write(f"{'configuration':<20}{'écritures/s':>12}{'échecs':>8}{'p50 ms':>9}{'p99 ms':>9}")
+        with tempfile.TemporaryDirectory() as directory:
+            for name, db_options, queued in scenarios:
+                path = os.path.join(directory, f"{name.replace(' ', '')}.sqlite3")
+                result = self.run_scenario(path, db_options, queued, options)
+                self.stdout.write(
+                    f"{name:<20}{result['throughput']:>12.0f}{result['errors']:>8}"
+                    f"{result['p50']:>9.1f}{result['p99']:>9.1f}"
+                )
+
+    def run_scenario(self, path, db_options, queued, options):
+        alias = f"benchmark_{os.path.basename(path).split('.')[0]}"
+        database = {"ENGINE": "django.db.backends.sqlite3", "NAME": path, "OPTIONS": dict(db_options)}
+        connections.settings[alias] = connections.configure_settings({"default": database})["default"]
+        with connections[alias].cursor() as cursor:
+            cursor.execute("CREATE TABLE bench_counter (id INTEGER PRIMARY KEY, total INTEGER NOT NULL)")
+            cursor.execute("CREATE TABLE bench_event (id INTEGER PRIMARY KEY, thread INTEGER, value INTEGER)")
+            cursor.execute("INSERT INTO bench_counter (id, total) VALUES (1, 0)")
+        writer = WriteQueue(using=alias) if queued else None
+        latencies, errors = [], []
+        lock = threading.Lock()
+
+        def worker(thread_id):
+            own_latencies, own_errors = [], 0
+            try:
+                for value in range(options["operations"]):
+                    for _ in range(options["reads"]):
+                        _read(alias)
+                    started = time.perf_counter()
+                    try:
+                        if writer is not None:
+                            writer.run(_write, alias, thread_id, value)
+                        else:
+                            with transaction.atomic(using=alias):
+                                _write(alias, thread_id, value)
+                    except OperationalError:
+                        own_errors += 1
+                        continue
+                    own_latencies.append(time.perf_counter() - started)
+            finally:
+                connections[alias].close()
+            with lock:
+                latencies.extend(own_latencies)
+                errors.append(own_errors)
+
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(options["threads"])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        connections[alias].close()
+        del connections.settings[alias]
+        latencies.sort()
+        return {
+            "throughput": len(latencies) / elapsed,
+            "errors": sum(errors),
+            "p50": statistics.median(latencies) * 1000 if latencies else 0,
+            "p99": latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0,
+        }
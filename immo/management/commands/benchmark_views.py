@@ -0,0 +1,160 @@
+import datetime
+import json
+import statistics
+import subprocess
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+
+from immo import synthetic
+from immo.synthetic import PAGES
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def current_commit():
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure les pages principales (tableau de bord, biens, marketplace, messagerie, paiement) sur une base de "
+        "test remplie par generate_data à plusieurs échelles : nombre de requêtes SQL (plafonds de immo.synthetic.PAGES, "
+        "vérifiés aussi par manage.py test) et latences. Écrit les résultats en JSON et les compare à une référence."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scales", nargs="+", choices=sorted(synthetic.SCALES), default=["small", "medium"])
+        parser.add_argument("--iterations", type=int, default=50)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Fichier JSON des résultats.")
+        parser.add_argument("--compare", help="Fichier JSON de référence (un --output précédent).")
+        parser.add_argument("--tolerance", type=float, default=0.25, help="Hausse de p95 tolérée (0.25 = 25 %%).")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["compare"]:
+            try:
+                with open(options["compare"], encoding="utf-8") as handle:
+                    baseline = json.load(handle)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"Référence illisible : {exc}")
+        report = {
+            "date": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "commit": current_commit(),
+            "iterations": options["iterations"],
+            "seed": options["seed"],
+            "results": {},
+        }
+        old_name = connection.settings_dict["NAME"]
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            DEBUG=False, MEDIA_ROOT=media_root, GP_IMMO_DB_REPLICAS=[], GP_IMMO_SQLITE_WRITE_QUEUE=False
+        ):
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                for scale in options["scales"]:
+                    report["results"][scale] = self.run_scale(scale, options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+        failures = [
+            f"{scale}/{page} : {result['queries']} requêtes SQL (plafond {PAGES[page][2]})"
+            for scale, pages in report["results"].items()
+            for page, result in pages.items()
+            if result["queries"] > PAGES[page][2]
+        ]
+        if baseline is not None:
+            failures += self.compare(baseline, report, options["tolerance"])
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as handle:
+                json.dump(report, handle, indent=2)
+                handle.write("\n")
+        if failures:
+            raise CommandError("Régressions :\n" + "\n".join(failures))
+        self.stdout.write(self.style.SUCCESS("Aucune régression."))
+
+    def run_scale(self, scale, options):
+        call_command("flush", interactive=False, verbosity=0)
+        started = time.perf_counter()
+        synthetic.generate(scale, seed=options["seed"], prefix="bench")
+        self.stdout.write(f"\nÉchelle {scale} (données créées en {time.perf_counter() - started:.1f} s)")
+        self.stdout.write(f"{'page':<24}{'requêtes':>9}{'à froid ms':>12}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+        users = synthetic.sample_users("bench")
+        results = {}
+        for page, (user_key, url, _) in PAGES.items():
+            results[page] = self.measure(users[user_key], url.format(partner=users["partner"]), options["iterations"])
+            result = results[page]
+            self.stdout.write(
+                f"{page:<24}{result['queries']:>9}{result['cold_ms']:>12.1f}"
+                f"{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}{result['p99_ms']:>9.1f}"
+            )
+        return results
+
+    def measure(self, user, url, iterations):
+        client = Client()
+        client.force_login(user)
+        cache.clear()
+        timings, counts = [], []
+        for _ in range(iterations + 1):
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                started = time.perf_counter()
+                response = client.get(url)
+                elapsed = (time.perf_counter() - started) * 1000
+            if response.status_code != 200:
+                raise CommandError(f"{url} : statut {response.status_code}.")
+            timings.append(elapsed)
+            counts.append(counter.count)
+        warm = timings[1:] or timings
+        return {
+            "url": url,
+            "queries": max(counts),
+            "warm_queries": max(counts[1:] or counts),
+            "cold_ms": round(timings[0], 2),
+            "p50_ms": round(statistics.median(warm), 2),
+            "p95_ms": round(percentile(warm, 0.95), 2),
+            "p99_ms": round(percentile(warm, 0.99), 2),
+        }
+
+    def compare(self, baseline, report, tolerance):
+        regressions = []
+        self.stdout.write(f"\nComparaison avec {baseline.get('commit') or 'la référence'} ({baseline.get('date', '?')})")
+        for scale, pages in report["results"].items():
+            for page, result in pages.items():
+                before = baseline.get("results", {}).get(scale, {}).get(page)
+                if not before:
+                    continue
+                change = result["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0
+                self.stdout.write(
+                    f"{scale + '/' + page:<32}requêtes {before['queries']:>3} → {result['queries']:<3}"
+                    f"p95 {before['p95_ms']:>7.1f} → {result['p95_ms']:>7.1f} ms ({change:+.0%})"
+                )
+                if result["queries"] > before["queries"]:
+                    regressions.append(f"{scale}/{page} : {before['queries']} → {result['queries']} requêtes SQL")
+                if change > tolerance:
+                    regressions.append(f"{scale}/{page} : p95 {before['p95_ms']} → {result['p95_ms']} ms ({change:+.0%})")
+        return regressions
@@ -0,0 +1,25 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from immo import media
+from immo.models import BienMedia
+
+
+class Command(BaseCommand):
+    help = "Génère les variantes redimensionnées (WebP/JPEG) des images de biens."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Régénère aussi les images qui ont déjà des variantes.")
+        parser.add_argument("--workers", type=int, default=None)
+
+    def handle(self, *args, **options):
+        images = BienMedia.objects.filter(media_kind=BienMedia.MediaKind.IMAGE)
+        if not options["all"]:
+            images = images.filter(variants__isnull=True)
+        ids = list(images.order_by("id").values_list("id", flat=True).distinct())
+        stored = 0
+        with ProcessPoolExecutor(max_workers=options["workers"]) as pool:
+            for media_id in ids:
+                stored += media.build_variants(media_id, pool)
+        self.stdout.write(self.style.SUCCESS(f"{len(ids)} images traitées, {stored} variantes enregistrées."))
@@ -0,0 +1,24 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from immo import statements
+
+
+class Command(BaseCommand):
+    help = "Génère les relevés mensuels (HTML, et PDF si WeasyPrint est installé) de tous les propriétaires."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--month", help="Mois AAAA-MM (par défaut : le mois précédent).")
+        parser.add_argument("--workers", type=int, default=None)
+        parser.add_argument("--force", action="store_true", help="Régénère aussi les relevés inchangés.")
+
+    def handle(self, *args, **options):
+        month = statements.previous_month()
+        if options["month"]:
+            try:
+                month = datetime.date.fromisoformat(f"{options['month']}-01")
+            except ValueError:
+                raise CommandError("Mois attendu au format AAAA-MM.")
+        rendered, skipped = statements.generate(month, workers=options["workers"], force=options["force"])
+        self.stdout.write(self.style.SUCCESS(f"{rendered} relevés générés, {skipped} inchangés ({month:%m/%Y})."))
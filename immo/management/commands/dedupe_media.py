@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from immo import blobs
+from immo.storage import BLOB_PREFIX, blob_storage
+
+
+class Command(BaseCommand):
+    help = "Déplace les fichiers enregistrés avant le stockage dédupliqué vers les blobs adressés par contenu."
+
+    def handle(self, *args, **options):
+        storage = blob_storage()
+        moved = missing = 0
+        for model, field in ((model, field) for model, fields in blobs.FILE_FIELDS.items() for field in fields):
+            legacy = (
+                model.objects.exclude(**{field: ""})
+                .exclude(**{f"{field}__isnull": True})
+                .exclude(**{f"{field}__startswith": BLOB_PREFIX})
+                .values_list("pk", field)
+            )
+            for pk, name in legacy.iterator():
+                if not storage.exists(name):
+                    missing += 1
+                    continue
+                with storage.open(name, "rb") as handle:
+                    blob = storage.save(name, handle)
+                with transaction.atomic():
+                    changes = {field: blob}
+                    if any(f.name == "updated_at" for f in model._meta.concrete_fields):
+                        changes["updated_at"] = timezone.now()
+                    model.objects.filter(pk=pk).update(**changes)
+                    blobs.retain(blob)
+                storage.delete(name)
+                moved += 1
+        self.stdout.write(self.style.SUCCESS(f"{moved} fichiers dédupliqués, {missing} introuvables."))
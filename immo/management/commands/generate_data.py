@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from immo import synthetic
+
+
+class Command(BaseCommand):
+    help = (
+        "Crée un jeu de données fictif et reproductible (propriétaires, prestataires, biens, médias, contrats, "
+        f"paiements, messages, rapports). Mot de passe des comptes : {synthetic.PASSWORD}"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", choices=sorted(synthetic.SCALES), default="small")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--prefix", default="demo", help="Préfixe des noms d'utilisateur.")
+
+    def handle(self, *args, **options):
+        if synthetic.exists(options["prefix"]):
+            raise CommandError(f"Des comptes « {options['prefix']}-… » existent déjà : choisissez un autre --prefix.")
+        started = time.perf_counter()
+        counts = synthetic.generate(options["scale"], seed=options["seed"], prefix=options["prefix"])
+        for name, count in counts.items():
+            self.stdout.write(f"{name:<15}{count:>10}")
+        self.stdout.write(self.style.SUCCESS(f"Données « {options['scale']} » créées en {time.perf_counter() - started:.1f} s."))
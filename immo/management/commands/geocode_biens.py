@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from immo import geo
+from immo.models import Bien
+
+
+class Command(BaseCommand):
+    help = "Renseigne les coordonnées des biens sans latitude/longitude à partir de leur adresse."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        pending = Bien.objects.filter(latitude__isnull=True).exclude(address="").only("id", "address")
+        located, last_id = 0, 0
+        now = timezone.now()
+        while True:
+            chunk = list(pending.filter(id__gt=last_id).order_by("id")[:batch_size])
+            if not chunk:
+                break
+            last_id = chunk[-1].id
+            found = []
+            for bien in chunk:
+                coordinates = geo.geocode(bien.address)
+                if coordinates:
+                    bien.latitude, bien.longitude = coordinates
+                    bien.geohash = geo.encode(*coordinates)
+                    bien.updated_at = now
+                    found.append(bien)
+            Bien.objects.bulk_update(found, ["latitude", "longitude", "geohash", "updated_at"])
+            located += len(found)
+        self.stdout.write(self.style.SUCCESS(f"{located} biens géolocalisés."))
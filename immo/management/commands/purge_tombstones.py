@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from immo import sync
+
+
+class Command(BaseCommand):
+    help = "Supprime les traces de suppression plus anciennes que la durée de validité des jetons de synchronisation."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=sync.TOMBSTONE_RETENTION.days)
+
+    def handle(self, *args, **options):
+        count = sync.purge_tombstones(timedelta(days=options["days"]))
+        self.stdout.write(self.style.SUCCESS(f"{count} traces supprimées."))
@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from immo import uploads
+
+
+class Command(BaseCommand):
+    help = "Supprime les téléversements inachevés inactifs et leurs fichiers partiels."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=int, default=24)
+
+    def handle(self, *args, **options):
+        count = uploads.purge(timedelta(hours=options["hours"]))
+        self.stdout.write(self.style.SUCCESS(f"{count} téléversements supprimés."))
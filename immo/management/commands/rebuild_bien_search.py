@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from immo import fulltext
+
+
+class Command(BaseCommand):
+    help = "Reconstruit l'index plein texte des biens (titre, description, adresse)."
+
+    def handle(self, *args, **options):
+        backend = fulltext.get_backend()
+        if backend is None:
+            raise CommandError("Aucun index plein texte pour cette base de données.")
+        total = backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"{total} biens indexés."))
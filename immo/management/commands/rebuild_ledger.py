@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from immo import ledger
+
+
+class Command(BaseCommand):
+    help = "Recalcule le grand livre des paiements (totaux par propriétaire, bien, mois, type et statut)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--owner", type=int, action="append", dest="owners", help="Limiter à un propriétaire (id).")
+
+    def handle(self, *args, **options):
+        total = ledger.rebuild(owner_ids=options["owners"])
+        self.stdout.write(self.style.SUCCESS(f"{total} lignes de grand livre recalculées."))
@@ -0,0 +1,39 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from immo import billing
+
+
+def parse_month(value):
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m").date()
+    except ValueError as exc:
+        raise CommandError("Mois attendu au format AAAA-MM.") from exc
+
+
+class Command(BaseCommand):
+    help = "Génère les loyers du mois pour les contrats actifs et passe les paiements échus en retard."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--period", help="Mois à facturer (AAAA-MM), par défaut le mois courant.")
+        parser.add_argument("--today", help="Date de référence des retards (AAAA-MM-JJ).")
+        parser.add_argument("--chunk-size", type=int, default=billing.CHUNK_SIZE)
+        parser.add_argument("--skip-rent", action="store_true")
+        parser.add_argument("--skip-overdue", action="store_true")
+
+    def handle(self, *args, **options):
+        today = datetime.date.today()
+        if options["today"]:
+            try:
+                today = datetime.date.fromisoformat(options["today"])
+            except ValueError as exc:
+                raise CommandError("Date attendue au format AAAA-MM-JJ.") from exc
+        period = parse_month(options["period"]) if options["period"] else today.replace(day=1)
+        if not options["skip_rent"]:
+            created = billing.generate_rent(period, chunk_size=options["chunk_size"])
+            self.stdout.write(f"{created} loyers créés pour {period:%Y-%m}.")
+        if not options["skip_overdue"]:
+            late = billing.mark_overdue(today)
+            self.stdout.write(f"{late} paiements passés en retard.")
+        self.stdout.write(self.style.SUCCESS("Facturation terminée."))
@@ -0,0 +1,31 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = "Copie la base SQLite principale vers les réplicas SQLite (développement local des réplicas de lecture)."
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES[DEFAULT_DB_ALIAS]
+        replicas = getattr(settings, "GP_IMMO_DB_REPLICAS", [])
+        if not replicas:
+            raise CommandError("Aucun réplica configuré (GP_IMMO_SQLITE_REPLICA).")
+        if primary["ENGINE"] != "django.db.backends.sqlite3":
+            raise CommandError("Seules les bases SQLite sont copiées ; ailleurs, utilisez la réplication du serveur.")
+        for alias in replicas:
+            replica = settings.DATABASES[alias]
+            if replica["ENGINE"] != primary["ENGINE"]:
+                raise CommandError(f"Le réplica {alias} n'est pas une base SQLite.")
+            connections[alias].close()
+            # Online backup API: consistent copy while the primary keeps serving writes.
+            source = sqlite3.connect(str(primary["NAME"]))
+            target = sqlite3.connect(str(replica["NAME"]))
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+            self.stdout.write(self.style.SUCCESS(f"{alias} : copie de {primary['NAME']} terminée."))
@@ -0,0 +1,98 @@
+"""
+Prestataire marketplace search, and the caches of the public pages that
+list prestataires.
+
+Search results (per normalized query and cursor), the home page showcase
+and the anonymous home page are cached under a version number kept in the
+shared cache. ``immo.signals`` calls :func:`invalidate` when a prestataire's
+visibility, specializations or profile change, which bumps the version and
+orphans every entry at once.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from accounts import taxonomy
+from accounts.models import User
+from accounts.text import normalize
+from gp_immo import metrics
+from .pagination import keyset_paginate
+
+PRESTATAIRES_PER_PAGE = 24
+SHOWCASE_SIZE = 4
+VERSION_KEY = "immo:prestataires:version"
+SEARCH_TIMEOUT = 10 * 60
+PAGE_TIMEOUT = 10 * 60
+
+
+def version() -> int:
+    current = cache.get(VERSION_KEY)
+    if current is None:
+        # Start from the clock, not 0, so entries of an evicted version never come back.
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        current = cache.get(VERSION_KEY)
+    return current
+
+
+def _bump():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, time.time_ns(), None)
+
+
+def invalidate():
+    transaction.on_commit(_bump)
+
+
+def cached(name, key, compute, timeout=SEARCH_TIMEOUT):
+    """``compute()`` cached under the current version."""
+    key = f"immo:prestataires:{version()}:{name}:{key}"
+    value = cache.get(key)
+    metrics.record_cache(name, hits=value is not None, misses=value is None)
+    if value is None:
+        value = compute()
+        cache.set(key, value, timeout)
+    return value
+
+
+def visible_prestataires():
+    return User.objects.filter(role=User.Role.PRESTATAIRE, marketplace_visible=True)
+
+
+def search_prestataires(query="", cursor=None, per_page=PRESTATAIRES_PER_PAGE):
+    """
+    Visible prestataires whose username starts with the query or who hold a
+    matching specialization, ordered by (search_name, id) and paginated on
+    that key so each page is a range scan of ``user_marketplace_idx``.
+    """
+    prestataires = visible_prestataires()
+    needle = normalize(query)
+    if needle:
+        condition = Q(search_name__gte=needle, search_name__lt=f"{needle}\uffff")
+        specialization_ids = taxonomy.match(query)
+        if specialization_ids:
+            holders = User.specializations.through.objects.filter(
+                specialization_id__in=specialization_ids
+            ).values("user_id")
+            condition |= Q(id__in=holders)
+        prestataires = prestataires.filter(condition)
+    return keyset_paginate(
+        prestataires,
+        cursor=cursor,
+        fields=("search_name", "id"),
+        per_page=per_page,
+        descending=False,
+    )
+
+
+def cached_search(query="", cursor=None, per_page=PRESTATAIRES_PER_PAGE):
+    key = f"{per_page}:{cursor or ''}:{normalize(query)}"
+    return cached("marketplace", key, lambda: search_prestataires(query, cursor=cursor, per_page=per_page))
+
+
+def showcase():
+    """The prestataires shown on the home page."""
+    return cached("showcase", SHOWCASE_SIZE, lambda: list(visible_prestataires()[:SHOWCASE_SIZE]))
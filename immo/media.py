@@ -0,0 +1,170 @@
+"""
+Responsive variants of BienMedia images.
+
+Once an upload is committed, :func:`schedule` hands the media id to a small
+thread pool. The thread reads the original and sends the bytes to a process
+pool, which resizes and re-encodes them with Pillow. The thread then stores
+the variants and records them as ``BienMediaVariant`` rows, so the request
+itself never touches Pillow. Every variant is EXIF-transposed and written
+without metadata.
+"""
+import io
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.db.models import Min
+
+from . import blobs
+from .models import BienMedia, BienMediaVariant
+
+logger = logging.getLogger(__name__)
+
+WIDTHS = (320, 640, 1280)
+FORMATS = (BienMediaVariant.Format.WEBP, BienMediaVariant.Format.JPEG)
+QUALITY = 80
+EXTENSIONS = {BienMediaVariant.Format.WEBP: "webp", BienMediaVariant.Format.JPEG: "jpg"}
+
+
+def _flatten(image):
+    from PIL import Image
+
+    if image.mode == "RGB":
+        return image
+    background = Image.new("RGB", image.size, (255, 255, 255))
+    background.paste(image, mask=image.getchannel("A") if "A" in image.getbands() else None)
+    return background
+
+
+def render_variants(data: bytes, widths=WIDTHS, formats=FORMATS, quality=QUALITY):
+    """
+    Runs in a worker process. Returns the oriented size of the original and a
+    list of ``(width, height, format, encoded bytes)``. Nothing is upscaled:
+    widths above the original collapse into one variant at the original width.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if image.mode in ("LA", "P", "PA") else "RGB")
+        original_width, original_height = image.size
+        variants = []
+        for width in sorted({min(width, original_width) for width in widths}):
+            height = max(1, round(original_height * width / original_width))
+            resized = image if width == original_width else image.resize((width, height), Image.LANCZOS)
+            for image_format in formats:
+                frame = resized if image_format == BienMediaVariant.Format.WEBP else _flatten(resized)
+                buffer = io.BytesIO()
+                frame.save(buffer, image_format, quality=quality, optimize=True)
+                variants.append((width, height, image_format, buffer.getvalue()))
+    return (original_width, original_height), variants
+
+
+def _workers():
+    return getattr(settings, "GP_IMMO_MEDIA_WORKERS", 2)
+
+
+@lru_cache(maxsize=1)
+def _process_pool():
+    return ProcessPoolExecutor(max_workers=_workers())
+
+
+@lru_cache(maxsize=1)
+def _dispatcher():
+    return ThreadPoolExecutor(max_workers=_workers(), thread_name_prefix="bien-media")
+
+
+def variant_name(media, width, image_format):
+    return f"biens/{media.bien_id}/variants/{media.pk}_{width}.{EXTENSIONS[image_format]}"
+
+
+def build_variants(media_id, pool=None):
+    """Create the variants of one image; returns how many were stored."""
+    media = BienMedia.objects.filter(pk=media_id, media_kind=BienMedia.MediaKind.IMAGE).first()
+    if media is None:
+        return 0
+    with media.file.open("rb") as handle:
+        data = handle.read()
+    try:
+        if pool is None:
+            (width, height), variants = render_variants(data)
+        else:
+            (width, height), variants = pool.submit(render_variants, data).result()
+    except Exception:
+        # Not decodable by Pillow (e.g. HEIC): keep serving the original.
+        logger.warning("Variantes impossibles pour le média %s", media_id, exc_info=True)
+        return 0
+    storage = media.file.storage
+    rows = []
+    for variant_width, variant_height, image_format, content in variants:
+        name = variant_name(media, variant_width, image_format)
+        rows.append(
+            BienMediaVariant(
+                media=media,
+                file=storage.save(name, ContentFile(content)),
+                format=image_format,
+                width=variant_width,
+                height=variant_height,
+                size=len(content),
+            )
+        )
+    with transaction.atomic():
+        media.variants.all().delete()
+        # bulk_create skips the file signals, so count the references here.
+        BienMediaVariant.objects.bulk_create(rows)
+        for row in rows:
+            blobs.retain(row.file.name)
+        BienMedia.objects.filter(pk=media.pk).update(width=width, height=height)
+    return len(rows)
+
+
+def _run(media_id):
+    close_old_connections()
+    try:
+        build_variants(media_id, _process_pool())
+    except Exception:
+        logger.exception("Échec du traitement du média %s", media_id)
+    finally:
+        close_old_connections()
+
+
+def schedule(media):
+    """Queue variant generation once the upload is committed."""
+    if media.media_kind != BienMedia.MediaKind.IMAGE:
+        return
+    if not _workers():
+        transaction.on_commit(lambda: build_variants(media.pk))
+        return
+    transaction.on_commit(lambda: _dispatcher().submit(_run, media.pk))
+
+
+def best_variant(media, width, image_format=BienMediaVariant.Format.JPEG):
+    """Smallest variant at least ``width`` wide, else the largest one (uses prefetched variants)."""
+    candidates = sorted(
+        (variant for variant in media.variants.all() if variant.format == image_format),
+        key=lambda variant: variant.width,
+    )
+    for variant in candidates:
+        if variant.width >= width:
+            return variant
+    return candidates[-1] if candidates else None
+
+
+def attach_covers(biens):
+    """Set ``bien.cover`` to the first image of each bien, variants prefetched."""
+    biens = list(biens)
+    first_ids = (
+        BienMedia.objects.filter(bien__in=[bien.pk for bien in biens], media_kind=BienMedia.MediaKind.IMAGE)
+        .order_by()
+        .values("bien_id")
+        .annotate(first_id=Min("id"))
+        .values("first_id")
+    )
+    covers = {media.bien_id: media for media in BienMedia.objects.filter(pk__in=first_ids).prefetch_related("variants")}
+    for bien in biens:
+        bien.cover = covers.get(bien.pk)
+    return biens
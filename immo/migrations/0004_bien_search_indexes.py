@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('immo', '0003_bienmedia'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bien',
+            index=models.Index(fields=['owner', '-created_at', '-id'], name='bien_owner_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bien',
+            index=models.Index(fields=['owner', 'property_type', 'listing_status', 'furnished', 'price'], name='bien_owner_facets_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bien',
+            index=models.Index(fields=['-created_at', '-id'], name='bien_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bien',
+            index=models.Index(fields=['listing_status', 'property_type', 'furnished', 'price'], name='bien_public_facets_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+from django.db import migrations
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS immo_bien_fts USING fts5("
+    "title, description, address, tokenize = 'unicode61 remove_diacritics 2')",
+    "INSERT INTO immo_bien_fts (rowid, title, description, address) "
+    "SELECT id, title, description, address FROM immo_bien",
+]
+SQLITE_BACKWARD = ["DROP TABLE IF EXISTS immo_bien_fts"]
+
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    "DO $$ BEGIN "
+    "IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'fr_unaccent') THEN "
+    "CREATE TEXT SEARCH CONFIGURATION fr_unaccent (COPY = french); "
+    "ALTER TEXT SEARCH CONFIGURATION fr_unaccent "
+    "ALTER MAPPING FOR hword, hword_part, word WITH unaccent, french_stem; "
+    "END IF; END $$",
+    "CREATE TABLE IF NOT EXISTS immo_bien_search ("
+    "bien_id bigint PRIMARY KEY REFERENCES immo_bien (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+    "document tsvector NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS immo_bien_search_document_idx ON immo_bien_search USING GIN (document)",
+    "INSERT INTO immo_bien_search (bien_id, document) SELECT id, "
+    "setweight(to_tsvector('fr_unaccent', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('fr_unaccent', coalesce(address, '')), 'B') || "
+    "setweight(to_tsvector('fr_unaccent', coalesce(description, '')), 'C') "
+    "FROM immo_bien ON CONFLICT (bien_id) DO NOTHING",
+]
+POSTGRES_BACKWARD = ["DROP TABLE IF EXISTS immo_bien_search"]
+
+
+def _run(statements):
+    def operation(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('immo', '0004_bien_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({"sqlite": SQLITE_FORWARD, "postgresql": POSTGRES_FORWARD}),
+            _run({"sqlite": SQLITE_BACKWARD, "postgresql": POSTGRES_BACKWARD}),
+        ),
+    ]
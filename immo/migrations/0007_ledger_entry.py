@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+
+
+def populate_ledger(apps, schema_editor):
+    Payment = apps.get_model('immo', 'Payment')
+    LedgerEntry = apps.get_model('immo', 'LedgerEntry')
+    rows = (
+        Payment.objects.annotate(
+            ledger_bien=Coalesce('bien_id', 'contract__bien_id'),
+            ledger_owner=Coalesce('bien__owner_id', 'contract__bien__owner_id'),
+            ledger_month=TruncMonth('due_date'),
+        )
+        .filter(ledger_bien__isnull=False, ledger_owner__isnull=False)
+        .order_by()
+        .values('ledger_owner', 'ledger_bien', 'ledger_month', 'payment_type', 'status')
+        .annotate(total=Sum('amount'), count=Count('id'))
+    )
+    LedgerEntry.objects.bulk_create(
+        [
+            LedgerEntry(
+                owner_id=row['ledger_owner'],
+                bien_id=row['ledger_bien'],
+                month=row['ledger_month'],
+                payment_type=row['payment_type'],
+                status=row['status'],
+                total=row['total'],
+                count=row['count'],
+            )
+            for row in rows
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('immo', '0006_bien_coordinates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('payment_type', models.CharField(choices=[('LOYER', 'Loyer'), ('RESERVATION', 'Réservation'), ('PRESTATAIRE', 'Prestataire')], max_length=20)),
+                ('status', models.CharField(choices=[('PENDING', 'En attente'), ('PAID', 'Payé'), ('LATE', 'Retard')], max_length=20)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('count', models.IntegerField(default=0)),
+                ('bien', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='immo.bien')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('owner', 'month', 'bien', 'payment_type', 'status'), name='ledger_entry_unique_slice')],
+            },
+        ),
+        migrations.RunPython(populate_ledger, migrations.RunPython.noop),
+    ]
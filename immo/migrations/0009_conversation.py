@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:36
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_conversations(apps, schema_editor):
+    Message = apps.get_model("immo", "Message")
+    Conversation = apps.get_model("immo", "Conversation")
+    latest = {}
+    messages = Message.objects.order_by("created_at", "id").values_list(
+        "id", "sender_id", "receiver_id", "content", "attachment", "created_at"
+    )
+    for message_id, sender_id, receiver_id, content, attachment, created_at in messages.iterator():
+        pair = (min(sender_id, receiver_id), max(sender_id, receiver_id))
+        text = " ".join((content or "").split()) or ("Pièce jointe" if attachment else "")
+        latest[pair] = (message_id, text[:140], created_at)
+    Conversation.objects.bulk_create(
+        [
+            Conversation(
+                user_low_id=low,
+                user_high_id=high,
+                last_message_id=message_id,
+                last_message_preview=text,
+                last_activity=created_at,
+            )
+            for (low, high), (message_id, text, created_at) in latest.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('immo', '0008_rent_billing'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_message_preview', models.CharField(blank=True, max_length=140)),
+                ('last_activity', models.DateTimeField(default=django.utils.timezone.now)),
+                ('unread_low', models.PositiveIntegerField(default=0)),
+                ('unread_high', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='immo.message')),
+                ('user_high', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user_low', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_low', '-last_activity', '-id'], name='conversation_low_recent_idx'), models.Index(fields=['user_high', '-last_activity', '-id'], name='conversation_high_recent_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user_low', 'user_high'), name='conversation_unique_pair')],
+            },
+        ),
+        migrations.RunPython(populate_conversations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def link_messages(apps, schema_editor):
+    Message = apps.get_model("immo", "Message")
+    Conversation = apps.get_model("immo", "Conversation")
+    for thread_id, low, high in Conversation.objects.values_list("id", "user_low_id", "user_high_id").iterator():
+        Message.objects.filter(
+            Q(sender_id=low, receiver_id=high) | Q(sender_id=high, receiver_id=low)
+        ).update(conversation_id=thread_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('immo', '0009_conversation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='conversation',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='immo.conversation'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', '-created_at', '-id'], name='message_thread_recent_idx'),
+        ),
+        migrations.RunPython(link_messages, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:41
+
+import mimetypes
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def detect_media_kind(apps, schema_editor):
+    BienMedia = apps.get_model("immo", "BienMedia")
+    for kind, prefix in (("IMAGE", "image/"), ("VIDEO", "video/")):
+        ids = [
+            pk
+            for pk, name in BienMedia.objects.values_list("id", "file").iterator()
+            if (mimetypes.guess_type(name or "")[0] or "").startswith(prefix)
+        ]
+        BienMedia.objects.filter(id__in=ids).update(media_kind=kind)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('immo', '0010_message_conversation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bienmedia',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='bienmedia',
+            name='media_kind',
+            field=models.CharField(choices=[('IMAGE', 'Image'), ('VIDEO', 'Vidéo'), ('AUTRE', 'Autre')], default='AUTRE', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='bienmedia',
+            name='size',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='bienmedia',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='BienMediaVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.FileField(max_length=255, upload_to='')),
+                ('format', models.CharField(choices=[('WEBP', 'WebP'), ('JPEG', 'JPEG')], max_length=4)),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('size', models.PositiveIntegerField()),
+                ('media', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='immo.bienmedia')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('media', 'format', 'width'), name='media_variant_unique')],
+            },
+        ),
+        migrations.RunPython(detect_media_kind, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:45
+
+import immo.models
+import immo.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('immo', '0012_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('sha256', models.CharField(db_index=True, max_length=64)),
+                ('size', models.PositiveBigIntegerField()),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='bienmedia',
+            name='file',
+            field=models.FileField(storage=immo.storage.blob_storage, upload_to=immo.models.bien_media_upload_to),
+        ),
+        migrations.AlterField(
+            model_name='bienmediavariant',
+            name='file',
+            field=models.FileField(max_length=255, storage=immo.storage.blob_storage, upload_to=''),
+        ),
+        migrations.AlterField(
+            model_name='interventionreport',
+            name='attachment',
+            field=models.FileField(blank=True, null=True, storage=immo.storage.blob_storage, upload_to=immo.models.report_upload_to),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='attachment',
+            field=models.FileField(blank=True, null=True, storage=immo.storage.blob_storage, upload_to=immo.models.message_upload_to),
+        ),
+    ]
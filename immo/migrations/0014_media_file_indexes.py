@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:46
+
+import immo.models
+import immo.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('immo', '0013_media_blobs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bienmedia',
+            name='file',
+            field=models.FileField(db_index=True, storage=immo.storage.blob_storage, upload_to=immo.models.bien_media_upload_to),
+        ),
+        migrations.AlterField(
+            model_name='bienmediavariant',
+            name='file',
+            field=models.FileField(db_index=True, max_length=255, storage=immo.storage.blob_storage, upload_to=''),
+        ),
+        migrations.AlterField(
+            model_name='interventionreport',
+            name='attachment',
+            field=models.FileField(blank=True, db_index=True, null=True, storage=immo.storage.blob_storage, upload_to=immo.models.report_upload_to),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='attachment',
+            field=models.FileField(blank=True, db_index=True, null=True, storage=immo.storage.blob_storage, upload_to=immo.models.message_upload_to),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:55
+
+import django.db.models.deletion
+import immo.storage
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('immo', '0015_sync_tracking'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OwnerStatement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('content_hash', models.CharField(max_length=64)),
+                ('html', models.FileField(db_index=True, storage=immo.storage.blob_storage, upload_to='releves/')),
+                ('pdf', models.FileField(blank=True, db_index=True, storage=immo.storage.blob_storage, upload_to='releves/')),
+                ('generated_at', models.DateTimeField(auto_now=True)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='releves', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-month'],
+                'constraints': [models.UniqueConstraint(fields=('owner', 'month'), name='statement_owner_month_unique')],
+            },
+        ),
+    ]
@@ -1,7 +1,13 @@
+import mimetypes
+import uuid
+
 from django.conf import settings
 from django.db import models
 from django.utils import timezone
 
+from . import geo
+from .storage import blob_storage
+
 
 class Bien(models.Model):
     class PropertyType(models.TextChoices):
@@ -35,7 +41,33 @@ class Bien(models.Model):
     price = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
     address = models.CharField(max_length=255, blank=True)
     description = models.TextField(blank=True)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    geohash = models.CharField(max_length=12, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["owner", "-created_at", "-id"], name="bien_owner_recent_idx"),
+            models.Index(
+                fields=["owner", "property_type", "listing_status", "furnished", "price"],
+                name="bien_owner_facets_idx",
+            ),
+            models.Index(fields=["-created_at", "-id"], name="bien_recent_idx"),
+            models.Index(
+                fields=["listing_status", "property_type", "furnished", "price"],
+                name="bien_public_facets_idx",
+            ),
+            models.Index(fields=["geohash"], name="bien_geohash_idx"),
+        ]
+
+    def has_coordinates(self) -> bool:
+        return self.latitude is not None and self.longitude is not None
+
+    def save(self, *args, **kwargs):
+        self.geohash = geo.encode(self.latitude, self.longitude) if self.has_coordinates() else ""
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.title} ({self.get_listing_status_display()})"
@@ -46,9 +78,18 @@ def bien_media_upload_to(instance, filename):
     return f"biens/{instance.bien_id}/{timestamp}_{filename}"
 
 
+def detect_media_kind(name, content_type=None):
+    content_type = content_type or mimetypes.guess_type(name or "")[0] or ""
+    if content_type.startswith("image/"):
+        return BienMedia.MediaKind.IMAGE
+    if content_type.startswith("video/"):
+        return BienMedia.MediaKind.VIDEO
+    return BienMedia.MediaKind.AUTRE
+
+
 class BienMedia(models.Model):
     bien = models.ForeignKey(Bien, on_delete=models.CASCADE, related_name="media")
-    file = models.FileField(upload_to=bien_media_upload_to)
+    file = models.FileField(upload_to=bien_media_upload_to, storage=blob_storage, db_index=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     class MediaKind(models.TextChoices):
@@ -56,20 +97,48 @@ class BienMedia(models.Model):
         VIDEO = "VIDEO", "Vidéo"
         AUTRE = "AUTRE", "Autre"
 
+    media_kind = models.CharField(max_length=10, choices=MediaKind.choices, default=MediaKind.AUTRE)
+    size = models.PositiveBigIntegerField(null=True, blank=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+
     def kind(self):
-        content_type = getattr(self.file, "file", None)
-        if content_type and hasattr(content_type, "content_type"):
-            ct = content_type.content_type
-            if ct.startswith("image/"):
-                return self.MediaKind.IMAGE
-            if ct.startswith("video/"):
-                return self.MediaKind.VIDEO
-        return self.MediaKind.AUTRE
+        return self.media_kind
+
+    def save(self, *args, **kwargs):
+        upload = getattr(self.file, "file", None) if self._state.adding else None
+        if upload is not None:
+            self.media_kind = detect_media_kind(self.file.name, getattr(upload, "content_type", None))
+            self.size = self.file.size
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Media {self.bien} - {self.file.name}"
 
 
+class BienMediaVariant(models.Model):
+    """Resized, re-encoded copy of a BienMedia image (see ``immo.media``)."""
+
+    class Format(models.TextChoices):
+        WEBP = "WEBP", "WebP"
+        JPEG = "JPEG", "JPEG"
+
+    media = models.ForeignKey(BienMedia, on_delete=models.CASCADE, related_name="variants")
+    file = models.FileField(max_length=255, storage=blob_storage, db_index=True)
+    format = models.CharField(max_length=4, choices=Format.choices)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    size = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["media", "format", "width"], name="media_variant_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.media} {self.width}px {self.format}"
+
+
 class PrestataireAssignment(models.Model):
     bien = models.ForeignKey(Bien, on_delete=models.CASCADE, related_name="prestataires")
     prestataire = models.ForeignKey(
@@ -79,6 +148,7 @@ class PrestataireAssignment(models.Model):
     )
     active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         unique_together = ("bien", "prestataire")
@@ -105,6 +175,12 @@ class Contract(models.Model):
     rent = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(max_length=20, choices=Status.choices, default=Status.DRAFT)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "start_date"], name="contract_status_start_idx"),
+        ]
 
     def __str__(self):
         return f"Contrat {self.tenant_name} - {self.bien}"
@@ -134,7 +210,22 @@ class Payment(models.Model):
     due_date = models.DateField(default=timezone.now)
     status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
     payment_type = models.CharField(max_length=20, choices=PaymentType.choices)
+    # Month covered by a generated rent payment (first day of the month).
+    period = models.DateField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "due_date"], name="payment_status_due_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["contract", "period"],
+                condition=models.Q(payment_type="LOYER", period__isnull=False),
+                name="payment_unique_rent_period",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.payment_type} - {self.amount} €"
@@ -153,17 +244,71 @@ class Message(models.Model):
     sender = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="messages_envoyes")
     receiver = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="messages_recus")
     content = models.TextField(blank=True)
-    attachment = models.FileField(upload_to=message_upload_to, null=True, blank=True)
+    attachment = models.FileField(upload_to=message_upload_to, storage=blob_storage, null=True, blank=True, db_index=True)
     kind = models.CharField(max_length=10, choices=Kind.choices, default=Kind.TEXTE)
+    conversation = models.ForeignKey(
+        "Conversation",
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name="messages",
+        editable=False,
+    )
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["conversation", "-created_at", "-id"], name="message_thread_recent_idx"),
+        ]
 
     def __str__(self):
         return f"Message de {self.sender} à {self.receiver}"
 
 
+class Conversation(models.Model):
+    """
+    One thread per pair of users (``user_low`` has the smaller id). Every
+    Message points to its thread, which ``immo.conversations`` keeps up to
+    date each time a Message is created.
+    """
+
+    user_low = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+")
+    user_high = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+")
+    last_message = models.ForeignKey(Message, null=True, blank=True, on_delete=models.SET_NULL, related_name="+")
+    last_message_preview = models.CharField(max_length=140, blank=True)
+    last_activity = models.DateTimeField(default=timezone.now)
+    unread_low = models.PositiveIntegerField(default=0)
+    unread_high = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user_low", "user_high"], name="conversation_unique_pair"),
+        ]
+        indexes = [
+            models.Index(fields=["user_low", "-last_activity", "-id"], name="conversation_low_recent_idx"),
+            models.Index(fields=["user_high", "-last_activity", "-id"], name="conversation_high_recent_idx"),
+        ]
+
+    @staticmethod
+    def pair(first_id, second_id):
+        return (first_id, second_id) if first_id <= second_id else (second_id, first_id)
+
+    def other_id(self, user_id):
+        return self.user_high_id if user_id == self.user_low_id else self.user_low_id
+
+    def other(self, user):
+        return self.user_high if user.pk == self.user_low_id else self.user_low
+
+    def unread_for(self, user) -> int:
+        return self.unread_low if user.pk == self.user_low_id else self.unread_high
+
+    def __str__(self):
+        return f"Conversation {self.user_low_id} / {self.user_high_id}"
+
+
 def report_upload_to(instance, filename):
     return f"rapports/{instance.prestataire_id}/{timezone.now().strftime('%Y%m%d%H%M%S')}_{filename}"
 
@@ -176,8 +321,150 @@ class InterventionReport(models.Model):
         related_name="rapports_realises",
     )
     summary = models.TextField()
-    attachment = models.FileField(upload_to=report_upload_to, null=True, blank=True)
+    attachment = models.FileField(upload_to=report_upload_to, storage=blob_storage, null=True, blank=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"Rapport {self.bien} - {self.prestataire}"
+
+
+class LedgerEntry(models.Model):
+    """
+    Payment totals per owner, bien, month (of due_date), type and status,
+    maintained incrementally by ``immo.ledger`` from Payment signals.
+    """
+
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="ledger_entries",
+    )
+    bien = models.ForeignKey(Bien, on_delete=models.CASCADE, related_name="ledger_entries")
+    month = models.DateField()
+    payment_type = models.CharField(max_length=20, choices=Payment.PaymentType.choices)
+    status = models.CharField(max_length=20, choices=Payment.Status.choices)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["owner", "month", "bien", "payment_type", "status"],
+                name="ledger_entry_unique_slice",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.bien} {self.month:%Y-%m} {self.payment_type}/{self.status} : {self.total} €"
+
+
+class UploadSession(models.Model):
+    """
+    Resumable upload of one large file, received in fixed-size chunks and
+    finalized into a BienMedia or a Message attachment (see ``immo.uploads``).
+    """
+
+    class Target(models.TextChoices):
+        BIEN_MEDIA = "BIEN_MEDIA", "Média de bien"
+        MESSAGE = "MESSAGE", "Pièce jointe de message"
+
+    class Status(models.TextChoices):
+        EN_COURS = "EN_COURS", "En cours"
+        TERMINE = "TERMINE", "Terminé"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="upload_sessions")
+    target = models.CharField(max_length=20, choices=Target.choices)
+    bien = models.ForeignKey(Bien, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    receiver = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name="+"
+    )
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.EN_COURS)
+    media = models.ForeignKey(BienMedia, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    message = models.ForeignKey(Message, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "updated_at"], name="upload_status_updated_idx"),
+        ]
+
+    @property
+    def chunk_count(self) -> int:
+        return max(1, -(-self.size // self.chunk_size))
+
+    def chunk_length(self, index) -> int:
+        return min(self.chunk_size, self.size - index * self.chunk_size)
+
+    def __str__(self):
+        return f"Téléversement {self.filename} ({self.get_status_display()})"
+
+
+class UploadChunk(models.Model):
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name="chunks")
+    index = models.PositiveIntegerField()
+    size = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64)
+    received_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["session", "index"], name="upload_chunk_unique_index"),
+        ]
+
+
+class MediaBlob(models.Model):
+    """Reference count of a file of the content-addressed storage (``immo.storage``)."""
+
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField()
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount})"
+
+
+class Tombstone(models.Model):
+    """A deleted (or no longer visible) row, kept for the sync clients of ``user``."""
+
+    model = models.CharField(max_length=30)
+    object_id = models.BigIntegerField()
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+")
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "id"], name="tombstone_user_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.model} {self.object_id} supprimé"
+
+
+class OwnerStatement(models.Model):
+    """Monthly statement of a proprietaire, rendered by ``immo.statements``."""
+
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="releves")
+    month = models.DateField()
+    # sha256 of the statement data: an unchanged hash means the files are current.
+    content_hash = models.CharField(max_length=64)
+    html = models.FileField(upload_to="releves/", storage=blob_storage, db_index=True)
+    pdf = models.FileField(upload_to="releves/", storage=blob_storage, blank=True, db_index=True)
+    generated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-month"]
+        constraints = [
+            models.UniqueConstraint(fields=["owner", "month"], name="statement_owner_month_unique"),
+        ]
+
+    def __str__(self):
+        return f"Relevé {self.month:%m/%Y} - {self.owner}"
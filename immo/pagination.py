@@ -0,0 +1,89 @@
+import base64
+import binascii
+import datetime
+import json
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Type non sérialisable dans un curseur : {type(value)!r}")
+
+
+def encode_cursor(values) -> str:
+    raw = json.dumps(list(values), default=_json_default, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, model, fields):
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError) as exc:
+        raise InvalidCursor(cursor) from exc
+    if not isinstance(raw, list) or len(raw) != len(fields):
+        raise InvalidCursor(cursor)
+    try:
+        return [model._meta.get_field(name).to_python(value) for name, value in zip(fields, raw)]
+    except ValidationError as exc:
+        raise InvalidCursor(cursor) from exc
+
+
+def keyset_filter(fields, values, descending=True) -> Q:
+    """
+    Lexicographic "strictly after" condition on ``fields``, e.g. for
+    (created_at, id) descending: created_at < x OR (created_at = x AND id < y).
+    """
+    lookup = "lt" if descending else "gt"
+    condition = Q()
+    for position, name in enumerate(fields):
+        clause = Q(**{f"{name}__{lookup}": values[position]})
+        for previous, value in zip(fields[:position], values[:position]):
+            clause &= Q(**{previous: value})
+        condition |= clause
+    return condition
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def keyset_paginate(queryset, cursor=None, fields=("created_at", "id"), per_page=20, descending=True) -> KeysetPage:
+    """
+    Paginate ``queryset`` on an indexed, unique ordering instead of OFFSET so
+    every page costs the same whatever its position.
+    """
+    fields = tuple(fields)
+    prefix = "-" if descending else ""
+    queryset = queryset.order_by(*(f"{prefix}{name}" for name in fields))
+    if cursor:
+        values = decode_cursor(cursor, queryset.model, fields)
+        queryset = queryset.filter(keyset_filter(fields, values, descending))
+    items = list(queryset[: per_page + 1])
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        next_cursor = encode_cursor(getattr(items[-1], name) for name in fields)
+    return KeysetPage(items, next_cursor)
@@ -0,0 +1,232 @@
+"""
+Bulk import and export of a proprietaire's biens (CSV, or XLSX with openpyxl).
+
+Imports stream the file row by row, validate every row with ``BienForm`` and
+insert the valid ones with ``bulk_create``, one transaction per batch: an
+invalid row is reported with its line number and skipped, it never aborts
+the file. A file that becomes unreadable midway raises ``PortfolioError``
+with the report of the batches already saved. ``bulk_create`` skips ``Bien.save()`` and the signals, so the
+geohash, full-text index and dashboard panels are maintained here.
+
+Exports iterate the queryset in chunks and stream the CSV; XLSX exports are
+written by openpyxl's write-only workbook to a temporary file.
+"""
+import csv
+import io
+import tempfile
+
+from django.db import transaction
+from django.http import FileResponse, StreamingHttpResponse
+
+from . import dashboard, fulltext, geo
+from .forms import BienForm
+from .models import Bien
+
+COLUMNS = BienForm.Meta.fields
+EXPORT_COLUMNS = ["id", *COLUMNS]
+IMPORT_BATCH_SIZE = 1000
+EXPORT_CHUNK_SIZE = 2000
+MAX_REPORTED_ERRORS = 200
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+_TRUE = {"1", "true", "vrai", "oui", "yes", "x"}
+_FALSE = {"", "0", "false", "faux", "non", "no"}
+_CHOICES = {
+    field: {label.casefold(): value for value, label in Bien._meta.get_field(field).choices}
+    for field in ("property_type", "listing_status")
+}
+
+
+class PortfolioError(ValueError):
+    # Set by import_biens: the batches already saved when the file turned out unreadable.
+    report = None
+
+
+class ImportReport:
+    def __init__(self):
+        self.created = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+def _csv_rows(handle):
+    sample = handle.read(64 * 1024)
+    handle.seek(0)
+    if isinstance(sample, bytes):
+        sample = sample.decode("utf-8-sig", errors="ignore")
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    text = io.TextIOWrapper(handle, encoding="utf-8-sig", newline="")
+    try:
+        yield from csv.reader(text, dialect)
+    except UnicodeDecodeError as exc:
+        raise PortfolioError("Le fichier CSV doit être encodé en UTF-8.") from exc
+    finally:
+        text.detach()
+
+
+def _xlsx_rows(handle):
+    try:
+        import openpyxl
+    except ImportError as exc:
+        raise PortfolioError("L'import XLSX nécessite openpyxl ; importez un fichier CSV.") from exc
+    try:
+        workbook = openpyxl.load_workbook(handle, read_only=True, data_only=True)
+    except Exception as exc:  # openpyxl raises several unrelated types for corrupt files
+        raise PortfolioError("Classeur XLSX illisible.") from exc
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield ["" if value is None else str(value) for value in row]
+    finally:
+        workbook.close()
+
+
+def read_rows(uploaded):
+    """Yields (line number, {field: raw value}) for the data rows of ``uploaded``."""
+    name = (uploaded.name or "").lower()
+    rows = _xlsx_rows(uploaded) if name.endswith((".xlsx", ".xlsm")) else _csv_rows(uploaded.file)
+    header = next(rows, None)
+    if not header:
+        raise PortfolioError("Fichier vide.")
+    header = [column.strip().lower() for column in header]
+    missing = {"title", "property_type"} - set(header)
+    if missing:
+        raise PortfolioError(f"Colonnes obligatoires manquantes : {', '.join(sorted(missing))}.")
+    positions = [(index, column) for index, column in enumerate(header) if column in COLUMNS]
+    for line, row in enumerate(rows, start=2):
+        if not any(cell.strip() for cell in row):
+            continue
+        yield line, {column: row[index].strip() if index < len(row) else "" for index, column in positions}
+
+
+def _normalize(data):
+    """Accepts choice labels, oui/non booleans and French number formats; returns (data, error)."""
+    for field, labels in _CHOICES.items():
+        value = data.get(field)
+        if value:
+            data[field] = labels.get(value.casefold(), value)
+    if not data.get("listing_status"):
+        data["listing_status"] = Bien._meta.get_field("listing_status").default
+    furnished = data.pop("furnished", "").casefold()
+    if furnished in _TRUE:
+        data["furnished"] = "on"
+    elif furnished not in _FALSE:
+        return data, f"furnished : valeur « {furnished} » non reconnue (oui/non)."
+    for field in ("price", "latitude", "longitude"):
+        value = data.get(field)
+        if value:
+            data[field] = "".join(value.split()).replace(",", ".")
+    return data, None
+
+
+def _error_message(form):
+    messages = []
+    for field, errors in form.errors.items():
+        prefix = "" if field == "__all__" else f"{field} : "
+        messages.extend(f"{prefix}{error}" for error in errors)
+    return " ".join(messages)
+
+
+class _RowValidator:
+    """
+    One ``BienForm`` rebound to each row: building a form deep-copies all its
+    fields, which costs more than validating the row.
+    """
+
+    def __init__(self, owner):
+        self.owner = owner
+        self.form = BienForm({})
+
+    def validate(self, data):
+        form = self.form
+        form.data = data
+        form.instance = Bien(owner=self.owner)
+        form._errors = None
+        form._bound_fields_cache = {}
+        if form.is_valid():
+            return form.instance, None
+        return None, _error_message(form)
+
+
+def _insert(biens):
+    for bien in biens:
+        if not bien.has_coordinates() and bien.address:
+            coordinates = geo.geocode(bien.address)
+            if coordinates:
+                bien.latitude, bien.longitude = coordinates
+        bien.geohash = geo.encode(bien.latitude, bien.longitude) if bien.has_coordinates() else ""
+    with transaction.atomic():
+        created = Bien.objects.bulk_create(biens)
+        fulltext.index_biens(created)
+    return len(created)
+
+
+def import_biens(owner, uploaded, batch_size=IMPORT_BATCH_SIZE) -> ImportReport:
+    report = ImportReport()
+    validator = _RowValidator(owner)
+    batch = []
+    try:
+        for line, data in read_rows(uploaded):
+            data, error = _normalize(data)
+            if not error:
+                bien, error = validator.validate(data)
+            if error:
+                report.add_error(line, error)
+                continue
+            batch.append(bien)
+            if len(batch) >= batch_size:
+                report.created += _insert(batch)
+                batch = []
+        if batch:
+            report.created += _insert(batch)
+    except PortfolioError as exc:
+        exc.report = report
+        raise
+    finally:
+        if report.created:
+            dashboard.invalidate([owner.pk], "biens")
+    return report
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def _export_rows(queryset):
+    for row in queryset.order_by("id").values_list(*EXPORT_COLUMNS).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield ["" if value is None else value for value in row]
+
+
+def _stream_csv(queryset):
+    writer = csv.writer(_Echo(), delimiter=";")
+    yield "\ufeff" + writer.writerow(EXPORT_COLUMNS)
+    for row in _export_rows(queryset):
+        yield writer.writerow([("1" if value else "0") if isinstance(value, bool) else value for value in row])
+
+
+def export_response(queryset, filename, fmt="csv"):
+    if fmt == "xlsx":
+        try:
+            import openpyxl
+        except ImportError as exc:
+            raise PortfolioError("L'export XLSX nécessite openpyxl.") from exc
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet("Biens")
+        sheet.append(EXPORT_COLUMNS)
+        for row in _export_rows(queryset):
+            sheet.append(row)
+        handle = tempfile.TemporaryFile()
+        workbook.save(handle)
+        handle.seek(0)
+        return FileResponse(handle, as_attachment=True, filename=f"{filename}.xlsx", content_type=XLSX_CONTENT_TYPE)
+    response = StreamingHttpResponse(_stream_csv(queryset), content_type="text/csv; charset=utf-8")
+    response["Content-Disposition"] = f'attachment; filename="{filename}.csv"'
+    return response
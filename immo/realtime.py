@@ -0,0 +1,252 @@
+"""
+Push channel for messaging: new messages, typing indicators and read receipts.
+
+Each user listens on their own channel of a pub/sub broker. The default
+:class:`InMemoryBroker` only reaches listeners of the current process, which
+is enough for local development and a single ASGI worker; a shared backend
+(e.g. Redis) can be plugged in through the ``GP_IMMO_PUBSUB_BACKEND`` setting
+as long as it provides ``publish(channel, event)`` and ``subscribe(channel)``.
+
+Clients connect with a WebSocket on :data:`WEBSOCKET_PATH` (served by
+``gp_immo.asgi``) or fall back to long polling ``immo.views.message_events``.
+Every connection is a coroutine waiting on a queue, so idle clients cost no
+thread.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from functools import lru_cache
+from http.cookies import SimpleCookie
+from importlib import import_module
+from urllib.parse import urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, load_backend
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, transaction
+from django.db.models import Q
+from django.utils.crypto import constant_time_compare
+from django.utils.module_loading import import_string
+
+from .models import Conversation, Message
+
+WEBSOCKET_PATH = "/ws/messages/"
+QUEUE_SIZE = 100
+CATCH_UP_LIMIT = 100
+
+
+class Subscription:
+    def __init__(self, broker, channel, maxsize=QUEUE_SIZE):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+
+    def push(self, event):
+        # Publishers run in sync code (request threads, on_commit callbacks).
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        if self.queue.full():
+            # A stalled client loses its oldest events rather than growing memory.
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout=None):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def drain(self):
+        events = []
+        while not self.queue.empty():
+            events.append(self.queue.get_nowait())
+        return events
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InMemoryBroker:
+    def __init__(self):
+        self._channels = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel) -> Subscription:
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._channels[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            listeners = self._channels.get(subscription.channel)
+            if listeners is not None:
+                listeners.discard(subscription)
+                if not listeners:
+                    del self._channels[subscription.channel]
+
+    def publish(self, channel, event):
+        with self._lock:
+            listeners = list(self._channels.get(channel, ()))
+        for subscription in listeners:
+            try:
+                subscription.push(event)
+            except RuntimeError:
+                # Event loop already closed (long-poll request that just ended).
+                self.unsubscribe(subscription)
+
+
+@lru_cache(maxsize=1)
+def get_broker():
+    path = getattr(settings, "GP_IMMO_PUBSUB_BACKEND", "immo.realtime.InMemoryBroker")
+    return import_string(path)()
+
+
+def user_channel(user_id) -> str:
+    return f"user:{user_id}"
+
+
+def subscribe(user_id) -> Subscription:
+    return get_broker().subscribe(user_channel(user_id))
+
+
+def publish(user_ids, event):
+    broker = get_broker()
+    for user_id in set(user_ids):
+        broker.publish(user_channel(user_id), event)
+
+
+def message_event(message) -> dict:
+    return {
+        "type": "message",
+        "id": message.pk,
+        "conversation": message.conversation_id,
+        "sender": message.sender_id,
+        "receiver": message.receiver_id,
+        "content": message.content,
+        "kind": message.kind,
+        "attachment": message.attachment.url if message.attachment else None,
+        "created_at": message.created_at.isoformat(),
+    }
+
+
+def publish_message(message):
+    event = message_event(message)
+    transaction.on_commit(lambda: publish([message.sender_id, message.receiver_id], event))
+
+
+def publish_read(reader_id, other_id):
+    publish([other_id], {"type": "read", "by": reader_id})
+
+
+def publish_typing(user_id, other_id):
+    publish([other_id], {"type": "typing", "from": user_id})
+
+
+def messages_after(user, message_id):
+    """Messages a reconnecting client missed, oldest first (read from the primary: they were just written)."""
+    rows = (
+        Message.objects.using(DEFAULT_DB_ALIAS).filter(Q(receiver=user) | Q(sender=user), pk__gt=message_id)
+        .order_by("pk")[:CATCH_UP_LIMIT]
+    )
+    return [message_event(message) for message in rows]
+
+
+async def wait_for_events(subscription, timeout):
+    try:
+        first = await subscription.get(timeout)
+    except asyncio.TimeoutError:
+        return []
+    return [first, *subscription.drain()]
+
+
+def _session_user(session_key):
+    close_old_connections()
+    try:
+        session = import_module(settings.SESSION_ENGINE).SessionStore(session_key)
+        user_id = session.get(SESSION_KEY)
+        backend_path = session.get(BACKEND_SESSION_KEY)
+        if user_id is None or backend_path not in settings.AUTHENTICATION_BACKENDS:
+            return None
+        user = load_backend(backend_path).get_user(user_id)
+        if user is None or not constant_time_compare(session.get(HASH_SESSION_KEY, ""), user.get_session_auth_hash()):
+            return None
+        return user
+    finally:
+        close_old_connections()
+
+
+def _headers(scope) -> dict:
+    return {name.decode("latin-1"): value.decode("latin-1") for name, value in scope.get("headers", [])}
+
+
+def _origin_allowed(origin, host) -> bool:
+    # Browsers send the session cookie whatever page opens the socket, and
+    # always send Origin; clients without Origin cannot use a victim's cookie.
+    if not origin:
+        return True
+    if origin in getattr(settings, "GP_IMMO_WS_ALLOWED_ORIGINS", ()):
+        return True
+    return bool(host) and urlsplit(origin).netloc.lower() == host.lower()
+
+
+def shares_conversation(user_id, other_id) -> bool:
+    low, high = Conversation.pair(user_id, other_id)
+    return Conversation.objects.filter(user_low_id=low, user_high_id=high).exists()
+
+
+async def _handle_client_event(user, text, partners):
+    try:
+        event = json.loads(text or "")
+        target = int(event.get("to"))
+    except (TypeError, ValueError, AttributeError):
+        return
+    if event.get("type") == "typing":
+        # Only to someone the user talks with (checked once per connection).
+        if target not in partners:
+            if not await sync_to_async(shares_conversation)(user.pk, target):
+                return
+            partners.add(target)
+        publish_typing(user.pk, target)
+    elif event.get("type") == "read":
+        from . import conversations
+
+        await sync_to_async(conversations.mark_read)(user, target)
+
+
+async def websocket_application(scope, receive, send):
+    """
+    Raw ASGI WebSocket endpoint. Authenticates with the Django session
+    cookie, then forwards the user's channel to the socket and accepts
+    ``{"type": "typing"|"read", "to": <user id>}`` events from the client.
+    """
+    if (await receive())["type"] != "websocket.connect":
+        return
+    headers = _headers(scope)
+    session_key = SimpleCookie(headers.get("cookie", "")).get(settings.SESSION_COOKIE_NAME)
+    user = None
+    if scope.get("path") == WEBSOCKET_PATH and _origin_allowed(headers.get("origin"), headers.get("host")) and session_key:
+        user = await sync_to_async(_session_user)(session_key.value)
+    if user is None:
+        await send({"type": "websocket.close", "code": 4403})
+        return
+    await send({"type": "websocket.accept"})
+    subscription = subscribe(user.pk)
+    partners = set()
+
+    async def forward():
+        while True:
+            event = await subscription.get()
+            await send({"type": "websocket.send", "text": json.dumps(event)})
+
+    forwarder = asyncio.create_task(forward())
+    try:
+        while True:
+            message = await receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message["type"] == "websocket.receive":
+                await _handle_client_event(user, message.get("text"), partners)
+    finally:
+        forwarder.cancel()
+        subscription.close()
@@ -0,0 +1,59 @@
+from django.core.cache import cache
+from django.db.models import Count
+
+from gp_immo import metrics
+from . import fulltext
+from .pagination import keyset_paginate
+
+BIENS_PER_PAGE = 20
+FULLTEXT_RESULTS = 50
+FACET_FIELDS = ("property_type", "listing_status", "furnished")
+LISTING_FACETS_TTL = 60
+
+
+def bien_filters(cleaned_data) -> dict:
+    filters = {}
+    for name in FACET_FIELDS:
+        value = cleaned_data.get(name)
+        if value not in (None, ""):
+            filters[name] = value
+    if cleaned_data.get("price_min") is not None:
+        filters["price__gte"] = cleaned_data["price_min"]
+    if cleaned_data.get("price_max") is not None:
+        filters["price__lte"] = cleaned_data["price_max"]
+    return filters
+
+
+def search_biens(queryset, filters, cursor=None, per_page=BIENS_PER_PAGE):
+    return keyset_paginate(queryset.filter(**filters), cursor=cursor, per_page=per_page)
+
+
+def fulltext_biens(queryset, filters, query, limit=FULLTEXT_RESULTS):
+    return fulltext.search(query, queryset.filter(**filters), limit=limit)
+
+
+def facet_counts(queryset, filters) -> dict:
+    """
+    Counts per facet value, each facet ignoring its own filter so the other
+    choices of that facet stay visible with their totals.
+    """
+    facets = {}
+    for name in FACET_FIELDS:
+        others = {key: value for key, value in filters.items() if key != name}
+        rows = queryset.filter(**others).order_by().values(name).annotate(total=Count("pk"))
+        facets[name] = {row[name]: row["total"] for row in rows}
+    return facets
+
+
+def filters_key(filters) -> str:
+    return "|".join(f"{key}={value}" for key, value in sorted(filters.items()))
+
+
+def cached_facet_counts(queryset, filters, key_prefix, timeout=LISTING_FACETS_TTL) -> dict:
+    key = f"{key_prefix}:facets:{filters_key(filters)}"
+    facets = cache.get(key)
+    metrics.record_cache("facets", hits=facets is not None, misses=facets is None)
+    if facets is None:
+        facets = facet_counts(queryset, filters)
+        cache.set(key, facets, timeout)
+    return facets
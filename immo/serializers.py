@@ -0,0 +1,130 @@
+from rest_framework import serializers
+
+from .models import Bien, BienMedia, Contract, InterventionReport, Message, Payment, PrestataireAssignment
+
+
+class SparseFieldsMixin:
+    """Keeps only the fields listed in ``?fields=a,b`` (unknown names are ignored)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        wanted = requested_fields(self.context.get("request"))
+        if wanted:
+            for name in set(self.fields) - wanted:
+                self.fields.pop(name)
+
+
+def requested_fields(request):
+    if request is None:
+        return set()
+    raw = request.query_params.get("fields", "")
+    return {name.strip() for name in raw.split(",") if name.strip()}
+
+
+class FileUrlField(serializers.FileField):
+    def to_representation(self, value):
+        if not value:
+            return None
+        request = self.context.get("request")
+        url = value.url
+        return request.build_absolute_uri(url) if request else url
+
+
+class BienMediaSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    file = FileUrlField()
+
+    class Meta:
+        model = BienMedia
+        fields = ["id", "bien", "file", "media_kind", "size", "width", "height", "uploaded_at"]
+
+
+class BienMediaSummarySerializer(serializers.ModelSerializer):
+    file = FileUrlField()
+
+    class Meta:
+        model = BienMedia
+        fields = ["id", "file", "media_kind", "width", "height"]
+
+
+class BienSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    media = BienMediaSummarySerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Bien
+        fields = [
+            "id",
+            "owner",
+            "title",
+            "property_type",
+            "listing_status",
+            "furnished",
+            "price",
+            "address",
+            "description",
+            "latitude",
+            "longitude",
+            "created_at",
+            "updated_at",
+            "media",
+        ]
+
+
+class ContractSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    bien_title = serializers.CharField(source="bien.title", read_only=True)
+
+    class Meta:
+        model = Contract
+        fields = [
+            "id",
+            "bien",
+            "bien_title",
+            "owner",
+            "tenant_name",
+            "start_date",
+            "end_date",
+            "rent",
+            "status",
+            "created_at",
+            "updated_at",
+        ]
+
+
+class PaymentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Payment
+        fields = [
+            "id",
+            "contract",
+            "bien",
+            "prestataire",
+            "amount",
+            "due_date",
+            "period",
+            "status",
+            "payment_type",
+            "created_at",
+            "updated_at",
+        ]
+
+
+class MessageSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    attachment = FileUrlField()
+
+    class Meta:
+        model = Message
+        fields = ["id", "conversation", "sender", "receiver", "content", "kind", "attachment", "created_at", "updated_at"]
+
+
+class PrestataireAssignmentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = PrestataireAssignment
+        fields = ["id", "bien", "prestataire", "active", "created_at", "updated_at"]
+
+
+class InterventionReportSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    attachment = FileUrlField()
+    bien_title = serializers.CharField(source="bien.title", read_only=True)
+
+    class Meta:
+        model = InterventionReport
+        fields = ["id", "bien", "bien_title", "prestataire", "summary", "attachment", "created_at"]
@@ -0,0 +1,169 @@
+"""
+Media file responses: access control, conditional requests, byte ranges and
+hand-off to the front web server.
+
+With ``GP_IMMO_MEDIA_ACCEL = "nginx"`` the response only carries an
+``X-Accel-Redirect`` to ``GP_IMMO_MEDIA_ACCEL_PREFIX`` + the file name (an
+``internal`` nginx location aliased to MEDIA_ROOT); with ``"apache"`` an
+``X-Sendfile`` header with the file path (mod_xsendfile). The front server
+then streams the file and answers Range requests itself. Without one, Django
+streams the file: whole files through ``FileResponse`` (``wsgi.file_wrapper``
+/ sendfile where available), ranges in bounded blocks.
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+from .models import BienMedia, BienMediaVariant, InterventionReport, Message, OwnerStatement
+from .storage import blob_digest, blob_storage
+
+BLOCK_SIZE = 64 * 1024
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+MUTABLE_MAX_AGE = 24 * 3600
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def access(user, name):
+    """
+    "public" for listing photos, "private" for files the user is a party to,
+    None otherwise. A deduplicated blob can back several rows: any of them
+    may grant access.
+    """
+    if BienMedia.objects.filter(file=name).exists() or BienMediaVariant.objects.filter(file=name).exists():
+        return "public"
+    if not user.is_authenticated:
+        return None
+    messages = Message.objects.filter(attachment=name)
+    reports = InterventionReport.objects.filter(attachment=name)
+    statements = OwnerStatement.objects.filter(Q(html=name) | Q(pdf=name))
+    if not user.is_staff:
+        messages = messages.filter(Q(sender=user) | Q(receiver=user))
+        reports = reports.filter(Q(prestataire=user) | Q(bien__owner=user))
+        statements = statements.filter(owner=user)
+    if messages.exists() or reports.exists() or statements.exists():
+        return "private"
+    return None
+
+
+def file_etag(name, stat) -> str:
+    # Blob names are content hashes, so they make strong validators as is.
+    return quote_etag(blob_digest(name) or f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+
+
+def _etag_matches(header, etag) -> bool:
+    if header.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+
+def not_modified(request, etag, modified) -> bool:
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    since = parse_http_date_safe(request.headers.get("If-Modified-Since", ""))
+    return since is not None and int(modified) <= since
+
+
+def requested_range(request, size, etag, modified):
+    """(start, end) inclusive, None for the whole file, or "invalid" for a 416."""
+    header = request.headers.get("Range", "")
+    match = _RANGE.match(header.strip())
+    if not match or size == 0:
+        return None
+    if_range = request.headers.get("If-Range")
+    if if_range and if_range != etag and parse_http_date_safe(if_range) != int(modified):
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return "invalid"
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, "rb") as handle:
+        handle.seek(start)
+        while length > 0:
+            block = handle.read(min(BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+
+def _offload(response, name, path):
+    mode = getattr(settings, "GP_IMMO_MEDIA_ACCEL", None)
+    if mode == "nginx":
+        prefix = getattr(settings, "GP_IMMO_MEDIA_ACCEL_PREFIX", "/protected-media/")
+        response["X-Accel-Redirect"] = f"{prefix.rstrip('/')}/{name}"
+    elif mode == "apache":
+        response["X-Sendfile"] = path
+    else:
+        return False
+    return True
+
+
+def serve(request, name, visibility):
+    storage = blob_storage()
+    path = storage.path(name)
+    try:
+        stat = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    etag = file_etag(name, stat)
+    modified = stat.st_mtime
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(modified),
+        "Accept-Ranges": "bytes",
+        "Cache-Control": (
+            f"{visibility}, max-age={IMMUTABLE_MAX_AGE}, immutable"
+            if blob_digest(name)
+            else f"{visibility}, max-age={MUTABLE_MAX_AGE}"
+        ),
+    }
+    if visibility == "private":
+        headers["Vary"] = "Cookie"
+    if not_modified(request, etag, modified):
+        response = HttpResponseNotModified()
+        for header, value in headers.items():
+            response[header] = value
+        return response
+    content_type, encoding = mimetypes.guess_type(name)
+    content_type = content_type or "application/octet-stream"
+
+    accelerated = HttpResponse(content_type=content_type)
+    if _offload(accelerated, name, path):
+        for header, value in headers.items():
+            accelerated[header] = value
+        return accelerated
+
+    byte_range = requested_range(request, stat.st_size, etag, modified)
+    if byte_range == "invalid":
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{stat.st_size}"
+    elif byte_range:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            _read_range(path, start, end - start + 1), status=206, content_type=content_type
+        )
+        response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+        response["Content-Length"] = str(end - start + 1)
+    else:
+        response = FileResponse(open(path, "rb"), content_type=content_type)
+        if encoding:
+            response["Content-Encoding"] = encoding
+    for header, value in headers.items():
+        response[header] = value
+    return response
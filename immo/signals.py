@@ -0,0 +1,227 @@
+from django.conf import settings
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from accounts.models import Specialization, User
+from . import blobs, conversations, dashboard, fulltext, geo, ledger, marketplace, realtime, sync
+from .models import Bien, Contract, InterventionReport, Message, Payment, PrestataireAssignment
+
+
+@receiver(pre_save, sender=Bien)
+def bien_geocode(sender, instance, raw=False, **kwargs):
+    if raw or instance.has_coordinates() or not instance.address:
+        return
+    coordinates = geo.geocode(instance.address)
+    if coordinates:
+        instance.latitude, instance.longitude = coordinates
+        instance.geohash = geo.encode(*coordinates)
+
+
+@receiver(post_save, sender=Bien)
+def bien_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    fulltext.index_biens([instance])
+    bien_changed(instance)
+
+
+@receiver(post_delete, sender=Bien)
+def bien_deleted(sender, instance, **kwargs):
+    fulltext.remove_biens([instance.pk])
+    bien_changed(instance)
+
+
+def bien_changed(bien):
+    dashboard.invalidate([bien.owner_id], "biens", "contrats", "assignments")
+    prestataire_ids = set(bien.prestataires.values_list("prestataire_id", flat=True))
+    prestataire_ids.update(bien.rapports.values_list("prestataire_id", flat=True))
+    dashboard.invalidate(prestataire_ids, "missions", "rapports")
+
+
+@receiver([post_save, post_delete], sender=Contract)
+def contract_changed(sender, instance, **kwargs):
+    dashboard.invalidate([instance.owner_id], "contrats")
+
+
+def payment_owner_ids(payment):
+    owner_ids = set()
+    if payment.contract_id:
+        owner_ids.add(Contract.objects.filter(pk=payment.contract_id).values_list("owner_id", flat=True).first())
+    if payment.bien_id:
+        owner_ids.add(Bien.objects.filter(pk=payment.bien_id).values_list("owner_id", flat=True).first())
+    owner_ids.discard(None)
+    return owner_ids
+
+
+@receiver(pre_save, sender=Payment)
+def payment_remember_previous(sender, instance, raw=False, **kwargs):
+    instance._ledger_previous = None
+    if raw or instance.pk is None:
+        return
+    previous = Payment.objects.filter(pk=instance.pk).first()
+    if previous is not None:
+        instance._ledger_previous = (ledger.payment_slice(previous), previous.amount)
+
+
+@receiver(post_save, sender=Payment)
+def payment_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    current = (ledger.payment_slice(instance), instance.amount)
+    previous = getattr(instance, "_ledger_previous", None)
+    if previous != current:
+        if previous is not None:
+            ledger.apply(previous[0], -previous[1], -1)
+        ledger.apply(current[0], current[1], 1)
+    dashboard.invalidate(payment_owner_ids(instance), "paiements")
+
+
+@receiver(post_delete, sender=Payment)
+def payment_deleted(sender, instance, **kwargs):
+    ledger.apply(ledger.payment_slice(instance), -instance.amount, -1)
+    dashboard.invalidate(payment_owner_ids(instance), "paiements")
+
+
+@receiver(pre_save, sender=PrestataireAssignment)
+def assignment_remember_previous(sender, instance, raw=False, **kwargs):
+    instance._was_active = None
+    if not raw and instance.pk is not None:
+        instance._was_active = PrestataireAssignment.objects.filter(pk=instance.pk).values_list("active", flat=True).first()
+
+
+@receiver(post_save, sender=PrestataireAssignment)
+def assignment_visibility(sender, instance, raw=False, **kwargs):
+    # The bien enters or leaves what the prestataire's clients sync.
+    if raw or instance._was_active == instance.active:
+        return
+    if instance.active:
+        sync.touch(Bien, [instance.bien_id])
+    elif instance._was_active:
+        sync.record_deletion(Bien(pk=instance.bien_id), [instance.prestataire_id])
+
+
+@receiver(pre_delete, sender=PrestataireAssignment)
+def assignment_deleting(sender, instance, **kwargs):
+    if instance.active:
+        sync.record_deletion(Bien(pk=instance.bien_id), [instance.prestataire_id])
+
+
+@receiver(pre_delete, sender=Bien)
+@receiver(pre_delete, sender=Contract)
+@receiver(pre_delete, sender=Payment)
+@receiver(pre_delete, sender=Message)
+@receiver(pre_delete, sender=PrestataireAssignment)
+def synced_deleting(sender, instance, **kwargs):
+    sync.record_deletion(instance)
+
+
+@receiver([post_save, post_delete], sender=PrestataireAssignment)
+def assignment_changed(sender, instance, **kwargs):
+    owner_id = Bien.objects.filter(pk=instance.bien_id).values_list("owner_id", flat=True).first()
+    dashboard.invalidate([owner_id], "assignments")
+    dashboard.invalidate([instance.prestataire_id], "missions")
+
+
+@receiver([post_save, post_delete], sender=InterventionReport)
+def report_changed(sender, instance, **kwargs):
+    dashboard.invalidate([instance.prestataire_id], "rapports")
+
+
+@receiver(pre_save, sender=Message)
+def message_thread(sender, instance, raw=False, **kwargs):
+    if instance.conversation_id is None and not raw:
+        instance.conversation = conversations.thread_between(instance.sender_id, instance.receiver_id, create=True)
+
+
+@receiver(post_save, sender=Message)
+def message_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        conversations.record_message(instance)
+        realtime.publish_message(instance)
+    dashboard.invalidate([instance.sender_id, instance.receiver_id], "last_messages")
+
+
+@receiver(post_delete, sender=Message)
+def message_deleted(sender, instance, **kwargs):
+    dashboard.invalidate([instance.sender_id, instance.receiver_id], "last_messages")
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_changed(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    # Logins only touch last_login, which no panel shows.
+    if created or raw or (update_fields and set(update_fields) <= {"last_login"}):
+        return
+    # Panels of other users that print this user's display name.
+    owner_ids = Bien.objects.filter(prestataires__prestataire=instance).values_list("owner_id", flat=True)
+    dashboard.invalidate(owner_ids, "assignments")
+    prestataire_ids = PrestataireAssignment.objects.filter(bien__owner=instance).values_list("prestataire_id", flat=True)
+    dashboard.invalidate(prestataire_ids, "missions")
+    partner_ids = {thread.other_id(instance.pk) for thread in conversations.for_user(instance).only("user_low", "user_high")}
+    dashboard.invalidate(partner_ids | {instance.pk}, "last_messages")
+
+
+@receiver(pre_save, sender=settings.AUTH_USER_MODEL)
+def user_remember_role(sender, instance, raw=False, update_fields=None, **kwargs):
+    # A user leaving the prestataire role must leave the marketplace caches too.
+    instance._was_prestataire = False
+    if raw or instance._state.adding or instance.is_prestataire() or (update_fields and set(update_fields) <= {"last_login"}):
+        return
+    instance._was_prestataire = sender.objects.filter(pk=instance.pk, role=User.Role.PRESTATAIRE).exists()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_marketplace_changed(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw or (update_fields and set(update_fields) <= {"last_login"}):
+        return
+    if instance.is_prestataire() or getattr(instance, "_was_prestataire", False):
+        marketplace.invalidate()
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def user_deleted(sender, instance, **kwargs):
+    if instance.is_prestataire():
+        marketplace.invalidate()
+
+
+@receiver(m2m_changed, sender=User.specializations.through)
+def user_specializations_changed(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        marketplace.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Specialization)
+def specialization_changed(sender, instance, **kwargs):
+    marketplace.invalidate()
+
+
+def blob_remember_previous(sender, instance, **kwargs):
+    instance._blob_previous = None
+    instance._blob_uploads = {}
+    for field in blobs.FILE_FIELDS[sender]:
+        file = getattr(instance, field)
+        if file and not file._committed:
+            # Once stored, the field only keeps the name: hold on to the content for retain().
+            instance._blob_uploads[field] = file.file
+    if not instance._state.adding:
+        instance._blob_previous = sender.objects.filter(pk=instance.pk).values(*blobs.FILE_FIELDS[sender]).first()
+
+
+def blob_saved(sender, instance, **kwargs):
+    previous = getattr(instance, "_blob_previous", None) or {}
+    uploads = getattr(instance, "_blob_uploads", None) or {}
+    for field in blobs.FILE_FIELDS[sender]:
+        name = getattr(instance, field).name or ""
+        if name != (previous.get(field) or ""):
+            blobs.retain(name, content=uploads.get(field))
+            blobs.release(previous.get(field))
+
+
+def blob_deleted(sender, instance, **kwargs):
+    for field in blobs.FILE_FIELDS[sender]:
+        blobs.release(getattr(instance, field).name)
+
+
+for model in blobs.FILE_FIELDS:
+    pre_save.connect(blob_remember_previous, sender=model)
+    post_save.connect(blob_saved, sender=model)
+    post_delete.connect(blob_deleted, sender=model)
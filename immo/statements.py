@@ -0,0 +1,213 @@
+"""
+Monthly owner statements.
+
+For every proprietaire and month, :func:`collect` reads the biens, contracts,
+payments and intervention reports of the month in a fixed number of queries
+and reduces them to plain data. The sha256 of that data is compared with the
+stored ``OwnerStatement``: unchanged statements are skipped without being
+rendered. The others are rendered in a process pool (the template to HTML,
+then to PDF with WeasyPrint when it is installed) and the files are written
+to the blob storage by the parent process, which owns the database.
+"""
+import datetime
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from decimal import Decimal
+
+import django
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Coalesce
+from django.template.loader import render_to_string
+
+from accounts.models import User
+from .ledger import month_bounds, month_start
+from .models import Bien, Contract, InterventionReport, OwnerStatement, Payment
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE = "immo/owner_statement.html"
+# Bump when the template changes so that every statement is rendered again.
+TEMPLATE_VERSION = 1
+MAX_PENDING_PER_WORKER = 4
+TOTALS = ("received", "late", "pending", "costs")
+
+
+def previous_month(today=None):
+    today = today or datetime.date.today()
+    return month_start(month_start(today) - datetime.timedelta(days=1))
+
+
+def owner_ids():
+    return Bien.objects.order_by("owner_id").values_list("owner_id", flat=True).distinct()
+
+
+def _money(value):
+    return str(Decimal(value).quantize(Decimal("0.01")))
+
+
+def collect(owner, month) -> dict:
+    """Plain (picklable, JSON-serializable) data of one statement, in four queries."""
+    start, end = month_bounds(month)
+    biens = list(Bien.objects.filter(owner=owner).order_by("title", "id").values("id", "title", "address"))
+    contracts = (
+        Contract.objects.filter(bien__owner=owner, start_date__lte=end)
+        .filter(Q(end_date__isnull=True) | Q(end_date__gte=start))
+        .exclude(status=Contract.Status.DRAFT)
+        .order_by("start_date", "id")
+        .values("bien_id", "tenant_name", "start_date", "end_date", "rent", "status")
+    )
+    payments = (
+        Payment.objects.annotate(statement_bien=Coalesce("bien_id", "contract__bien_id"))
+        .filter(Q(bien__owner=owner) | Q(contract__bien__owner=owner), due_date__gte=start, due_date__lte=end)
+        .order_by("due_date", "id")
+        .values("id", "statement_bien", "amount", "due_date", "status", "payment_type", "prestataire__username")
+    )
+    reports = (
+        InterventionReport.objects.filter(bien__owner=owner, created_at__date__gte=start, created_at__date__lte=end)
+        .order_by("created_at", "id")
+        .values("bien_id", "summary", "created_at", "prestataire__username")
+    )
+    sections = {
+        bien["id"]: {**bien, "contracts": [], "payments": [], "reports": [], "totals": dict.fromkeys(TOTALS, Decimal(0))}
+        for bien in biens
+    }
+    for contract in contracts:
+        sections[contract["bien_id"]]["contracts"].append(
+            {
+                "tenant": contract["tenant_name"],
+                "start": contract["start_date"].isoformat(),
+                "end": contract["end_date"].isoformat() if contract["end_date"] else None,
+                "rent": _money(contract["rent"]),
+                "status": Contract.Status(contract["status"]).label,
+            }
+        )
+    for payment in payments:
+        section = sections.get(payment["statement_bien"])
+        if section is None:
+            continue
+        if payment["payment_type"] == Payment.PaymentType.PRESTATAIRE:
+            key = "costs"
+        else:
+            key = {Payment.Status.PAID: "received", Payment.Status.LATE: "late"}.get(payment["status"], "pending")
+        section["totals"][key] += payment["amount"]
+        section["payments"].append(
+            {
+                "id": payment["id"],
+                "due": payment["due_date"].isoformat(),
+                "type": Payment.PaymentType(payment["payment_type"]).label,
+                "status": Payment.Status(payment["status"]).label,
+                "amount": _money(payment["amount"]),
+                "prestataire": payment["prestataire__username"],
+                "category": key,
+            }
+        )
+    for report in reports:
+        sections[report["bien_id"]]["reports"].append(
+            {
+                "date": report["created_at"].date().isoformat(),
+                "prestataire": report["prestataire__username"],
+                "summary": report["summary"],
+            }
+        )
+    totals = dict.fromkeys((*TOTALS, "net"), Decimal(0))
+    for section in sections.values():
+        section["totals"]["net"] = section["totals"]["received"] - section["totals"]["costs"]
+        for key, value in section["totals"].items():
+            totals[key] += value
+        section["totals"] = {key: _money(value) for key, value in section["totals"].items()}
+    return {
+        "owner": {"id": owner.pk, "name": owner.get_full_name() or owner.username},
+        "month": month.isoformat(),
+        "biens": list(sections.values()),
+        "totals": {key: _money(value) for key, value in totals.items()},
+    }
+
+
+def content_hash(data) -> str:
+    raw = json.dumps([TEMPLATE_VERSION, data], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def render(data):
+    """Runs in a worker process. Returns (html bytes, pdf bytes or None)."""
+    context = {**data, "month": datetime.date.fromisoformat(data["month"])}
+    html = render_to_string(TEMPLATE, context)
+    try:
+        from weasyprint import HTML
+    except ImportError:
+        return html.encode(), None
+    return html.encode(), HTML(string=html).write_pdf()
+
+
+def store(owner_id, month, digest, html, pdf):
+    name = f"releves/{owner_id}/{month:%Y-%m}"
+    with transaction.atomic():
+        statement = OwnerStatement.objects.select_for_update().filter(owner_id=owner_id, month=month).first()
+        statement = statement or OwnerStatement(owner_id=owner_id, month=month)
+        statement.content_hash = digest
+        statement.html.save(f"{name}.html", ContentFile(html), save=False)
+        if pdf is None:
+            statement.pdf = ""
+        else:
+            statement.pdf.save(f"{name}.pdf", ContentFile(pdf), save=False)
+        statement.save()
+    return statement
+
+
+def _is_current(statement, digest, pdf_wanted):
+    return statement is not None and statement.content_hash == digest and (statement.pdf or not pdf_wanted)
+
+
+def _pdf_available():
+    try:
+        import weasyprint  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def generate(month, owners=None, workers=None, force=False):
+    """Statements of ``month`` for ``owners`` (default: every owner of a bien). Returns (rendered, skipped)."""
+    month = month_start(month)
+    owners = User.objects.filter(pk__in=owner_ids() if owners is None else [owner.pk for owner in owners])
+    existing = {statement.owner_id: statement for statement in OwnerStatement.objects.filter(month=month)}
+    pdf_wanted = _pdf_available()
+    rendered = skipped = 0
+    pending = {}
+
+    def drain():
+        nonlocal rendered
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            owner_id, digest = pending.pop(future)
+            try:
+                html, pdf = future.result()
+            except Exception:
+                logger.exception("Échec du rendu du relevé de %s pour %s", owner_id, month)
+                continue
+            store(owner_id, month, digest, html, pdf)
+            rendered += 1
+
+    workers = workers or os.cpu_count() or 1
+    # Spawned, not forked: the workers must not inherit the parent's database connections.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup) as pool:
+        limit = MAX_PENDING_PER_WORKER * workers
+        for owner in owners.order_by("pk").iterator():
+            data = collect(owner, month)
+            digest = content_hash(data)
+            if not force and _is_current(existing.get(owner.pk), digest, pdf_wanted):
+                skipped += 1
+                continue
+            pending[pool.submit(render, data)] = (owner.pk, digest)
+            if len(pending) >= limit:
+                drain()
+        while pending:
+            drain()
+    return rendered, skipped
@@ -0,0 +1,86 @@
+"""
+Content-addressed media storage.
+
+Files are hashed with sha256 while they are written and stored once under
+``blobs/<aa>/<bb>/<sha256><ext>``; saving a file whose content is already
+stored only returns the existing name. The ``upload_to`` names of the
+models are ignored apart from their extension. References are counted in
+``MediaBlob`` by ``immo.blobs``, which deletes a blob with its last
+reference.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage, storages
+
+BLOB_PREFIX = "blobs/"
+READ_BUFFER = 1024 * 1024
+_BLOB_NAME = re.compile(r"^blobs/[0-9a-f]{2}/[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})(?P<ext>\.[0-9a-z]{1,10})?$")
+
+
+def blob_storage():
+    return storages["blobs"]
+
+
+def blob_digest(name):
+    match = _BLOB_NAME.match(name or "")
+    return match.group("digest") if match else None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def blob_name(self, digest, name) -> str:
+        extension = os.path.splitext(name)[1].lower()
+        if not re.fullmatch(r"\.[0-9a-z]{1,10}", extension):
+            extension = ""
+        return f"{BLOB_PREFIX}{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+    def get_available_name(self, name, max_length=None):
+        # Names are derived from the content in _save, so clashes are expected.
+        return name
+
+    def _spool(self, content):
+        """Hash ``content`` into a temporary file next to the blobs; returns (digest, path, moved)."""
+        digest = hashlib.sha256()
+        if hasattr(content, "temporary_file_path"):
+            path = content.temporary_file_path()
+            with open(path, "rb") as handle:
+                for block in iter(lambda: handle.read(READ_BUFFER), b""):
+                    digest.update(block)
+            return digest.hexdigest(), path, True
+        directory = self.path(BLOB_PREFIX)
+        os.makedirs(directory, exist_ok=True)
+        handle = tempfile.NamedTemporaryFile(dir=directory, prefix=".incoming-", delete=False)
+        try:
+            if hasattr(content, "seek"):
+                content.seek(0)
+            for block in content.chunks(READ_BUFFER):
+                if isinstance(block, str):
+                    block = block.encode()
+                digest.update(block)
+                handle.write(block)
+        except BaseException:
+            handle.close()
+            os.unlink(handle.name)
+            raise
+        handle.close()
+        return digest.hexdigest(), handle.name, False
+
+    def _save(self, name, content):
+        digest, spooled, external = self._spool(content)
+        blob = self.blob_name(digest, name)
+        full_path = self.path(blob)
+        if os.path.exists(full_path):
+            if not external:
+                os.unlink(spooled)
+            return blob
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        if external:
+            file_move_safe(spooled, full_path)
+        else:
+            os.replace(spooled, full_path)
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+        return blob
@@ -0,0 +1,153 @@
+"""
+Changes-since synchronisation for offline clients (the Flutter app).
+
+Synced models carry an ``updated_at`` and every deletion leaves a
+``Tombstone`` per user who could see the row. A client sends back the
+opaque token of its last sync and receives, per model, the rows changed
+since then plus the ids deleted since then, in batches. The token holds a
+keyset position (updated_at, id) per model and the last tombstone id; it is
+signed, so clients cannot forge positions of other users.
+
+When a batch is complete the next position is pulled back by
+:data:`OVERLAP`, so rows written by transactions that committed late are
+sent again rather than missed; clients upsert by id.
+"""
+import datetime
+from datetime import timedelta
+
+from django.core import signing
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .models import Bien, Contract, Message, Payment, PrestataireAssignment, Tombstone
+
+TOKEN_SALT = "immo.sync"
+BATCH_SIZE = 500
+OVERLAP = timedelta(seconds=5)
+TOMBSTONE_RETENTION = timedelta(days=90)
+
+MODEL_NAMES = {
+    Bien: "biens",
+    Contract: "contrats",
+    Payment: "paiements",
+    Message: "messages",
+    PrestataireAssignment: "assignments",
+}
+
+
+def audience(instance):
+    """Users whose clients may hold ``instance``."""
+    if isinstance(instance, Bien):
+        users = {instance.owner_id}
+        users.update(instance.prestataires.filter(active=True).values_list("prestataire_id", flat=True))
+        return users
+    if isinstance(instance, Contract):
+        return {instance.owner_id}
+    if isinstance(instance, Payment):
+        users = {instance.prestataire_id}
+        if instance.contract_id:
+            users.add(Contract.objects.filter(pk=instance.contract_id).values_list("owner_id", flat=True).first())
+        if instance.bien_id:
+            users.add(Bien.objects.filter(pk=instance.bien_id).values_list("owner_id", flat=True).first())
+        return users - {None}
+    if isinstance(instance, Message):
+        return {instance.sender_id, instance.receiver_id}
+    if isinstance(instance, PrestataireAssignment):
+        owner_id = Bien.objects.filter(pk=instance.bien_id).values_list("owner_id", flat=True).first()
+        return {owner_id, instance.prestataire_id} - {None}
+    return set()
+
+
+def record_deletion(instance, user_ids=None):
+    model = MODEL_NAMES[type(instance)]
+    user_ids = audience(instance) if user_ids is None else user_ids
+    Tombstone.objects.bulk_create(
+        [Tombstone(model=model, object_id=instance.pk, user_id=user_id) for user_id in user_ids if user_id]
+    )
+
+
+def touch(model, pks):
+    """Mark rows changed without going through save() (e.g. newly visible to someone)."""
+    model.objects.filter(pk__in=pks).update(updated_at=timezone.now())
+
+
+def encode_token(state) -> str:
+    return signing.dumps(state, salt=TOKEN_SALT, compress=True)
+
+
+def decode_token(token, user):
+    if not token:
+        return None
+    try:
+        state = signing.loads(token, salt=TOKEN_SALT)
+        issued = datetime.datetime.fromisoformat(state["issued"])
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        return None
+    if state.get("user") != user.pk or issued < timezone.now() - TOMBSTONE_RETENTION:
+        return None
+    return state
+
+
+def _after(position):
+    if not position:
+        return Q()
+    updated_at = datetime.datetime.fromisoformat(position[0])
+    return Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=position[1])
+
+
+def _next_position(position, rows, started, batch_size):
+    if len(rows) >= batch_size:
+        last = rows[-1]
+        return [last.updated_at.isoformat(), last.pk], True
+    floor = started - OVERLAP
+    if position:
+        floor = max(floor, datetime.datetime.fromisoformat(position[0]))
+    return [floor.isoformat(), 0], False
+
+
+def changes(user, token, scopes, serialize, batch_size=BATCH_SIZE) -> dict:
+    """
+    ``scopes`` maps each model name to a queryset of what ``user`` can see,
+    ``serialize(name, rows)`` turns a batch into data. ``reset`` tells the
+    client to drop its local copy first (first sync or expired token); while
+    ``more`` is true the client should call again right away.
+    """
+    started = timezone.now()
+    state = decode_token(token, user)
+    reset = state is None
+    if reset:
+        last_tombstone = Tombstone.objects.filter(user=user).aggregate(last=Max("id"))["last"] or 0
+        state = {"models": {}, "tombstone": last_tombstone}
+    payload = {"reset": reset, "changes": {}, "deleted": {}}
+    more = False
+    positions = {}
+    for name, queryset in scopes.items():
+        position = state["models"].get(name)
+        rows = list(queryset.filter(_after(position)).order_by("updated_at", "id")[:batch_size])
+        positions[name], truncated = _next_position(position, rows, started, batch_size)
+        more = more or truncated
+        if rows:
+            payload["changes"][name] = serialize(name, rows)
+    tombstones = list(
+        Tombstone.objects.filter(user=user, id__gt=state["tombstone"])
+        .order_by("id")
+        .values_list("id", "model", "object_id")[:batch_size]
+    )
+    for _, model, object_id in tombstones:
+        payload["deleted"].setdefault(model, []).append(object_id)
+    more = more or len(tombstones) >= batch_size
+    payload["more"] = more
+    payload["token"] = encode_token(
+        {
+            "user": user.pk,
+            "issued": started.isoformat(),
+            "models": positions,
+            "tombstone": tombstones[-1][0] if tombstones else state["tombstone"],
+        }
+    )
+    return payload
+
+
+def purge_tombstones(older_than=TOMBSTONE_RETENTION) -> int:
+    deleted, _ = Tombstone.objects.filter(deleted_at__lt=timezone.now() - older_than).delete()
+    return deleted
@@ -0,0 +1,363 @@
+"""
+Reproducible synthetic data for benchmarks and load tests.
+
+:func:`generate` creates owners, prestataires, biens with media rows,
+assignments, contracts with a year of rent payments, prestataire payments,
+conversations and intervention reports at one of the ``SCALES``, with bulk
+inserts. The same scale, seed and prefix always produce the same rows.
+Bulk inserts skip the model signals, so :func:`generate` does their work
+itself: thread fields of the conversations, geohash, full-text index,
+ledger, blob reference counts and the marketplace caches.
+
+``PAGES`` lists the main pages with the number of SQL queries each makes on
+a cold cache over such a data set; ``immo.tests`` asserts them and
+``manage.py benchmark_views`` reports them with the latencies.
+"""
+import io
+import random
+from dataclasses import dataclass
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.db import transaction
+
+from accounts.models import Specialization, User
+from accounts.text import normalize
+from . import blobs, conversations, fulltext, geo, ledger, marketplace
+from .models import (
+    Bien,
+    BienMedia,
+    Contract,
+    Conversation,
+    InterventionReport,
+    Message,
+    Payment,
+    PrestataireAssignment,
+)
+from .storage import blob_storage
+
+BATCH_SIZE = 2000
+PASSWORD = "demo-mot-de-passe"
+
+# Page name: (user from sample_users(), URL, SQL queries on a cold cache). The
+# counts are those of the "small" scale and no larger scale may exceed them: a
+# page whose query count grows with the data has an N+1 somewhere.
+PAGES = {
+    "dashboard": ("owner", "/dashboard/", 8),
+    "dashboard_prestataire": ("prestataire", "/dashboard/", 6),
+    "biens_list": ("owner", "/biens/", 6),
+    "marketplace": ("owner", "/marketplace/prestataires/", 3),
+    "inbox": ("owner", "/messagerie/", 4),
+    "conversation": ("owner", "/messagerie/{partner}/", 6),
+    "payment_create": ("owner", "/paiements/nouveau/", 8),
+}
+
+
+@dataclass(frozen=True)
+class Scale:
+    owners: int
+    prestataires: int
+    biens_per_owner: int = 5
+    media_per_bien: int = 2
+    contract_ratio: float = 0.6
+    payment_months: int = 12
+    threads_per_owner: int = 3
+    messages_per_thread: int = 10
+    report_ratio: float = 0.3
+
+
+SCALES = {
+    "small": Scale(owners=20, prestataires=10),
+    "medium": Scale(owners=200, prestataires=60),
+    "large": Scale(owners=2000, prestataires=400),
+}
+
+CITIES = [
+    ("Paris", 48.8566, 2.3522),
+    ("Lyon", 45.7640, 4.8357),
+    ("Marseille", 43.2965, 5.3698),
+    ("Toulouse", 43.6047, 1.4442),
+    ("Bordeaux", 44.8378, -0.5792),
+    ("Lille", 50.6292, 3.0573),
+    ("Nantes", 47.2184, -1.5536),
+    ("Strasbourg", 48.5734, 7.7521),
+    ("Montpellier", 43.6108, 3.8767),
+    ("Rennes", 48.1173, -1.6778),
+]
+STREETS = ["rue de la République", "avenue Victor Hugo", "boulevard Gambetta", "rue Pasteur", "place du Marché",
+           "rue des Écoles", "avenue Jean Jaurès", "rue du Moulin", "quai de la Loire", "impasse des Lilas"]
+FIRST_NAMES = ["Camille", "Louis", "Léa", "Hugo", "Chloé", "Lucas", "Manon", "Nathan", "Inès", "Jules", "Sarah", "Adam"]
+LAST_NAMES = ["Martin", "Bernard", "Dubois", "Thomas", "Robert", "Richard", "Petit", "Durand", "Leroy", "Moreau"]
+SPECIALIZATIONS = ["Plomberie", "Électricité", "Peinture", "Serrurerie", "Jardinage", "Ménage", "Chauffage"]
+ADJECTIVES = ["lumineux", "rénové", "calme", "spacieux", "proche des transports", "avec balcon", "sur cour"]
+MESSAGES = [
+    "Bonjour, le locataire signale une fuite dans la salle de bain.",
+    "Je peux passer jeudi matin, cela vous convient-il ?",
+    "Merci, c'est noté.",
+    "Voici le devis pour l'intervention.",
+    "L'intervention est terminée, tout fonctionne.",
+    "Pouvez-vous confirmer l'accès au logement ?",
+]
+REPORTS = [
+    "Remplacement du joint et contrôle de l'étanchéité.",
+    "Mise aux normes du tableau électrique.",
+    "Peinture du séjour, deux couches.",
+    "Changement du cylindre de la porte d'entrée.",
+]
+
+
+def _batched(objects):
+    return [objects[start:start + BATCH_SIZE] for start in range(0, len(objects), BATCH_SIZE)]
+
+
+def _bulk_create(model, objects):
+    created = []
+    for batch in _batched(objects):
+        created += model.objects.bulk_create(batch)
+    return created
+
+
+def _placeholder_image() -> str:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (640, 480), (200, 190, 170)).save(buffer, "JPEG")
+    return blob_storage().save("biens/demo.jpg", ContentFile(buffer.getvalue()))
+
+
+def _users(scale, prefix, rng):
+    password = make_password(PASSWORD)
+    specializations = []
+    for name in SPECIALIZATIONS:
+        specializations.append(Specialization.objects.get_or_create(name=name)[0])
+
+    def user(role, index):
+        username = f"{prefix}-{role.lower()}-{index}"
+        return User(
+            username=username,
+            search_name=normalize(username),
+            first_name=rng.choice(FIRST_NAMES),
+            last_name=rng.choice(LAST_NAMES),
+            email=f"{username}@example.com",
+            password=password,
+            role=role,
+        )
+
+    owners = _bulk_create(User, [user(User.Role.PROPRIETAIRE, index) for index in range(scale.owners)])
+    prestataires = [user(User.Role.PRESTATAIRE, index) for index in range(scale.prestataires)]
+    chosen = []
+    for prestataire in prestataires:
+        chosen.append(rng.sample(specializations, rng.randint(1, 2)))
+        prestataire.specialization = ", ".join(item.name for item in sorted(chosen[-1], key=lambda item: item.name))
+    prestataires = _bulk_create(User, prestataires)
+    links = [
+        User.specializations.through(user_id=prestataire.pk, specialization_id=item.pk)
+        for prestataire, items in zip(prestataires, chosen)
+        for item in items
+    ]
+    _bulk_create(User.specializations.through, links)
+    return owners, prestataires
+
+
+def _biens(scale, owners, rng):
+    biens = []
+    for owner in owners:
+        for _ in range(scale.biens_per_owner):
+            city, latitude, longitude = rng.choice(CITIES)
+            property_type = rng.choice(Bien.PropertyType.values)
+            latitude += rng.uniform(-0.05, 0.05)
+            longitude += rng.uniform(-0.05, 0.05)
+            for_sale = rng.random() < 0.2
+            label = Bien.PropertyType(property_type).label
+            biens.append(Bien(
+                owner=owner,
+                title=f"{label} {rng.choice(ADJECTIVES)} à {city}",
+                property_type=property_type,
+                listing_status=Bien.ListingStatus.VENTE if for_sale else Bien.ListingStatus.LOCATION,
+                furnished="MEUBLE" in property_type,
+                price=Decimal(rng.randrange(80_000, 900_000, 1000) if for_sale else rng.randrange(350, 2500, 10)),
+                address=f"{rng.randint(1, 150)} {rng.choice(STREETS)}, {city}",
+                description=f"{label} de {rng.randint(15, 180)} m², {rng.choice(ADJECTIVES)}.",
+                latitude=latitude,
+                longitude=longitude,
+                geohash=geo.encode(latitude, longitude),
+            ))
+    with transaction.atomic():
+        biens = _bulk_create(Bien, biens)
+        fulltext.index_biens(biens)
+    return biens
+
+
+def _media(scale, biens):
+    if not scale.media_per_bien:
+        return 0
+    name = _placeholder_image()
+    size = blob_storage().size(name)
+    rows = [
+        BienMedia(bien=bien, file=name, media_kind=BienMedia.MediaKind.IMAGE, size=size, width=640, height=480)
+        for bien in biens
+        for _ in range(scale.media_per_bien)
+    ]
+    _bulk_create(BienMedia, rows)
+    blobs.retain(name, count=len(rows))
+    return len(rows)
+
+
+def _assignments(biens, prestataires, rng):
+    assignments = [
+        PrestataireAssignment(bien=bien, prestataire=rng.choice(prestataires))
+        for bien in biens
+        if rng.random() < 0.7
+    ]
+    return _bulk_create(PrestataireAssignment, assignments)
+
+
+def _contracts_and_payments(scale, biens, assignments, rng, today):
+    rented = [bien for bien in biens if bien.listing_status == Bien.ListingStatus.LOCATION]
+    contracts = []
+    for bien in rented:
+        if rng.random() >= scale.contract_ratio:
+            continue
+        start = (today - timedelta(days=rng.randint(30 * scale.payment_months, 30 * scale.payment_months * 3))).replace(day=1)
+        contracts.append(Contract(
+            bien=bien,
+            owner_id=bien.owner_id,
+            tenant_name=f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            start_date=start,
+            rent=bien.price or Decimal(800),
+            status=Contract.Status.ACTIVE,
+        ))
+    contracts = _bulk_create(Contract, contracts)
+    this_month = today.replace(day=1)
+    payments = []
+    for contract in contracts:
+        month = this_month
+        for age in range(scale.payment_months):
+            due_date = month + timedelta(days=4)
+            if age == 0:
+                status = Payment.Status.PENDING
+            else:
+                status = Payment.Status.LATE if rng.random() < 0.05 else Payment.Status.PAID
+            payments.append(Payment(
+                contract=contract,
+                bien_id=contract.bien_id,
+                amount=contract.rent,
+                due_date=due_date,
+                status=status,
+                payment_type=Payment.PaymentType.LOYER,
+                period=month,
+            ))
+            month = (month - timedelta(days=1)).replace(day=1)
+    for assignment in assignments:
+        payments.append(Payment(
+            bien_id=assignment.bien_id,
+            prestataire_id=assignment.prestataire_id,
+            amount=Decimal(rng.randrange(60, 1500, 5)),
+            due_date=today - timedelta(days=rng.randint(0, 30 * scale.payment_months)),
+            status=Payment.Status.PAID if rng.random() < 0.8 else Payment.Status.PENDING,
+            payment_type=Payment.PaymentType.PRESTATAIRE,
+        ))
+    return contracts, _bulk_create(Payment, payments)
+
+
+def _threads(scale, owners, prestataires, assignments, rng):
+    partners = {}
+    for assignment in assignments:
+        partners.setdefault(assignment.bien.owner_id, set()).add(assignment.prestataire_id)
+    prestataire_ids = [prestataire.pk for prestataire in prestataires]
+    threads = {}
+    for owner in owners:
+        chosen = sorted(partners.get(owner.pk, ()))[:scale.threads_per_owner]
+        while len(chosen) < min(scale.threads_per_owner, len(prestataire_ids)):
+            candidate = rng.choice(prestataire_ids)
+            if candidate not in chosen:
+                chosen.append(candidate)
+        for prestataire_id in chosen:
+            threads[Conversation.pair(owner.pk, prestataire_id)] = None
+    created = _bulk_create(Conversation, [Conversation(user_low_id=low, user_high_id=high) for low, high in threads])
+    messages = []
+    for thread in created:
+        for _ in range(scale.messages_per_thread):
+            sender, receiver = (thread.user_low_id, thread.user_high_id)
+            if rng.random() < 0.5:
+                sender, receiver = receiver, sender
+            messages.append(Message(
+                sender_id=sender,
+                receiver_id=receiver,
+                content=rng.choice(MESSAGES),
+                kind=Message.Kind.DEVIS if rng.random() < 0.05 else Message.Kind.TEXTE,
+                conversation=thread,
+            ))
+    messages = _bulk_create(Message, messages)
+    for index, thread in enumerate(created):
+        last = messages[(index + 1) * scale.messages_per_thread - 1]
+        thread.last_message = last
+        thread.last_message_preview = conversations.preview(last)
+        thread.last_activity = last.created_at
+        unread = rng.randint(0, 3)
+        if last.receiver_id == thread.user_low_id:
+            thread.unread_low = unread
+        else:
+            thread.unread_high = unread
+    for batch in _batched(created):
+        Conversation.objects.bulk_update(
+            batch, ["last_message", "last_message_preview", "last_activity", "unread_low", "unread_high"]
+        )
+    return messages
+
+
+def _reports(scale, assignments, rng):
+    reports = [
+        InterventionReport(bien_id=assignment.bien_id, prestataire_id=assignment.prestataire_id, summary=rng.choice(REPORTS))
+        for assignment in assignments
+        if rng.random() < scale.report_ratio
+    ]
+    return _bulk_create(InterventionReport, reports)
+
+
+def generate(scale="small", seed=0, prefix="demo", today=None) -> dict:
+    """Create one data set; returns the number of rows per model."""
+    if isinstance(scale, str):
+        scale = SCALES[scale]
+    rng = random.Random(seed)
+    today = today or date.today()
+    owners, prestataires = _users(scale, prefix, rng)
+    biens = _biens(scale, owners, rng)
+    media_count = _media(scale, biens)
+    assignments = _assignments(biens, prestataires, rng)
+    contracts, payments = _contracts_and_payments(scale, biens, assignments, rng, today)
+    messages = _threads(scale, owners, prestataires, assignments, rng)
+    reports = _reports(scale, assignments, rng)
+    ledger.rebuild(owner_ids=[owner.pk for owner in owners])
+    marketplace.invalidate()
+    return {
+        "proprietaires": len(owners),
+        "prestataires": len(prestataires),
+        "biens": len(biens),
+        "medias": media_count,
+        "affectations": len(assignments),
+        "contrats": len(contracts),
+        "paiements": len(payments),
+        "messages": len(messages),
+        "rapports": len(reports),
+    }
+
+
+def exists(prefix="demo") -> bool:
+    return User.objects.filter(username__startswith=f"{prefix}-").exists()
+
+
+def sample_users(prefix="demo") -> dict:
+    """The users ``PAGES`` are requested as, and the URL arguments."""
+    thread = (
+        Conversation.objects.filter(user_low__role=User.Role.PROPRIETAIRE, user_low__username__startswith=f"{prefix}-")
+        .order_by("-last_activity", "-id")
+        .first()
+    )
+    return {
+        "owner": thread.user_low,
+        "prestataire": User.objects.filter(missions__active=True, username__startswith=f"{prefix}-").first(),
+        "partner": thread.other_id(thread.user_low_id),
+    }
@@ -0,0 +1,109 @@
+"""
+``{% cachedfor %}``: a ``{% for %}`` loop whose rendered rows are cached.
+
+    {% load fragment_tags %}
+    {% cachedfor contract in contrats depends contract.bien %}
+        ...
+    {% empty %}
+        ...
+    {% endcachedfor %}
+
+Each row is cached under the identity and ``updated_at`` of the loop object
+and of the attributes listed after ``depends`` (model instances; other
+values count by their text), so it is only rendered again once one of them
+changes; the rows of a loop are fetched with a single ``get_many``. The key
+also holds a hash of the row's template source, so editing the template
+drops its fragments. A row may only use these values (not ``request``,
+``user`` or ``forloop``); rows whose instances have no ``updated_at`` are
+rendered every time.
+"""
+import hashlib
+
+from django import template
+from django.core.cache import cache
+from django.utils import translation
+from django.utils.safestring import mark_safe
+
+from gp_immo import metrics
+
+register = template.Library()
+
+FRAGMENT_TIMEOUT = 24 * 60 * 60
+
+
+def _lookup(obj, path):
+    for name in path:
+        obj = getattr(obj, name, None)
+    return obj
+
+
+class CachedForNode(template.Node):
+    def __init__(self, loopvar, sequence, depends, nodelist, empty, fragment):
+        self.loopvar = loopvar
+        self.sequence = sequence
+        self.depends = depends
+        self.nodelist = nodelist
+        self.empty = empty
+        self.fragment = fragment
+
+    def key(self, prefix, item):
+        parts = [prefix]
+        for obj in [item, *(_lookup(item, path) for path in self.depends)]:
+            if not hasattr(obj, "_meta"):
+                parts.append(repr(obj))
+                continue
+            updated_at = getattr(obj, "updated_at", None)
+            if updated_at is None:
+                return None
+            parts.append(f"{obj._meta.label_lower}.{obj.pk}.{updated_at.timestamp()}")
+        return "fragment:" + hashlib.sha1(":".join(parts).encode()).hexdigest()
+
+    def render(self, context):
+        items = list(self.sequence.resolve(context, ignore_failures=True) or [])
+        if not items:
+            return self.empty.render(context) if self.empty else ""
+        prefix = f"{self.fragment}:{translation.get_language()}:{context.autoescape}"
+        keys = [self.key(prefix, item) for item in items]
+        cached = cache.get_many([key for key in keys if key])
+        metrics.record_cache("fragments", hits=len(cached), misses=len(items) - len(cached))
+        rows, missing = [], {}
+        with context.push():
+            for item, key in zip(items, keys):
+                row = cached.get(key)
+                if row is None:
+                    context[self.loopvar] = item
+                    row = self.nodelist.render(context)
+                    if key:
+                        missing[key] = row
+                rows.append(row)
+        if missing:
+            cache.set_many(missing, FRAGMENT_TIMEOUT)
+        return mark_safe("".join(rows))
+
+
+@register.tag
+def cachedfor(parser, token):
+    bits = token.split_contents()
+    if len(bits) < 4 or bits[2] != "in" or (len(bits) > 4 and (bits[4] != "depends" or len(bits) == 5)):
+        raise template.TemplateSyntaxError("Syntaxe attendue : {% cachedfor objet in liste [depends objet.attribut ...] %}")
+    depends = [bit.split(".")[1:] for bit in bits[5:]]
+    if any(bit.split(".")[0] != bits[1] or not path for bit, path in zip(bits[5:], depends)):
+        raise template.TemplateSyntaxError(f"{{% cachedfor %}} : depends attend des attributs de « {bits[1]} ».")
+    pending = list(parser.tokens)
+    nodelist = parser.parse(("empty", "endcachedfor"))
+    # parser.tokens is a reversed stack: the row's tokens are the ones parse() popped.
+    row_tokens = reversed(pending[len(parser.tokens):])
+    source = hashlib.sha1("".join(f"{t.token_type}{t.contents}" for t in row_tokens).encode()).hexdigest()
+    origin = getattr(parser.origin, "template_name", None) or ""
+    empty = None
+    if parser.next_token().contents == "empty":
+        empty = parser.parse(("endcachedfor",))
+        parser.delete_first_token()
+    return CachedForNode(
+        bits[1],
+        parser.compile_filter(bits[3]),
+        depends,
+        nodelist,
+        empty,
+        f"{origin}:{token.lineno}:{source}",
+    )
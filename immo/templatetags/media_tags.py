@@ -0,0 +1,31 @@
+from django import template
+
+from ..media import best_variant
+from ..models import BienMediaVariant
+
+register = template.Library()
+
+
+@register.inclusion_tag("immo/_responsive_image.html")
+def responsive_image(media, width=640, sizes=None, alt=""):
+    """
+    ``<picture>`` of a BienMedia image: WebP and JPEG srcsets so the browser
+    downloads the smallest variant for its layout, with the JPEG variant
+    closest to ``width`` as fallback and the original until variants exist.
+    """
+    variants = sorted(media.variants.all(), key=lambda variant: variant.width)
+    fallback = best_variant(media, width)
+    return {
+        "media": media,
+        "alt": alt,
+        "sizes": sizes or f"{width}px",
+        "src": fallback.file.url if fallback else media.file.url,
+        "width": fallback.width if fallback else media.width,
+        "height": fallback.height if fallback else media.height,
+        "webp": ", ".join(
+            f"{v.file.url} {v.width}w" for v in variants if v.format == BienMediaVariant.Format.WEBP
+        ),
+        "jpeg": ", ".join(
+            f"{v.file.url} {v.width}w" for v in variants if v.format == BienMediaVariant.Format.JPEG
+        ),
+    }
@@ -1,3 +1,1125 @@
-from django.test import TestCase
+import asyncio
+import contextvars
+import hashlib
+import io
+import shutil
+import tempfile
+import threading
+from concurrent.futures import Future
+from unittest import mock
+from datetime import date, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponse, QueryDict
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from accounts import taxonomy
+from accounts.models import Specialization, User
+from gp_immo import db, writequeue
+from gp_immo.metrics import registry
+from . import (
+    api, billing, blobs, conversations, dashboard, fulltext, geo, ledger, marketplace, media, portfolio, realtime, search,
+    statements, sync, synthetic, uploads,
+)
+from .models import (
+    Bien, BienMedia, BienMediaVariant, Contract, Conversation, InterventionReport, LedgerEntry, MediaBlob, Message,
+    OwnerStatement, Payment, PrestataireAssignment, UploadSession,
+)
+from .pagination import InvalidCursor, decode_cursor, encode_cursor
+from .storage import blob_storage
+from .synthetic import PAGES
+
+MEDIA_ROOT = tempfile.mkdtemp(prefix="gp_immo-tests-")
+
+
+def make_user(username, role=User.Role.PROPRIETAIRE, **fields):
+    return User.objects.create_user(username, role=role, **fields)
+
+
+def make_bien(owner, title="Bien", **fields):
+    fields.setdefault("property_type", Bien.PropertyType.MAISON)
+    return Bien.objects.create(owner=owner, title=title, **fields)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, GP_IMMO_DB_REPLICAS=[], GP_IMMO_SQLITE_WRITE_QUEUE=False)
+class PageQueriesTests(TestCase):
+    """The SQL queries of the main pages must not grow with the data."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.addClassCleanup(shutil.rmtree, MEDIA_ROOT, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        synthetic.generate("small", prefix="test")
+        cls.users = synthetic.sample_users("test")
+
+    def assertPageQueries(self, page):
+        user_key, url, queries = PAGES[page]
+        self.client.force_login(self.users[user_key])
+        cache.clear()
+        with self.assertNumQueries(queries):
+            response = self.client.get(url.format(partner=self.users["partner"]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_dashboard(self):
+        self.assertPageQueries("dashboard")
+
+    def test_dashboard_prestataire(self):
+        self.assertPageQueries("dashboard_prestataire")
+
+    def test_biens_list(self):
+        self.assertPageQueries("biens_list")
+
+    def test_marketplace(self):
+        self.assertPageQueries("marketplace")
+
+    def test_inbox(self):
+        self.assertPageQueries("inbox")
+
+    def test_conversation(self):
+        self.assertPageQueries("conversation")
+
+    def test_payment_create(self):
+        self.assertPageQueries("payment_create")
+
+
+class ImportBiensTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user("import-owner", role=User.Role.PROPRIETAIRE)
+
+    def upload(self, name, content):
+        return SimpleUploadedFile(name, content)
+
+    def test_invalid_rows_are_reported_and_skipped(self):
+        content = "title;property_type;price\nStudio;Studio meublé;450\n;Maison;12\nT2;Appartement meublé;abc\n"
+        report = portfolio.import_biens(self.owner, self.upload("biens.csv", content.encode()))
+        self.assertEqual(report.created, 1)
+        self.assertEqual([line for line, _ in report.errors], [3, 4])
+
+    def test_unreadable_file_keeps_the_saved_batches(self):
+        rows = "".join(f"Bien {index};Maison;{index}\n" for index in range(2000))
+        content = f"title;property_type;price\n{rows}".encode() + b"\xff\xfe;Maison;1\n"
+        with self.assertRaises(portfolio.PortfolioError) as raised:
+            portfolio.import_biens(self.owner, self.upload("biens.csv", content), batch_size=100)
+        created = Bien.objects.filter(owner=self.owner).count()
+        self.assertGreater(created, 0)
+        self.assertEqual(raised.exception.report.created, created)
+
+    def test_xlsx_round_trip(self):
+        Bien.objects.create(owner=self.owner, title="Loft", property_type=Bien.PropertyType.MAISON)
+        response = portfolio.export_response(Bien.objects.filter(owner=self.owner), "biens", "xlsx")
+        content = b"".join(response.streaming_content)
+        report = portfolio.import_biens(self.owner, self.upload("biens.xlsx", content))
+        self.assertEqual((report.created, report.error_count), (1, 0))
+        self.assertEqual(Bien.objects.filter(owner=self.owner, title="Loft").count(), 2)
+
+
+class AsyncMiddlewareTests(TestCase):
+    def test_asgi_chain_is_not_adapted_to_sync(self):
+        with override_settings(DEBUG=True), self.assertNoLogs("django.request", "DEBUG"):
+            ASGIHandler()
+
+    async def test_async_view_is_measured(self):
+        user = await User.objects.acreate(username="async-owner", role=User.Role.PROPRIETAIRE)
+        await self.async_client.aforce_login(user)
+        response = await self.async_client.get("/messagerie/flux/", {"after": "0", "wait": "0"})
+        self.assertEqual(response.status_code, 200)
+        queries = registry.histograms["gp_immo_request_queries", (("view", "message_events"),)]
+        self.assertGreater(queries.sum, 0)
+
+
+class RealtimeTests(TestCase):
+    def test_websocket_origin_must_match_the_host(self):
+        self.assertTrue(realtime._origin_allowed("https://gp-immo.fr", "gp-immo.fr"))
+        self.assertTrue(realtime._origin_allowed(None, "gp-immo.fr"))
+        self.assertFalse(realtime._origin_allowed("https://evil.example", "gp-immo.fr"))
+        self.assertFalse(realtime._origin_allowed("https://gp-immo.fr.evil.example", "gp-immo.fr"))
+        with override_settings(GP_IMMO_WS_ALLOWED_ORIGINS=["https://app.gp-immo.fr"]):
+            self.assertTrue(realtime._origin_allowed("https://app.gp-immo.fr", "api.gp-immo.fr"))
+
+    async def test_typing_only_reaches_conversation_partners(self):
+        owner = await User.objects.acreate(username="rt-owner", role=User.Role.PROPRIETAIRE)
+        partner = await User.objects.acreate(username="rt-partner", role=User.Role.PRESTATAIRE)
+        stranger = await User.objects.acreate(username="rt-stranger", role=User.Role.PRESTATAIRE)
+        low, high = Conversation.pair(owner.pk, partner.pk)
+        await Conversation.objects.acreate(user_low_id=low, user_high_id=high)
+        partner_events, stranger_events = realtime.subscribe(partner.pk), realtime.subscribe(stranger.pk)
+        try:
+            for target in (partner, stranger):
+                await realtime._handle_client_event(owner, f'{{"type": "typing", "to": {target.pk}}}', set())
+            await asyncio.sleep(0)
+            self.assertEqual(partner_events.drain(), [{"type": "typing", "from": owner.pk}])
+            self.assertEqual(stranger_events.drain(), [])
+        finally:
+            partner_events.close()
+            stranger_events.close()
+
+    async def test_typing_fallback_only_reaches_conversation_partners(self):
+        owner = await User.objects.acreate(username="rt-owner", role=User.Role.PROPRIETAIRE)
+        partner = await User.objects.acreate(username="rt-partner", role=User.Role.PRESTATAIRE)
+        stranger = await User.objects.acreate(username="rt-stranger", role=User.Role.PRESTATAIRE)
+        low, high = Conversation.pair(owner.pk, partner.pk)
+        await Conversation.objects.acreate(user_low_id=low, user_high_id=high)
+        await self.async_client.aforce_login(owner)
+        partner_events, stranger_events = realtime.subscribe(partner.pk), realtime.subscribe(stranger.pk)
+        try:
+            response = await self.async_client.post(f"/messagerie/{partner.pk}/signal/", {"type": "typing"})
+            self.assertEqual(response.status_code, 204)
+            response = await self.async_client.post(f"/messagerie/{stranger.pk}/signal/", {"type": "typing"})
+            self.assertEqual(response.status_code, 404)
+            await asyncio.sleep(0)
+            self.assertEqual(partner_events.drain(), [{"type": "typing", "from": owner.pk}])
+            self.assertEqual(stranger_events.drain(), [])
+        finally:
+            partner_events.close()
+            stranger_events.close()
+
+
+class GenerateRentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user("rent-owner", role=User.Role.PROPRIETAIRE)
+        bien = Bien.objects.create(owner=owner, title="T3", property_type=Bien.PropertyType.MAISON)
+        cls.contracts = [
+            Contract.objects.create(
+                bien=bien, owner=owner, tenant_name=f"Locataire {index}", start_date=date(2024, 1, 15),
+                rent=Decimal("800"), status=Contract.Status.ACTIVE,
+            )
+            for index in range(3)
+        ]
+
+    def test_counts_only_the_inserted_payments(self):
+        contract = self.contracts[0]
+        Payment.objects.create(
+            contract=contract, bien=contract.bien, amount=contract.rent, due_date=date(2024, 3, 15),
+            payment_type=Payment.PaymentType.LOYER, period=date(2024, 3, 1),
+        )
+        self.assertEqual(billing.generate_rent(date(2024, 3, 1), chunk_size=2), 2)
+        self.assertEqual(billing.generate_rent(date(2024, 3, 1), chunk_size=2), 0)
+        self.assertEqual(Payment.objects.filter(period=date(2024, 3, 1)).count(), 3)
+
+    def test_due_date_follows_the_contract_day(self):
+        self.assertEqual(billing.rent_due_date(date(2024, 1, 31), date(2024, 2, 1)), date(2024, 2, 29))
+        self.assertEqual(billing.rent_due_date(date(2024, 3, 20), date(2024, 3, 1)), date(2024, 3, 20))
+        self.assertEqual(billing.rent_due_date(date(2024, 1, 15), date(2024, 4, 1)), date(2024, 4, 15))
+
+    def test_mark_overdue_moves_the_ledger(self):
+        billing.generate_rent(date(2024, 3, 1))
+        owner = self.contracts[0].owner
+        self.assertEqual(billing.mark_overdue(date(2024, 3, 15)), 0)
+        self.assertEqual(billing.mark_overdue(date(2024, 3, 16)), 3)
+        self.assertEqual(billing.mark_overdue(date(2024, 3, 16)), 0)
+        entry = LedgerEntry.objects.get(owner=owner, month=date(2024, 3, 1))
+        self.assertEqual((entry.status, entry.total, entry.count), (Payment.Status.LATE, Decimal("2400"), 3))
+
+
+class GeoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user("geo-owner", role=User.Role.PROPRIETAIRE)
+        cls.paris = Bien.objects.create(
+            owner=owner, title="Paris", property_type=Bien.PropertyType.MAISON, latitude=48.8566, longitude=2.3522
+        )
+        Bien.objects.create(
+            owner=owner, title="Lyon", property_type=Bien.PropertyType.MAISON, latitude=45.7640, longitude=4.8357
+        )
+
+    def test_map_returns_the_biens_of_the_cover(self):
+        response = self.client.get("/annonces/carte/", {"bbox": "48.8,2.2,48.9,2.4"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([bien["id"] for bien in response.json()["biens"]], [self.paris.pk])
+
+    def test_map_rejects_invalid_bboxes(self):
+        for bbox in ("-90000,-180000,90000,180000", "-inf,0,1,1", "nan,0,1,1", "1,2,3", "49,2,48,3", "a,b,c,d"):
+            with self.subTest(bbox=bbox):
+                self.assertEqual(self.client.get("/annonces/carte/", {"bbox": bbox}).status_code, 400)
+
+    def test_cover_is_bounded(self):
+        self.assertLessEqual(len(geo.cover(-90000, -180000, 90000, 180000)), len(geo.BASE32))
+        with self.assertRaises(ValueError):
+            geo.cover(float("-inf"), 0, 1, 1)
+
+    def test_nearby(self):
+        response = self.client.get("/annonces/proximite/", {"lat": "48.85", "lng": "2.35", "km": "5"})
+        self.assertEqual([bien["id"] for bien in response.json()["biens"]], [self.paris.pk])
+        for params in ({"lat": "48.85", "lng": "2.35", "km": "nan"}, {"lat": "nan", "lng": "2.35"},
+                       {"lat": "48.85", "lng": "inf"}, {"lat": "91", "lng": "0"}, {"lat": "48.85", "lng": "2.35", "km": "0"}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get("/annonces/proximite/", params).status_code, 400)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class BlobTests(TestCase):
+    def save(self, data=b"contenu"):
+        return blob_storage().save("photo.jpg", ContentFile(data))
+
+    def test_blob_is_deleted_with_its_last_reference(self):
+        name = self.save()
+        blobs.retain(name)
+        blobs.retain(name)
+        with self.captureOnCommitCallbacks(execute=True):
+            blobs.release(name)
+        self.assertTrue(blob_storage().exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            blobs.release(name)
+        self.assertFalse(blob_storage().exists(name))
+        self.assertFalse(MediaBlob.objects.filter(name=name).exists())
+
+    def test_same_content_is_stored_once(self):
+        self.assertEqual(self.save(b"double"), self.save(b"double"))
+
+    def test_reference_taken_before_the_deletion_keeps_the_file(self):
+        name = self.save()
+        blobs.retain(name)
+        with self.captureOnCommitCallbacks() as callbacks:
+            blobs.release(name)
+        blobs.retain(name)
+        for callback in callbacks:
+            callback()
+        self.assertTrue(blob_storage().exists(name))
+        self.assertEqual(MediaBlob.objects.get(name=name).refcount, 1)
+
+    def test_file_deleted_after_save_found_it_is_written_again(self):
+        name = self.save()
+        blobs.retain(name)
+        self.assertEqual(self.save(), name)  # a second upload reuses the file on disk...
+        with self.captureOnCommitCallbacks(execute=True):
+            blobs.release(name)  # ...which loses its last reference before retain() runs
+        blobs.retain(name, content=ContentFile(b"contenu"))
+        self.assertTrue(blob_storage().exists(name))
+        self.assertEqual(MediaBlob.objects.get(name=name).refcount, 1)
+
+    def test_saving_a_row_restores_a_blob_deleted_meanwhile(self):
+        owner = User.objects.create_user("blob-owner", role=User.Role.PROPRIETAIRE)
+        bien = Bien.objects.create(owner=owner, title="T1", property_type=Bien.PropertyType.MAISON)
+        storage = blob_storage()
+        save = storage.save
+        lost = []
+
+        def save_then_lose(name, content, max_length=None):
+            name = save(name, content, max_length=max_length)
+            if not lost:
+                # Another row releases the same content right after the storage found it.
+                storage.delete(name)
+                lost.append(name)
+            return name
+
+        with mock.patch.object(storage, "save", side_effect=save_then_lose):
+            media = BienMedia.objects.create(bien=bien, file=ContentFile(b"video", name="visite.txt"))
+        with storage.open(media.file.name) as handle:
+            self.assertEqual(handle.read(), b"video")
+        self.assertEqual(MediaBlob.objects.get(name=media.file.name).refcount, 1)
+
+
+class InboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(f"inbox-{index}", role=User.Role.PROPRIETAIRE) for index in range(7)]
+        cls.user = cls.users[3]
+        start = timezone.now()
+        for minutes, other in enumerate(cls.users[:3] + cls.users[4:]):
+            low, high = Conversation.pair(cls.user.pk, other.pk)
+            Conversation.objects.create(user_low_id=low, user_high_id=high, last_activity=start + timedelta(minutes=minutes))
+
+    def test_pages_merge_both_sides_of_the_pair(self):
+        expected = list(
+            Conversation.objects.filter(Q(user_low=self.user) | Q(user_high=self.user))
+            .order_by("-last_activity", "-id")
+            .values_list("pk", flat=True)
+        )
+        seen, cursor = [], None
+        while True:
+            page = conversations.inbox_page(self.user, cursor, per_page=2)
+            seen += [thread.pk for thread in page]
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(seen), 6)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(InvalidCursor):
+            conversations.inbox_page(self.user, "pas-un-curseur")
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get("/messagerie/", {"cursor": "pas-un-curseur"}).status_code, 200)
+
+
+class BienSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = make_user("search-owner")
+        for index in range(25):
+            make_bien(
+                cls.owner,
+                f"Bien {index}",
+                property_type=Bien.PropertyType.STUDIO_MEUBLE if index % 2 else Bien.PropertyType.MAISON,
+                furnished=index % 3 == 0,
+                price=Decimal(500 + index),
+            )
+
+    def test_keyset_pages_cover_every_bien_once(self):
+        queryset = Bien.objects.filter(owner=self.owner)
+        seen, cursor = [], None
+        while True:
+            page = search.search_biens(queryset, {}, cursor=cursor, per_page=10)
+            seen += [bien.pk for bien in page]
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, list(queryset.order_by("-created_at", "-id").values_list("pk", flat=True)))
+
+    def test_invalid_cursors(self):
+        for cursor in ("pas-un-curseur", encode_cursor([1]), encode_cursor(["pas une date", 1]), "e30"):
+            with self.subTest(cursor=cursor), self.assertRaises(InvalidCursor):
+                decode_cursor(cursor, Bien, ("created_at", "id"))
+        self.client.force_login(self.owner)
+        response = self.client.get("/biens/", {"cursor": "pas-un-curseur"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["biens"]), search.BIENS_PER_PAGE)
+
+    def test_facets_ignore_their_own_filter(self):
+        filters = {"property_type": Bien.PropertyType.MAISON, "price__gte": Decimal(510)}
+        facets = search.facet_counts(Bien.objects.filter(owner=self.owner), filters)
+        self.assertEqual(facets["property_type"], {Bien.PropertyType.MAISON: 8, Bien.PropertyType.STUDIO_MEUBLE: 7})
+        self.assertEqual(sum(facets["furnished"].values()), 8)
+
+    def test_public_listings(self):
+        response = self.client.get("/annonces/", {"property_type": Bien.PropertyType.STUDIO_MEUBLE})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(all(bien.property_type == Bien.PropertyType.STUDIO_MEUBLE for bien in response.context["biens"]))
+
+
+class FullTextTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = make_user("fts-owner")
+        cls.other = make_user("fts-other")
+        cls.loft = make_bien(cls.owner, "Loft rénové", description="Près de la gare <b>Saint-Éloi</b>", address="Lyon")
+        cls.maison = make_bien(cls.owner, "Maison d'été", address="Évian")
+        make_bien(cls.other, "Loft rénové", address="Paris")
+
+    def titles(self, query, queryset=None):
+        queryset = queryset if queryset is not None else Bien.objects.filter(owner=self.owner)
+        return [bien.title for bien in fulltext.search(query, queryset)]
+
+    def test_accents_and_prefixes(self):
+        self.assertEqual(self.titles("renove"), ["Loft rénové"])
+        self.assertEqual(self.titles("ÉTÉ"), ["Maison d'été"])
+        self.assertEqual(self.titles("evi"), ["Maison d'été"])
+        self.assertEqual(self.titles("loft lyon"), ["Loft rénové"])
+        self.assertEqual(self.titles("loft evian"), [])
+
+    def test_scope_and_index_maintenance(self):
+        self.assertEqual(len(fulltext.search("loft", Bien.objects.all())), 2)
+        self.loft.title = "Duplex"
+        self.loft.save()
+        self.assertEqual(self.titles("loft"), [])
+        self.assertEqual(self.titles("duplex"), ["Duplex"])
+        self.maison.delete()
+        self.assertEqual(self.titles("evian"), [])
+
+    def test_odd_queries_and_snippets(self):
+        self.assertEqual(self.titles(""), [])
+        self.assertEqual(self.titles('" OR * NEAR('), [])
+        [loft] = fulltext.search("eloi", Bien.objects.filter(owner=self.owner))
+        self.assertIn("<mark>", loft.search_snippet)
+        self.assertNotIn("<b>", loft.search_snippet)
+
+
+class MarketplaceSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        plumbing = Specialization.objects.get(name="Plomberie")
+        painting = Specialization.objects.create(name="Peinture")
+        cls.andre = make_user("André", role=User.Role.PRESTATAIRE)
+        cls.andre.specializations.add(painting)
+        cls.bruno = make_user("bruno", role=User.Role.PRESTATAIRE)
+        cls.bruno.specializations.add(plumbing)
+        hidden = make_user("anne", role=User.Role.PRESTATAIRE, marketplace_visible=False)
+        hidden.specializations.add(plumbing)
+        make_user("alain")
+
+    def setUp(self):
+        cache.clear()
+        taxonomy.invalidate()
+
+    def usernames(self, query="", **kwargs):
+        return [user.username for user in marketplace.search_prestataires(query, **kwargs)]
+
+    def test_name_prefix_and_specialization(self):
+        self.assertEqual(self.usernames(), ["André", "bruno"])
+        self.assertEqual(self.usernames("andre"), ["André"])
+        self.assertEqual(self.usernames("plomb"), ["bruno"])
+        self.assertEqual(self.usernames("peintre"), ["André"])
+
+    def test_pages_follow_the_search_name(self):
+        page = marketplace.search_prestataires(per_page=1)
+        self.assertEqual([user.username for user in page], ["André"])
+        self.assertEqual(self.usernames(cursor=page.next_cursor, per_page=1), ["bruno"])
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(InvalidCursor):
+            marketplace.search_prestataires(cursor="pas-un-curseur")
+        self.client.force_login(self.bruno)
+        response = self.client.get("/marketplace/prestataires/", {"q": "plomb", "cursor": "pas-un-curseur"})
+        self.assertContains(response, "bruno")
+
+
+class DashboardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = make_user("dash-owner")
+        cls.prestataire = make_user("dash-prestataire", role=User.Role.PRESTATAIRE)
+        cls.bien = make_bien(cls.owner, "Villa")
+
+    def setUp(self):
+        cache.clear()
+
+    def test_warm_panels_cost_no_query(self):
+        dashboard.panels(self.owner)
+        with self.assertNumQueries(0):
+            panels = dashboard.panels(self.owner)
+        self.assertEqual(set(panels), set(dashboard.OWNER_PANELS))
+        self.assertEqual(panels["biens"], [self.bien])
+
+    def test_changes_refresh_only_their_panels(self):
+        dashboard.panels(self.owner)
+        dashboard.panels(self.prestataire)
+        with self.captureOnCommitCallbacks(execute=True):
+            bien = make_bien(self.owner, "Studio")
+        self.assertEqual(dashboard.panels(self.owner)["biens"], [bien, self.bien])
+        with self.captureOnCommitCallbacks(execute=True):
+            message = Message.objects.create(sender=self.owner, receiver=self.prestataire, content="Bonjour")
+        self.assertEqual(dashboard.panels(self.owner)["last_messages"], [message])
+        self.assertEqual(dashboard.panels(self.prestataire)["last_messages"], [message])
+        with self.assertNumQueries(0):
+            dashboard.panels(self.owner)
+
+    def test_invalidation_waits_for_the_commit(self):
+        dashboard.panels(self.owner)
+        with self.captureOnCommitCallbacks() as callbacks:
+            make_bien(self.owner, "Studio")
+        self.assertEqual(dashboard.panels(self.owner)["biens"], [self.bien])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(len(dashboard.panels(self.owner)["biens"]), 2)
+
+
+class LedgerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = make_user("ledger-owner")
+        cls.bien = make_bien(cls.owner, "T2")
+        cls.contract = Contract.objects.create(
+            bien=cls.bien, owner=cls.owner, tenant_name="Locataire", start_date=date(2024, 1, 1), rent=Decimal("700"),
+        )
+
+    def pay(self, amount, due_date=date(2024, 3, 5), **fields):
+        fields.setdefault("payment_type", Payment.PaymentType.LOYER)
+        return Payment.objects.create(contract=self.contract, amount=Decimal(amount), due_date=due_date, **fields)
+
+    def slices(self):
+        return {
+            (entry.month, entry.status): (entry.total, entry.count)
+            for entry in LedgerEntry.objects.filter(owner=self.owner)
+        }
+
+    def test_payments_move_between_slices(self):
+        march, april = date(2024, 3, 1), date(2024, 4, 1)
+        first = self.pay("700")
+        self.pay("50", due_date=date(2024, 3, 20))
+        self.assertEqual(self.slices(), {(march, Payment.Status.PENDING): (Decimal("750"), 2)})
+        first.status = Payment.Status.PAID
+        first.save()
+        self.assertEqual(self.slices(), {
+            (march, Payment.Status.PENDING): (Decimal("50"), 1),
+            (march, Payment.Status.PAID): (Decimal("700"), 1),
+        })
+        first.due_date, first.amount = date(2024, 4, 5), Decimal("720")
+        first.save()
+        first.delete()
+        self.assertEqual(self.slices(), {(march, Payment.Status.PENDING): (Decimal("50"), 1)})
+        self.pay("10", due_date=date(2024, 4, 30))
+        self.assertEqual(self.slices()[april, Payment.Status.PENDING], (Decimal("10"), 1))
+
+    def test_rebuild_matches_the_signals(self):
+        self.pay("700")
+        self.pay("100", due_date=date(2024, 5, 1), status=Payment.Status.LATE)
+        Payment.objects.create(bien=self.bien, amount=Decimal("30"), payment_type=Payment.PaymentType.PRESTATAIRE, due_date=date(2024, 5, 2))
+        expected = self.slices()
+        Payment.objects.filter(status=Payment.Status.LATE).update(amount=Decimal("999"))
+        self.assertEqual(ledger.rebuild(owner_ids=[self.owner.pk], months=[date(2024, 3, 9)]), 1)
+        self.assertEqual(self.slices()[date(2024, 5, 1), Payment.Status.LATE], (Decimal("100"), 1))
+        self.assertEqual(ledger.rebuild(), 3)
+        expected[date(2024, 5, 1), Payment.Status.LATE] = (Decimal("999"), 1)
+        self.assertEqual(self.slices(), expected)
+
+    def test_rent_roll(self):
+        self.pay("700", status=Payment.Status.PAID)
+        self.pay("700", due_date=date(2024, 4, 5))
+        roll = ledger.rent_roll(self.owner, 2024)
+        [row] = roll["rows"]
+        self.assertEqual(row["months"][2][Payment.Status.PAID], Decimal("700"))
+        self.assertEqual(row["months"][3][Payment.Status.PENDING], Decimal("700"))
+        self.assertEqual(roll["totals"], [("Loyer", {"PENDING": Decimal("700"), "PAID": Decimal("700"), "LATE": 0})])
+
+
+class ConversationHistoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = make_user("history-owner")
+        cls.prestataire = make_user("history-prestataire", role=User.Role.PRESTATAIRE)
+        cls.messages = [
+            Message.objects.create(sender=cls.owner, receiver=cls.prestataire, content=f"Message {index}")
+            for index in range(35)
+        ]
+        Message.objects.create(sender=cls.owner, receiver=make_user("history-other"), content="Ailleurs")
+
+    def setUp(self):
+        self.client.force_login(self.owner)
+
+    def history(self, **params):
+        response = self.client.get(f"/messagerie/{self.prestataire.pk}/", params)
+        self.assertEqual(response.status_code, 200)
+        return response.context
+
+    def test_pages_go_back_in_time(self):
+        latest = self.history()
+        self.assertEqual(latest["messages_qs"], self.messages[5:])
+        self.assertTrue(latest["live"])
+        cursor = QueryDict(latest["older_query"])["cursor"]
+        older = self.history(cursor=cursor)
+        self.assertEqual(older["messages_qs"], self.messages[:5])
+        self.assertIsNone(older["older_query"])
+        self.assertFalse(older["live"])
+
+    def test_invalid_cursor_shows_the_latest_page(self):
+        for cursor in ("pas-un-curseur", encode_cursor(["hier", 1]), encode_cursor([1])):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.history(cursor=cursor)["messages_qs"], self.messages[5:])
+
+
+def png(width, height):
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGBA", (width, height), (200, 30, 30, 128)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, GP_IMMO_MEDIA_WORKERS=0)
+class MediaVariantTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = make_user("media-owner")
+        cls.bien = make_bien(cls.owner, "Loft")
+
+    def upload(self, *files):
+        self.client.force_login(self.owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f"/biens/{self.bien.pk}/medias/", {"files": list(files)})
+        self.assertEqual(response.status_code, 302)
+        return BienMedia.objects.filter(bien=self.bien).order_by("-id")[: len(files)]
+
+    def test_uploaded_image_gets_its_variants(self):
+        [photo] = self.upload(SimpleUploadedFile("salon.png", png(800, 400), content_type="image/png"))
+        self.assertEqual((photo.width, photo.height), (800, 400))
+        variants = sorted((variant.width, variant.height, variant.format) for variant in photo.variants.all())
+        self.assertEqual(variants, [
+            (width, height, image_format)
+            for width, height in ((320, 160), (640, 320), (800, 400))
+            for image_format in sorted(BienMediaVariant.Format.values)
+        ])
+        self.assertEqual(media.best_variant(photo, 500).width, 640)
+        self.assertEqual(media.best_variant(photo, 2000).width, 800)
+        for variant in photo.variants.all():
+            self.assertEqual(MediaBlob.objects.get(name=variant.file.name).refcount, 1)
+
+    def test_rebuilding_replaces_the_variants(self):
+        [photo] = self.upload(SimpleUploadedFile("salon.png", png(300, 300), content_type="image/png"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(media.build_variants(photo.pk), 2)
+        self.assertEqual(photo.variants.count(), 2)
+        for variant in photo.variants.all():
+            self.assertEqual(MediaBlob.objects.get(name=variant.file.name).refcount, 1)
+
+    def test_undecodable_images_and_videos_keep_the_original(self):
+        with self.assertLogs("immo.media", "WARNING"):
+            video, broken = self.upload(
+                SimpleUploadedFile("photo.jpg", b"pas une image", content_type="image/jpeg"),
+                SimpleUploadedFile("visite.mp4", b"video", content_type="video/mp4"),
+            )
+        self.assertFalse(BienMediaVariant.objects.exists())
+        self.assertIsNone(broken.width)
+        self.assertEqual(video.media_kind, BienMedia.MediaKind.VIDEO)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, GP_IMMO_UPLOAD_DIR=f"{MEDIA_ROOT}/uploads", GP_IMMO_MEDIA_WORKERS=0)
+class ChunkedUploadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = make_user("upload-owner")
+        cls.bien = make_bien(cls.owner, "Chalet")
+        cls.data = bytes(range(256)) * (2 * uploads.MIN_CHUNK_SIZE // 256) + b"fin"
+
+    def setUp(self):
+        self.client.force_login(self.owner)
+
+    def open(self, **fields):
+        fields = {
+            "target": UploadSession.Target.BIEN_MEDIA, "bien": self.bien.pk, "filename": "visite.mp4",
+            "size": len(self.data), "content_type": "video/mp4", "chunk_size": uploads.MIN_CHUNK_SIZE, **fields,
+        }
+        return self.client.post("/televersements/", fields)
+
+    def chunk(self, upload_id, index, data=None, sha256=""):
+        size = uploads.MIN_CHUNK_SIZE
+        data = self.data[index * size:(index + 1) * size] if data is None else data
+        return self.client.put(
+            f"/televersements/{upload_id}/morceaux/{index}/", data, content_type="application/octet-stream",
+            headers={"X-Chunk-Sha256": sha256},
+        )
+
+    def test_resumed_upload(self):
+        state = self.open(sha256=hashlib.sha256(self.data).hexdigest()).json()
+        upload_id = state["id"]
+        self.assertEqual(state["chunks"], 3)
+        self.assertEqual(self.chunk(upload_id, 2).status_code, 200)
+        self.assertEqual(self.chunk(upload_id, 0).status_code, 200)
+        response = self.client.post(f"/televersements/{upload_id}/finaliser/")
+        self.assertEqual((response.status_code, response.json()["missing"]), (409, [1]))
+        # The client reconnects and sends what is missing.
+        self.assertEqual(sorted(self.client.get(f"/televersements/{upload_id}/").json()["received"]), ["0", "2"])
+        self.assertEqual(self.chunk(upload_id, 1, sha256="0" * 64).status_code, 400)
+        self.assertEqual(self.chunk(upload_id, 1, self.data[:10]).status_code, 400)
+        checksum = hashlib.sha256(self.data[uploads.MIN_CHUNK_SIZE:2 * uploads.MIN_CHUNK_SIZE]).hexdigest()
+        self.assertEqual(self.chunk(upload_id, 1, sha256=checksum).json()["sha256"], checksum)
+        with self.captureOnCommitCallbacks(execute=True):
+            state = self.client.post(f"/televersements/{upload_id}/finaliser/").json()
+        self.assertEqual(state["status"], UploadSession.Status.TERMINE)
+        item = BienMedia.objects.get(pk=state["media"])
+        self.assertEqual(item.media_kind, BienMedia.MediaKind.VIDEO)
+        with item.file.open("rb") as handle:
+            self.assertEqual(handle.read(), self.data)
+        self.assertFalse(uploads.partial_path(UploadSession.objects.get(pk=upload_id)).exists())
+        self.assertEqual(self.client.post(f"/televersements/{upload_id}/finaliser/").json()["media"], item.pk)
+        self.assertEqual(self.chunk(upload_id, 0).status_code, 400)
+
+    def test_corrupted_file_is_refused(self):
+        upload_id = self.open(sha256="0" * 64).json()["id"]
+        for index in range(3):
+            self.chunk(upload_id, index)
+        response = self.client.post(f"/televersements/{upload_id}/finaliser/")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(BienMedia.objects.exists())
+
+    def test_invalid_sessions(self):
+        self.assertEqual(self.open(content_type="application/pdf").status_code, 400)
+        self.assertEqual(self.open(size=0).status_code, 400)
+        self.assertEqual(self.open(bien=make_bien(make_user("upload-other")).pk).status_code, 404)
+        upload_id = self.open().json()["id"]
+        self.assertEqual(self.chunk(upload_id, 3, b"").status_code, 400)
+        self.client.force_login(make_user("upload-intrus"))
+        self.assertEqual(self.chunk(upload_id, 0).status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class MediaServingTests(TestCase):
+    data = bytes(range(256)) * 4
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = make_user("serving-owner")
+        cls.tenant = make_user("serving-tenant")
+        photo = BienMedia.objects.create(bien=make_bien(cls.owner), file=ContentFile(cls.data, name="facade.jpg"))
+        cls.photo_url = f"/media/{photo.file.name}"
+        message = Message.objects.create(
+            sender=cls.owner, receiver=cls.tenant, attachment=ContentFile(b"bail", name="bail.txt"),
+        )
+        cls.attachment_url = f"/media/{message.attachment.name}"
+
+    def test_whole_file_and_revalidation(self):
+        response = self.client.get(self.photo_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.data)
+        self.assertIn("immutable", response["Cache-Control"])
+        etag = response["ETag"]
+        response = self.client.get(self.photo_url, headers={"If-None-Match": f'"autre", W/{etag}'})
+        self.assertEqual((response.status_code, response["ETag"]), (304, etag))
+        response = self.client.get(self.photo_url, headers={"If-Modified-Since": response["Last-Modified"]})
+        self.assertEqual(response.status_code, 304)
+
+    def test_ranges(self):
+        etag = self.client.head(self.photo_url)["ETag"]
+        cases = [
+            ("bytes=10-19", self.data[10:20], "bytes 10-19/1024"),
+            ("bytes=1000-", self.data[1000:], "bytes 1000-1023/1024"),
+            ("bytes=-4", self.data[-4:], "bytes 1020-1023/1024"),
+            ("bytes=1020-5000", self.data[1020:], "bytes 1020-1023/1024"),
+        ]
+        for header, content, content_range in cases:
+            with self.subTest(header=header):
+                response = self.client.get(self.photo_url, headers={"Range": header, "If-Range": etag})
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response["Content-Range"], content_range)
+                self.assertEqual(b"".join(response.streaming_content), content)
+
+    def test_bad_ranges(self):
+        for header in ("bytes=2000-", "bytes=20-10"):
+            with self.subTest(header=header):
+                response = self.client.get(self.photo_url, headers={"Range": header})
+                self.assertEqual((response.status_code, response["Content-Range"]), (416, "bytes */1024"))
+        for header in ("bytes=0-1,4-5", "octets=0-1", "bytes=-"):
+            with self.subTest(header=header):
+                self.assertEqual(self.client.get(self.photo_url, headers={"Range": header}).status_code, 200)
+        response = self.client.get(self.photo_url, headers={"Range": "bytes=0-1", "If-Range": '"perime"'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_private_files(self):
+        self.assertEqual(self.client.get(self.attachment_url).status_code, 404)
+        self.client.force_login(make_user("serving-stranger"))
+        self.assertEqual(self.client.get(self.attachment_url).status_code, 404)
+        self.client.force_login(self.tenant)
+        response = self.client.get(self.attachment_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Cache-Control"].startswith("private"))
+        self.assertEqual(response["Vary"], "Cookie")
+        self.assertEqual(self.client.get("/media/blobs/inconnu.jpg").status_code, 404)
+
+    @override_settings(GP_IMMO_MEDIA_ACCEL="nginx")
+    def test_offload_to_nginx(self):
+        response = self.client.get(self.photo_url, headers={"Range": "bytes=0-1"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected-media/{self.photo_url.removeprefix('/media/')}")
+        self.assertEqual(response.content, b"")
+
+
+class ApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = make_user("api-owner")
+        cls.prestataire = make_user("api-prestataire", role=User.Role.PRESTATAIRE)
+        cls.biens = [make_bien(cls.owner, f"Bien {index}") for index in range(5)]
+        make_bien(make_user("api-other"), "Ailleurs")
+        PrestataireAssignment.objects.create(bien=cls.biens[0], prestataire=cls.prestataire)
+        PrestataireAssignment.objects.create(bien=cls.biens[1], prestataire=cls.prestataire, active=False)
+
+    def get(self, user, url="/api/v1/biens/", **params):
+        self.client.force_login(user)
+        return self.client.get(url, params)
+
+    def test_requires_authentication(self):
+        self.assertEqual(self.client.get("/api/v1/biens/").status_code, 401)
+
+    def test_scoped_to_the_user(self):
+        titles = [row["title"] for row in self.get(self.owner, page_size=10).json()["results"]]
+        self.assertEqual(titles, [f"Bien {index}" for index in reversed(range(5))])
+        self.assertEqual([row["id"] for row in self.get(self.prestataire).json()["results"]], [self.biens[0].pk])
+        self.assertEqual(self.get(self.prestataire, f"/api/v1/biens/{self.biens[1].pk}/").status_code, 404)
+
+    def test_pages_and_fields(self):
+        seen = []
+        url, params = "/api/v1/biens/", {"page_size": 2, "fields": "id,title"}
+        while url:
+            payload = self.get(self.owner, url, **params).json()
+            seen += payload["results"]
+            url, params = payload["next"], {}
+        self.assertEqual(seen, [{"id": bien.pk, "title": bien.title} for bien in reversed(self.biens)])
+
+    def test_invalid_cursor(self):
+        for cursor in ("pas-un-curseur", encode_cursor(["hier", 1]), encode_cursor([1, 2, 3])):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.get(self.owner, cursor=cursor).status_code, 404)
+
+    def test_etag(self):
+        response = self.get(self.owner)
+        etag = response["ETag"]
+        response = self.client.get("/api/v1/biens/", headers={"If-None-Match": etag})
+        self.assertEqual((response.status_code, response["ETag"]), (304, etag))
+        Bien.objects.filter(pk=self.biens[0].pk).update(title="Renommé")
+        self.assertEqual(self.client.get("/api/v1/biens/", headers={"If-None-Match": etag}).status_code, 200)
+
+
+class SyncTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = make_user("sync-owner")
+        cls.prestataire = make_user("sync-prestataire", role=User.Role.PRESTATAIRE)
+        cls.biens = [make_bien(cls.owner, f"Bien {index}") for index in range(3)]
+        cls.assignment = PrestataireAssignment.objects.create(bien=cls.biens[0], prestataire=cls.prestataire)
+        make_bien(make_user("sync-other"), "Ailleurs")
+        # Older than the overlap window, so a second sync does not send them again.
+        for model in (Bien, PrestataireAssignment):
+            model.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+
+    def sync(self, user, since=None):
+        self.client.force_login(user)
+        response = self.client.get("/api/v1/sync/", {"since": since} if since else {})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def ids(self, payload, name="biens"):
+        return sorted(row["id"] for row in payload["changes"].get(name, []))
+
+    def test_changes_and_deletions_since_the_token(self):
+        first = self.sync(self.owner)
+        self.assertTrue(first["reset"])
+        self.assertEqual(self.ids(first), [bien.pk for bien in self.biens])
+        second = self.sync(self.owner, first["token"])
+        self.assertEqual((second["reset"], second["changes"], second["deleted"]), (False, {}, {}))
+        renamed, deleted = self.biens[1], self.biens[2]
+        renamed.title = "Renommé"
+        renamed.save()
+        deleted_id = deleted.pk
+        deleted.delete()
+        third = self.sync(self.owner, second["token"])
+        self.assertEqual(self.ids(third), [renamed.pk])
+        self.assertEqual(third["deleted"], {"biens": [deleted_id]})
+        # Within the overlap window the row is sent again, the tombstone is not.
+        fourth = self.sync(self.owner, third["token"])
+        self.assertEqual((self.ids(fourth), fourth["deleted"]), ([renamed.pk], {}))
+
+    def test_bien_leaves_the_prestataire_with_its_assignment(self):
+        token = self.sync(self.prestataire)["token"]
+        self.assignment.active = False
+        self.assignment.save()
+        payload = self.sync(self.prestataire, token)
+        self.assertEqual(payload["deleted"], {"biens": [self.biens[0].pk]})
+
+    def test_invalid_tokens_restart_from_scratch(self):
+        token = self.sync(self.owner)["token"]
+        other_token = self.sync(self.prestataire)["token"]
+        for since in (f"{token[:-2]}xx", "pas-un-jeton", other_token):
+            with self.subTest(since=since):
+                payload = self.sync(self.owner, since)
+                self.assertTrue(payload["reset"])
+                self.assertEqual(self.ids(payload), [bien.pk for bien in self.biens])
+
+    def test_batches(self):
+        scopes = {"biens": api.visible_biens(self.owner)}
+        token, seen = None, []
+        while True:
+            payload = sync.changes(self.owner, token, scopes, lambda name, rows: [row.pk for row in rows], batch_size=2)
+            seen += payload["changes"].get("biens", [])
+            token = payload["token"]
+            if not payload["more"]:
+                break
+        self.assertEqual(seen, [bien.pk for bien in self.biens])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class StatementTests(TestCase):
+    month = date(2024, 3, 1)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = make_user("statement-owner", first_name="Awa", last_name="Diop")
+        cls.prestataire = make_user("statement-plombier", role=User.Role.PRESTATAIRE)
+        cls.bien = make_bien(cls.owner, "Villa Almadies")
+        make_bien(cls.owner, "Studio vide")
+        contract = Contract.objects.create(
+            bien=cls.bien, owner=cls.owner, tenant_name="Moussa", start_date=date(2024, 1, 1), rent=Decimal("500"),
+            status=Contract.Status.ACTIVE,
+        )
+        for amount, status, due in (("500", Payment.Status.PAID, 5), ("500", Payment.Status.LATE, 20)):
+            Payment.objects.create(
+                contract=contract, amount=Decimal(amount), status=status, due_date=date(2024, 3, due),
+                payment_type=Payment.PaymentType.LOYER,
+            )
+        Payment.objects.create(
+            bien=cls.bien, prestataire=cls.prestataire, amount=Decimal("120"), due_date=date(2024, 3, 9),
+            payment_type=Payment.PaymentType.PRESTATAIRE,
+        )
+        Payment.objects.create(contract=contract, amount=Decimal("500"), due_date=date(2024, 4, 5), payment_type=Payment.PaymentType.LOYER)
+        InterventionReport.objects.create(bien=cls.bien, prestataire=cls.prestataire, summary="Fuite réparée")
+        make_bien(make_user("statement-other"), "Ailleurs")
+
+    def test_collect(self):
+        with self.assertNumQueries(4):
+            data = statements.collect(self.owner, self.month)
+        self.assertEqual(data["owner"]["name"], "Awa Diop")
+        self.assertEqual([bien["title"] for bien in data["biens"]], ["Studio vide", "Villa Almadies"])
+        villa = data["biens"][1]
+        self.assertEqual(villa["totals"], {"received": "500.00", "late": "500.00", "pending": "0.00", "costs": "120.00", "net": "380.00"})
+        self.assertEqual(data["totals"], villa["totals"])
+        self.assertEqual([contract["tenant"] for contract in villa["contracts"]], ["Moussa"])
+        self.assertEqual(len(villa["payments"]), 3)
+        # Reports are dated by their creation, i.e. today.
+        self.assertEqual(villa["reports"], [])
+        self.assertEqual(len(statements.collect(self.owner, date.today())["biens"][1]["reports"]), 1)
+
+    def test_render_and_store(self):
+        data = statements.collect(self.owner, self.month)
+        html, _ = statements.render(data)
+        self.assertIn("Villa Almadies".encode(), html)
+        digest = statements.content_hash(data)
+        self.assertEqual(digest, statements.content_hash(statements.collect(self.owner, self.month)))
+        statement = statements.store(self.owner.pk, self.month, digest, html, None)
+        self.assertEqual(statements.store(self.owner.pk, self.month, digest, html, None).pk, statement.pk)
+        with statement.html.open("rb") as handle:
+            self.assertEqual(handle.read(), html)
+        self.assertEqual(MediaBlob.objects.get(name=statement.html.name).refcount, 1)
+
+    @mock.patch.object(statements, "_pdf_available", return_value=False)
+    def test_generate_skips_unchanged_statements(self, _):
+        self.assertEqual(statements.generate(self.month, workers=1), (2, 0))
+        self.assertEqual(OwnerStatement.objects.filter(month=self.month).count(), 2)
+        self.assertEqual(statements.generate(self.month, workers=1), (0, 2))
+        Payment.objects.filter(status=Payment.Status.LATE).update(status=Payment.Status.PAID)
+        self.assertEqual(statements.generate(self.month, workers=1), (1, 1))
+        self.assertEqual(statements.generate(self.month, owners=[self.owner], workers=1, force=True), (1, 0))
+
+
+@override_settings(GP_IMMO_DB_REPLICAS=["replica"])
+class ReplicaRoutingTests(TestCase):
+    router = db.ReplicaRouter()
+
+    def run_fresh(self, function, *args):
+        # The test's own writes pin this context to the primary.
+        return contextvars.Context().run(function, *args)
+
+    def read_alias(self):
+        return self.router.db_for_read(Bien)
+
+    def test_reads_go_to_the_primary_after_a_write_or_when_pinned(self):
+        def write_then_read():
+            self.assertEqual(self.read_alias(), "replica")
+            self.assertEqual(self.router.db_for_write(Bien), db.PRIMARY)
+            return self.read_alias()
+
+        def read_pinned():
+            with db.primary():
+                return self.read_alias()
+
+        self.assertEqual(self.run_fresh(write_then_read), db.PRIMARY)
+        self.assertEqual(self.run_fresh(read_pinned), db.PRIMARY)
+        self.assertEqual(self.run_fresh(db.use_primary(self.read_alias)), db.PRIMARY)
+        with override_settings(GP_IMMO_DB_REPLICAS=[]):
+            self.assertEqual(self.run_fresh(self.read_alias), db.PRIMARY)
+
+    def view(self, request):
+        request.read_alias = self.read_alias()
+        if "write" in request.GET:
+            self.router.db_for_write(Bien)
+        return HttpResponse()
+
+    def test_middleware_pins_clients_that_wrote(self):
+        middleware = db.PrimaryPinMiddleware(self.view)
+        factory = RequestFactory()
+
+        def call(request):
+            response = self.run_fresh(middleware, request)
+            return request.read_alias, response.cookies.get(db.PIN_COOKIE)
+
+        self.assertEqual(call(factory.get("/")), ("replica", None))
+        self.assertEqual(call(factory.post("/"))[0], db.PRIMARY)
+        alias, cookie = call(factory.get("/", {"write": 1}))
+        self.assertEqual((alias, cookie["max-age"]), ("replica", 5))
+        pinned = factory.get("/")
+        pinned.COOKIES[db.PIN_COOKIE] = cookie.value
+        self.assertEqual(call(pinned), (db.PRIMARY, None))
+        for value in ("0", "pas-un-nombre"):
+            stale = factory.get("/")
+            stale.COOKIES[db.PIN_COOKIE] = value
+            self.assertEqual(call(stale)[0], "replica")
+
+    def test_async_middleware(self):
+        async def view(request):
+            return self.view(request)
+
+        middleware = db.PrimaryPinMiddleware(view)
+        request = RequestFactory().get("/", {"write": 1})
+        response = self.run_fresh(asyncio.run, middleware(request))
+        self.assertEqual(request.read_alias, "replica")
+        self.assertIn(db.PIN_COOKIE, response.cookies)
+
+
+@override_settings(GP_IMMO_SQLITE_WRITE_QUEUE=True)
+class WriteQueueTests(TransactionTestCase):
+    def setUp(self):
+        self.owner = make_user("queue-owner")
+
+    def create(self, title):
+        make_bien(self.owner, title)
+        return threading.current_thread().name
+
+    def test_writes_run_in_the_writer_thread(self):
+        self.assertEqual(writequeue.run(self.create, "Villa"), "sqlite-writer-default")
+        self.assertTrue(Bien.objects.filter(title="Villa").exists())
+        with transaction.atomic():
+            # Waiting for the writer would deadlock on the caller's own lock.
+            self.assertEqual(writequeue.run(self.create, "Studio"), threading.current_thread().name)
+        with override_settings(GP_IMMO_SQLITE_WRITE_QUEUE=False):
+            self.assertEqual(writequeue.run(self.create, "Loft"), threading.current_thread().name)
+
+    def test_failing_job_only_rolls_back_itself(self):
+        def fail():
+            make_bien(self.owner, "Perdu")
+            raise ValueError("refusé")
+
+        jobs = [(self.create, ("Avant",)), (fail, ()), (self.create, ("Après",))]
+        batch = [(Future(), contextvars.copy_context(), function, args, {}) for function, args in jobs]
+        writequeue.WriteQueue()._write(batch)
+        before, failed, after = (future for future, *_ in batch)
+        self.assertEqual(before.result(), after.result())
+        with self.assertRaisesMessage(ValueError, "refusé"):
+            failed.result()
+        self.assertEqual(sorted(Bien.objects.values_list("title", flat=True)), ["Après", "Avant"])
+
+    def test_caller_sees_its_write_on_the_primary(self):
+        def run():
+            writequeue.run(self.create, "Villa")
+            return db.ReplicaRouter().db_for_read(Bien)
+
+        with override_settings(GP_IMMO_DB_REPLICAS=["replica"]):
+            self.assertEqual(contextvars.Context().run(run), db.PRIMARY)
+
+
+@override_settings(GP_IMMO_METRICS_TOKEN="secret", GP_IMMO_METRICS_ALLOWED_IPS=[])
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = make_user("metrics-owner")
+        for index in range(3):
+            make_bien(cls.owner, f"Bien {index}")
+
+    def test_endpoint_access(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        self.assertEqual(self.client.get("/metrics", headers={"Authorization": "Bearer autre"}).status_code, 403)
+        response = self.client.get("/metrics", headers={"Authorization": "Bearer secret"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("# TYPE gp_immo_request_duration_seconds histogram", response.content.decode())
+        self.client.force_login(self.owner)
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        self.client.force_login(make_user("metrics-staff", is_staff=True))
+        self.assertEqual(self.client.get("/metrics").status_code, 200)
+        with override_settings(GP_IMMO_METRICS_ALLOWED_IPS=["127.0.0.1"]):
+            self.client.logout()
+            self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+    def test_requests_are_measured(self):
+        labels = (("view", "api-bien-list"),)
+        requests = ("gp_immo_requests_total", labels + (("method", "GET"), ("status", 200)))
+        hits = ("gp_immo_cache_lookups_total", labels + (("cache", "http"), ("result", "hit")))
+        before = registry.counters[requests], registry.counters[hits]
+        self.client.force_login(self.owner)
+        with override_settings(GP_IMMO_QUERY_BUDGETS={"api-bien-list": 0}):
+            with self.assertLogs("gp_immo.metrics", "WARNING") as logs:
+                etag = self.client.get("/api/v1/biens/")["ETag"]
+        self.assertIn("pour un budget de 0", logs.output[0])
+        self.assertEqual(self.client.get("/api/v1/biens/", headers={"If-None-Match": etag}).status_code, 304)
+        self.assertEqual((registry.counters[requests], registry.counters[hits]), (before[0] + 1, before[1] + 1))
+        histogram = registry.histograms["gp_immo_request_queries", labels]
+        self.assertGreater(histogram.sum, 0)
+        rendered = self.client.get("/metrics", headers={"Authorization": "Bearer secret"}).content.decode()
+        self.assertIn('gp_immo_request_queries_bucket{view="api-bien-list",le="+Inf"}', rendered)
@@ -0,0 +1,222 @@
+"""
+Resumable chunked uploads for BienMedia files and Message attachments.
+
+A client opens an :class:`UploadSession`, then PUTs chunks in any order,
+retrying as needed; :func:`session_state` tells a reconnecting client which
+chunks are still missing. Each chunk is hashed while it is streamed from the
+request and written at its offset into one preallocated partial file, so no
+more than a read buffer is ever held in memory. :func:`finalize` moves the
+assembled file into the media storage (a rename with the filesystem storage,
+which is why ``GP_IMMO_UPLOAD_DIR`` should live on the same disk as
+``MEDIA_ROOT``) and creates the BienMedia or Message.
+"""
+import hashlib
+import os
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from gp_immo import writequeue
+from . import media as media_pipeline
+from .models import BienMedia, Message, UploadChunk, UploadSession
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+READ_BUFFER = 1024 * 1024
+MAX_MEDIA_PER_BIEN = 10
+
+
+class UploadError(Exception):
+    def __init__(self, message, missing=None):
+        super().__init__(message)
+        self.missing = missing or []
+
+
+class AssembledFile(File):
+    """Partial file handed to the storage, which can move it instead of copying."""
+
+    def __init__(self, path, name, content_type):
+        super().__init__(open(path, "rb"), name=name)
+        self.path = path
+        self.content_type = content_type
+
+    def temporary_file_path(self):
+        return self.path
+
+
+def max_size() -> int:
+    return getattr(settings, "GP_IMMO_UPLOAD_MAX_SIZE", 2 * 1024 ** 3)
+
+
+def upload_dir() -> Path:
+    return Path(getattr(settings, "GP_IMMO_UPLOAD_DIR", Path(settings.BASE_DIR) / "tmp" / "uploads"))
+
+
+def partial_path(session) -> Path:
+    return upload_dir() / f"{session.pk}.part"
+
+
+def _check_bien_capacity(bien):
+    if bien.media.count() >= MAX_MEDIA_PER_BIEN:
+        raise UploadError(f"Maximum {MAX_MEDIA_PER_BIEN} médias par bien.")
+
+
+def open_session(owner, target, filename, size, content_type="", chunk_size=None, sha256="", bien=None, receiver=None):
+    if not 0 < size <= max_size():
+        raise UploadError("Taille de fichier invalide.")
+    if target == UploadSession.Target.BIEN_MEDIA:
+        if bien is None:
+            raise UploadError("Bien requis.")
+        if not content_type.startswith(("image/", "video/")):
+            raise UploadError("Seules les images ou vidéos sont acceptées.")
+        _check_bien_capacity(bien)
+    elif receiver is None:
+        raise UploadError("Destinataire requis.")
+    chunk_size = min(max(chunk_size or DEFAULT_CHUNK_SIZE, MIN_CHUNK_SIZE), MAX_CHUNK_SIZE)
+    session = UploadSession.objects.create(
+        owner=owner,
+        target=target,
+        bien=bien if target == UploadSession.Target.BIEN_MEDIA else None,
+        receiver=receiver if target == UploadSession.Target.MESSAGE else None,
+        filename=get_valid_filename(os.path.basename(filename))[-100:] or "fichier",
+        content_type=content_type,
+        size=size,
+        chunk_size=chunk_size,
+        sha256=sha256.lower(),
+    )
+    path = partial_path(session)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as handle:
+        handle.truncate(size)
+    return session
+
+
+def _write_at(handle, data, offset):
+    if hasattr(os, "pwrite"):
+        os.pwrite(handle.fileno(), data, offset)
+    else:
+        handle.seek(offset)
+        handle.write(data)
+
+
+def write_chunk(session, index, stream, expected_sha256=""):
+    """Stream chunk ``index`` from ``stream`` into place; returns its sha256."""
+    if session.status != UploadSession.Status.EN_COURS:
+        raise UploadError("Téléversement déjà terminé.")
+    if not 0 <= index < session.chunk_count:
+        raise UploadError("Numéro de morceau invalide.")
+    length = session.chunk_length(index)
+    offset = index * session.chunk_size
+    digest = hashlib.sha256()
+    received = 0
+    with open(partial_path(session), "r+b") as handle:
+        while received < length:
+            block = stream.read(min(READ_BUFFER, length - received))
+            if not block:
+                break
+            _write_at(handle, block, offset + received)
+            digest.update(block)
+            received += len(block)
+    checksum = digest.hexdigest()
+    error = None
+    if received != length or stream.read(1):
+        error = f"Morceau {index} : {length} octets attendus."
+    elif expected_sha256 and expected_sha256.lower() != checksum:
+        error = f"Morceau {index} : somme de contrôle invalide."
+    if error:
+        # The region may hold a mix of old and new bytes now.
+        UploadChunk.objects.filter(session=session, index=index).delete()
+        raise UploadError(error)
+    writequeue.run(_record_chunk, session, index, length, checksum)
+    return checksum
+
+
+def _record_chunk(session, index, length, checksum):
+    UploadChunk.objects.update_or_create(session=session, index=index, defaults={"size": length, "sha256": checksum})
+    UploadSession.objects.filter(pk=session.pk).update(updated_at=timezone.now())
+
+
+def received_chunks(session):
+    return dict(session.chunks.order_by("index").values_list("index", "sha256"))
+
+
+def session_state(session) -> dict:
+    received = received_chunks(session)
+    state = {
+        "id": str(session.pk),
+        "status": session.status,
+        "filename": session.filename,
+        "size": session.size,
+        "chunk_size": session.chunk_size,
+        "chunks": session.chunk_count,
+        "received": received,
+    }
+    if session.media_id:
+        state["media"] = session.media_id
+    if session.message_id:
+        state["message"] = session.message_id
+    return state
+
+
+def file_sha256(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(READ_BUFFER), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def finalize(session, sha256=""):
+    """Create the BienMedia or Message from a complete upload. Idempotent."""
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session.pk)
+        if session.status == UploadSession.Status.TERMINE:
+            return session
+        missing = sorted(set(range(session.chunk_count)) - set(received_chunks(session)))
+        if missing:
+            raise UploadError("Morceaux manquants.", missing=missing)
+        path = partial_path(session)
+        expected = (sha256 or session.sha256).lower()
+        if expected and file_sha256(path) != expected:
+            raise UploadError("Somme de contrôle du fichier invalide.")
+        assembled = AssembledFile(str(path), session.filename, session.content_type)
+        try:
+            if session.target == UploadSession.Target.BIEN_MEDIA:
+                _check_bien_capacity(session.bien)
+                item = BienMedia(bien=session.bien)
+                item.file.save(session.filename, assembled, save=False)
+                item.save()
+                media_pipeline.schedule(item)
+                session.media = item
+            else:
+                item = Message(sender=session.owner, receiver=session.receiver)
+                item.attachment.save(session.filename, assembled, save=False)
+                item.save()
+                session.message = item
+        finally:
+            assembled.close()
+        session.status = UploadSession.Status.TERMINE
+        session.save(update_fields=["status", "media", "message", "updated_at"])
+        session.chunks.all().delete()
+    path.unlink(missing_ok=True)
+    return session
+
+
+def purge(older_than=timedelta(days=1)) -> int:
+    """Drop unfinished sessions idle for ``older_than`` and their partial files."""
+    stale = UploadSession.objects.filter(
+        status=UploadSession.Status.EN_COURS,
+        updated_at__lt=timezone.now() - older_than,
+    )
+    count = 0
+    for session in stale.iterator():
+        partial_path(session).unlink(missing_ok=True)
+        session.delete()
+        count += 1
+    return count
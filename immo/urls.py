@@ -1,5 +1,4 @@
 from django.conf import settings
-from django.conf.urls.static import static
 from django.urls import path
 
 from . import views
@@ -8,14 +7,29 @@ urlpatterns = [
     path("", views.home, name="home"),
     path("dashboard/", views.dashboard, name="dashboard"),
     path("biens/", views.biens_list, name="biens_list"),
+    path("annonces/", views.listings, name="listings"),
+    path("annonces/carte/", views.listings_map, name="listings_map"),
+    path("annonces/proximite/", views.listings_nearby, name="listings_nearby"),
     path("biens/nouveau/", views.bien_create, name="bien_create"),
+    path("biens/import/", views.bien_import, name="bien_import"),
+    path("biens/export/", views.biens_export, name="biens_export"),
     path("biens/<int:pk>/edition/", views.bien_edit, name="bien_edit"),
     path("biens/<int:pk>/medias/", views.bien_media, name="bien_media"),
     path("biens/<int:pk>/prestataire/", views.assign_prestataire, name="assign_prestataire"),
     path("contrats/nouveau/", views.contract_create, name="contract_create"),
     path("paiements/nouveau/", views.payment_create, name="payment_create"),
+    path("loyers/", views.rent_roll, name="rent_roll"),
+    path("loyers/export/", views.rent_roll_export, name="rent_roll_export"),
+    path("releves/", views.owner_statements, name="owner_statements"),
     path("marketplace/prestataires/", views.marketplace, name="marketplace"),
     path("messagerie/", views.inbox, name="inbox"),
+    path("messagerie/flux/", views.message_events, name="message_events"),
     path("messagerie/<int:user_id>/", views.conversation, name="conversation"),
+    path("messagerie/<int:user_id>/signal/", views.conversation_signal, name="conversation_signal"),
     path("rapports/nouveau/", views.report_create, name="report_create"),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    path("televersements/", views.upload_create, name="upload_create"),
+    path("televersements/<uuid:upload_id>/", views.upload_detail, name="upload_detail"),
+    path("televersements/<uuid:upload_id>/morceaux/<int:index>/", views.upload_chunk, name="upload_chunk"),
+    path("televersements/<uuid:upload_id>/finaliser/", views.upload_finalize, name="upload_finalize"),
+    path(f"{settings.MEDIA_URL.strip('/')}/<path:path>", views.media_file, name="media_file"),
+]
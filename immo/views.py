@@ -1,62 +1,174 @@
+import csv
+import math
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
 from django.db.models import Q
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import require_GET, require_http_methods, require_POST, require_safe
 
 from accounts.models import User
+from gp_immo import metrics, writequeue
+from gp_immo.db import use_primary
+from . import conversations, geo, ledger, media, portfolio, realtime, serving, uploads
+from .dashboard import panels as dashboard_panels
 from .forms import (
     BienForm,
+    BienImportForm,
     BienMediaUploadForm,
+    BienSearchForm,
     ContractForm,
     InterventionReportForm,
     MessageForm,
     PaymentForm,
     PrestataireAssignmentForm,
+    UploadSessionForm,
+)
+from .marketplace import PAGE_TIMEOUT, cached, cached_search, showcase
+from .models import (
+    Bien,
+    BienMedia,
+    Contract,
+    InterventionReport,
+    Message,
+    OwnerStatement,
+    Payment,
+    PrestataireAssignment,
+    UploadSession,
 )
-from .models import Bien, BienMedia, Contract, InterventionReport, Message, Payment, PrestataireAssignment
+from .pagination import InvalidCursor, keyset_paginate
+from .search import bien_filters, cached_facet_counts, facet_counts, filters_key, fulltext_biens, search_biens
+
+HOME_MAX_AGE = 60
+MAP_MAX_RESULTS = 500
+MAP_CACHE_TTL = 60
+NEARBY_MAX_KM = 50
+INBOX_PER_PAGE = 30
+SUGGESTIONS_LIMIT = 20
+MESSAGES_PER_PAGE = 30
+LONG_POLL_TIMEOUT = 25
+
+
+def _render_home(request):
+    return render(request, "immo/home.html", {"prestataires": showcase()})
 
 
 def home(request):
-    prestataires = User.objects.filter(role=User.Role.PRESTATAIRE, marketplace_visible=True)[:4]
-    return render(request, "immo/home.html", {"prestataires": prestataires})
+    # Without a session or pending messages the page is the same for every
+    # visitor: serve it from the cache, without touching the database.
+    if settings.SESSION_COOKIE_NAME in request.COOKIES or CookieStorage.cookie_name in request.COOKIES:
+        return _render_home(request)
+    response = HttpResponse(cached("home", "anonyme", lambda: _render_home(request).content, PAGE_TIMEOUT))
+    patch_cache_control(response, public=True, max_age=HOME_MAX_AGE)
+    patch_vary_headers(response, ["Cookie"])
+    return response
 
 
 @login_required
 def dashboard(request):
-    user: User = request.user
-    context = {}
-    if user.is_proprietaire():
-        biens = Bien.objects.filter(owner=user)
-        contrats = Contract.objects.filter(owner=user).order_by("-created_at")[:5]
-        paiements = Payment.objects.filter(
-            Q(contract__owner=user) | Q(bien__owner=user)
-        ).order_by("-created_at")[:5]
-        context.update(
-            {
-                "biens": biens,
-                "contrats": contrats,
-                "paiements": paiements,
-                "assignments": PrestataireAssignment.objects.filter(bien__owner=user),
-            }
-        )
-    else:
-        missions = PrestataireAssignment.objects.filter(prestataire=user, active=True)
-        rapports = InterventionReport.objects.filter(prestataire=user).order_by("-created_at")[:5]
-        context.update(
-            {
-                "missions": missions,
-                "rapports": rapports,
-            }
-        )
-    last_messages = Message.objects.filter(Q(sender=user) | Q(receiver=user)).order_by("-created_at")[:6]
-    context["last_messages"] = last_messages
+    context = dashboard_panels(request.user)
     return render(request, "immo/dashboard.html", context)
 
 
+def _bien_search_context(request, queryset, facets_cache_prefix=None):
+    form = BienSearchForm(request.GET or None)
+    form.is_valid()
+    cleaned = getattr(form, "cleaned_data", {})
+    filters = bien_filters(cleaned)
+    if cleaned.get("q"):
+        # Ranked text results: top matches only, without cursor or facet counts.
+        return {"form": form, "biens": fulltext_biens(queryset, filters, cleaned["q"]), "next_query": None}
+    try:
+        page = search_biens(queryset, filters, cursor=request.GET.get("cursor"))
+    except InvalidCursor:
+        page = search_biens(queryset, filters)
+    if facets_cache_prefix:
+        facets = cached_facet_counts(queryset, filters, facets_cache_prefix)
+    else:
+        facets = facet_counts(queryset, filters)
+    form.apply_facets(facets)
+    next_query = None
+    if page.has_next:
+        params = request.GET.copy()
+        params["cursor"] = page.next_cursor
+        next_query = params.urlencode()
+    return {"form": form, "biens": page, "next_query": next_query}
+
+
 @login_required
 def biens_list(request):
-    biens = Bien.objects.filter(owner=request.user)
-    return render(request, "immo/biens_list.html", {"biens": biens})
+    context = _bien_search_context(request, Bien.objects.filter(owner=request.user))
+    return render(request, "immo/biens_list.html", context)
+
+
+def listings(request):
+    context = _bien_search_context(request, Bien.objects.all(), facets_cache_prefix="listings")
+    media.attach_covers(context["biens"])
+    return render(request, "immo/listings.html", context)
+
+
+def _map_point(bien, **extra):
+    return {
+        "id": bien.id,
+        "title": bien.title,
+        "property_type": bien.property_type,
+        "listing_status": bien.listing_status,
+        "price": str(bien.price) if bien.price is not None else None,
+        "latitude": bien.latitude,
+        "longitude": bien.longitude,
+        **extra,
+    }
+
+
+def _listing_filters(request):
+    form = BienSearchForm(request.GET or None)
+    form.is_valid()
+    return bien_filters(getattr(form, "cleaned_data", {}))
+
+
+def listings_map(request):
+    try:
+        south, west, north, east = (float(value) for value in request.GET.get("bbox", "").split(","))
+    except ValueError:
+        return JsonResponse({"error": "Paramètre bbox attendu : sud,ouest,nord,est."}, status=400)
+    if not (geo.valid_coordinates(south, west) and geo.valid_coordinates(north, east)) or south > north or west > east:
+        return JsonResponse({"error": "Coordonnées hors limites."}, status=400)
+    cells = geo.cover(south, west, north, east)
+    filters = _listing_filters(request)
+    # Keyed on the covering cells, not the exact viewport, so nearby pans hit the cache.
+    key = f"listings:map:{','.join(cells)}:{filters_key(filters)}"
+    data = cache.get(key)
+    metrics.record_cache("map", hits=data is not None, misses=data is None)
+    if data is None:
+        biens = geo.in_cells(Bien.objects.filter(**filters), cells).only(
+            "id", "title", "property_type", "listing_status", "price", "latitude", "longitude"
+        )[:MAP_MAX_RESULTS]
+        data = {"cells": cells, "biens": [_map_point(bien) for bien in biens]}
+        cache.set(key, data, MAP_CACHE_TTL)
+    response = JsonResponse(data)
+    patch_cache_control(response, public=True, max_age=MAP_CACHE_TTL)
+    return response
+
+
+def listings_nearby(request):
+    try:
+        latitude = float(request.GET["lat"])
+        longitude = float(request.GET["lng"])
+        radius = min(float(request.GET.get("km", 2)), NEARBY_MAX_KM)
+    except (KeyError, ValueError):
+        return JsonResponse({"error": "Paramètres lat, lng et km attendus."}, status=400)
+    if not geo.valid_coordinates(latitude, longitude) or not math.isfinite(radius) or radius <= 0:
+        return JsonResponse({"error": "Coordonnées hors limites."}, status=400)
+    biens = geo.within_radius(Bien.objects.filter(**_listing_filters(request)), latitude, longitude, radius)
+    return JsonResponse({"biens": [_map_point(bien, distance_km=round(bien.distance_km, 3)) for bien in biens]})
 
 
 @login_required
@@ -77,6 +189,47 @@ def bien_create(request):
     return render(request, "immo/bien_form.html", {"form": form, "title": "Nouveau bien"})
 
 
+@login_required
+def bien_import(request):
+    if not request.user.is_proprietaire():
+        messages.error(request, "Seuls les propriétaires peuvent importer des biens.")
+        return redirect("dashboard")
+    report = None
+    if request.method == "POST":
+        form = BienImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                report = portfolio.import_biens(request.user, form.cleaned_data["file"])
+            except portfolio.PortfolioError as exc:
+                form.add_error("file", str(exc))
+                report = exc.report
+                if report and report.created:
+                    messages.warning(
+                        request, f"Import interrompu : les {report.created} biens des lignes précédentes sont enregistrés."
+                    )
+            else:
+                if report.created:
+                    messages.success(request, f"{report.created} biens importés.")
+                if not report.error_count:
+                    return redirect("biens_list")
+    else:
+        form = BienImportForm()
+    return render(request, "immo/bien_import.html", {"form": form, "report": report})
+
+
+@login_required
+def biens_export(request):
+    form = BienSearchForm(request.GET or None)
+    form.is_valid()
+    filters = bien_filters(getattr(form, "cleaned_data", {}))
+    queryset = Bien.objects.filter(owner=request.user, **filters)
+    try:
+        return portfolio.export_response(queryset, "biens", request.GET.get("format", "csv"))
+    except portfolio.PortfolioError as exc:
+        messages.error(request, str(exc))
+        return redirect("biens_list")
+
+
 @login_required
 def bien_edit(request, pk):
     bien = get_object_or_404(Bien, pk=pk, owner=request.user)
@@ -120,10 +273,10 @@ def bien_media(request, pk):
             messages.error(request, "Maximum 10 médias par bien.")
         else:
             for f in files:
-                BienMedia.objects.create(bien=bien, file=f)
+                media.schedule(BienMedia.objects.create(bien=bien, file=f))
             messages.success(request, "Médias ajoutés.")
             return redirect("bien_media", pk=bien.id)
-    medias = bien.media.order_by("-uploaded_at")
+    medias = bien.media.order_by("-uploaded_at").prefetch_related("variants")
     return render(request, "immo/bien_media.html", {"bien": bien, "form": form, "medias": medias, "existing_count": existing_count})
 
 
@@ -150,35 +303,98 @@ def payment_create(request):
     form.fields["bien"].queryset = Bien.objects.filter(owner=request.user) if request.user.is_proprietaire() else Bien.objects.none()
     form.fields["prestataire"].queryset = User.objects.filter(role=User.Role.PRESTATAIRE)
     if request.method == "POST" and form.is_valid():
-        paiement: Payment = form.save()
+        paiement: Payment = writequeue.run(form.save)
         messages.success(request, "Paiement enregistré.")
         return redirect("dashboard")
     return render(request, "immo/payment_form.html", {"form": form})
 
 
+def _ledger_year(request):
+    try:
+        return int(request.GET.get("annee", ""))
+    except ValueError:
+        return timezone.now().year
+
+
+@login_required
+def rent_roll(request):
+    if not request.user.is_proprietaire():
+        messages.error(request, "Le suivi des loyers est réservé aux propriétaires.")
+        return redirect("dashboard")
+    year = _ledger_year(request)
+    context = ledger.rent_roll(request.user, year)
+    context.update({"year": year, "previous_year": year - 1, "next_year": year + 1})
+    return render(request, "immo/rent_roll.html", context)
+
+
+@login_required
+def rent_roll_export(request):
+    if not request.user.is_proprietaire():
+        return HttpResponse(status=403)
+    year = _ledger_year(request)
+    response = HttpResponse(content_type="text/csv; charset=utf-8")
+    response["Content-Disposition"] = f'attachment; filename="loyers-{year}.csv"'
+    writer = csv.writer(response)
+    writer.writerow(["bien_id", "bien", "mois", "type", "statut", "total", "nombre"])
+    entries = ledger.year_entries(request.user, year).order_by("month", "bien_id", "payment_type", "status")
+    for row in entries.values_list("bien_id", "bien__title", "month", "payment_type", "status", "total", "count"):
+        writer.writerow([row[0], row[1], row[2].strftime("%Y-%m"), *row[3:]])
+    return response
+
+
+@login_required
+def owner_statements(request):
+    if not request.user.is_proprietaire():
+        messages.error(request, "Les relevés sont réservés aux propriétaires.")
+        return redirect("dashboard")
+    statements = OwnerStatement.objects.filter(owner=request.user)[:24]
+    return render(request, "immo/owner_statements.html", {"statements": statements})
+
+
 @login_required
 def marketplace(request):
     search = request.GET.get("q", "")
-    prestataires = User.objects.filter(role=User.Role.PRESTATAIRE, marketplace_visible=True)
-    if search:
-        prestataires = prestataires.filter(Q(username__icontains=search) | Q(specialization__icontains=search))
-    return render(request, "immo/marketplace.html", {"prestataires": prestataires, "search": search})
+    try:
+        prestataires = cached_search(search, cursor=request.GET.get("cursor"))
+    except InvalidCursor:
+        prestataires = cached_search(search)
+    next_query = None
+    if prestataires.has_next:
+        params = request.GET.copy()
+        params["cursor"] = prestataires.next_cursor
+        next_query = params.urlencode()
+    return render(
+        request,
+        "immo/marketplace.html",
+        {"prestataires": prestataires, "search": search, "next_query": next_query},
+    )
 
 
 @login_required
 def inbox(request):
     user = request.user
-    ids = set()
-    for sender_id, receiver_id in Message.objects.filter(Q(sender=user) | Q(receiver=user)).values_list("sender_id", "receiver_id"):
-        ids.update([sender_id, receiver_id])
-    ids.discard(user.id)
-    contacts = User.objects.filter(id__in=ids)
-    assignments = PrestataireAssignment.objects.filter(bien__owner=user) if user.is_proprietaire() else PrestataireAssignment.objects.filter(prestataire=user)
-    suggested = {a.prestataire for a in assignments} if user.is_proprietaire() else {a.bien.owner for a in assignments}
+    try:
+        page = conversations.inbox_page(user, request.GET.get("cursor"), INBOX_PER_PAGE)
+    except InvalidCursor:
+        page = conversations.inbox_page(user, None, INBOX_PER_PAGE)
+    for thread in page:
+        thread.contact = thread.other(user)
+        thread.unread = thread.unread_for(user)
+    if user.is_proprietaire():
+        assignments = PrestataireAssignment.objects.filter(bien__owner=user).select_related("prestataire")
+        suggested = {a.prestataire for a in assignments[:SUGGESTIONS_LIMIT]}
+    else:
+        assignments = PrestataireAssignment.objects.filter(prestataire=user).select_related("bien__owner")
+        suggested = {a.bien.owner for a in assignments[:SUGGESTIONS_LIMIT]}
+    next_query = None
+    if page.has_next:
+        params = request.GET.copy()
+        params["cursor"] = page.next_cursor
+        next_query = params.urlencode()
     return render(
         request,
         "immo/inbox.html",
-        {"contacts": contacts, "suggested": suggested},
+        {"threads": page, "suggested": suggested, "next_query": next_query},
     )
 
 
@@ -191,15 +407,75 @@ def conversation(request, user_id):
             msg = form.save(commit=False)
             msg.sender = request.user
             msg.receiver = other
-            msg.save()
+            if msg.attachment:
+                # Stored here, so that the writer thread only inserts the row.
+                msg.attachment.save(msg.attachment.name, msg.attachment.file, save=False)
+            writequeue.run(msg.save)
             messages.success(request, "Message envoyé.")
             return redirect("conversation", user_id=other.id)
     else:
         form = MessageForm()
-    messages_qs = Message.objects.filter(
-        Q(sender=request.user, receiver=other) | Q(sender=other, receiver=request.user)
-    ).order_by("created_at")
-    return render(request, "immo/conversation.html", {"messages_qs": messages_qs, "other": other, "form": form})
+        conversations.mark_read(request.user, other.id)
+    thread = conversations.thread_between(request.user.pk, other.pk)
+    history = thread.messages.all() if thread else Message.objects.none()
+    try:
+        page = keyset_paginate(history, request.GET.get("cursor"), per_page=MESSAGES_PER_PAGE)
+    except InvalidCursor:
+        page = keyset_paginate(history, per_page=MESSAGES_PER_PAGE)
+    older_query = None
+    if page.has_next:
+        params = request.GET.copy()
+        params["cursor"] = page.next_cursor
+        older_query = params.urlencode()
+    return render(
+        request,
+        "immo/conversation.html",
+        {
+            "messages_qs": page.items[::-1],
+            "other": other,
+            "form": form,
+            "older_query": older_query,
+            "live": "cursor" not in request.GET,
+            "last_message_id": page.items[0].pk if page.items else 0,
+            "websocket_path": realtime.WEBSOCKET_PATH,
+        },
+    )
+
+
+@login_required
+@require_POST
+def conversation_signal(request, user_id):
+    """Typing and read notifications for clients without a WebSocket."""
+    kind = request.POST.get("type")
+    if kind == "typing":
+        if not realtime.shares_conversation(request.user.pk, user_id):
+            raise Http404
+        realtime.publish_typing(request.user.pk, user_id)
+    elif kind == "read":
+        conversations.mark_read(request.user, user_id)
+    else:
+        return HttpResponse(status=400)
+    return HttpResponse(status=204)
+
+
+async def message_events(request):
+    """
+    Long-poll fallback of the messaging WebSocket: returns the messages after
+    ``after`` right away if any were missed, otherwise waits for the next
+    events (``wait=0`` only catches up).
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({"detail": "Authentification requise."}, status=401)
+    subscription = realtime.subscribe(user.pk)
+    try:
+        after = request.GET.get("after", "")
+        events = await sync_to_async(realtime.messages_after)(user, int(after)) if after.isdigit() else []
+        if not events and request.GET.get("wait") != "0":
+            events = await realtime.wait_for_events(subscription, LONG_POLL_TIMEOUT)
+    finally:
+        subscription.close()
+    return JsonResponse({"events": events})
 
 
 @login_required
@@ -216,3 +492,78 @@ def report_create(request):
         messages.success(request, "Rapport transmis au propriétaire.")
         return redirect("dashboard")
     return render(request, "immo/report_form.html", {"form": form})
+
+
+def _upload_error(error):
+    payload = {"error": str(error)}
+    if error.missing:
+        payload["missing"] = error.missing
+    return JsonResponse(payload, status=409 if error.missing else 400)
+
+
+@login_required
+@require_POST
+def upload_create(request):
+    form = UploadSessionForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({"error": form.errors.get_json_data()}, status=400)
+    data = form.cleaned_data
+    bien = receiver = None
+    if data["target"] == UploadSession.Target.BIEN_MEDIA:
+        bien = get_object_or_404(Bien, pk=data["bien"], owner=request.user)
+    else:
+        receiver = get_object_or_404(User, pk=data["receiver"])
+    try:
+        session = uploads.open_session(
+            request.user,
+            data["target"],
+            data["filename"],
+            data["size"],
+            content_type=data["content_type"],
+            chunk_size=data["chunk_size"],
+            sha256=data["sha256"],
+            bien=bien,
+            receiver=receiver,
+        )
+    except uploads.UploadError as error:
+        return _upload_error(error)
+    return JsonResponse(uploads.session_state(session), status=201)
+
+
+@login_required
+@require_GET
+@use_primary  # resumed uploads compare this state with the chunks they just sent
+def upload_detail(request, upload_id):
+    session = get_object_or_404(UploadSession, pk=upload_id, owner=request.user)
+    return JsonResponse(uploads.session_state(session))
+
+
+@login_required
+@require_http_methods(["PUT"])
+def upload_chunk(request, upload_id, index):
+    session = get_object_or_404(UploadSession, pk=upload_id, owner=request.user)
+    try:
+        checksum = uploads.write_chunk(session, index, request, request.headers.get("X-Chunk-Sha256", ""))
+    except uploads.UploadError as error:
+        return _upload_error(error)
+    return JsonResponse({"index": index, "sha256": checksum})
+
+
+@login_required
+@require_POST
+def upload_finalize(request, upload_id):
+    session = get_object_or_404(UploadSession, pk=upload_id, owner=request.user)
+    try:
+        session = uploads.finalize(session, request.POST.get("sha256", ""))
+    except uploads.UploadError as error:
+        return _upload_error(error)
+    return JsonResponse(uploads.session_state(session))
+
+
+@require_safe
+def media_file(request, path):
+    visibility = serving.access(request.user, path)
+    response = serving.serve(request, path, visibility) if visibility else None
+    if response is None:
+        raise Http404("Fichier introuvable.")
+    return response
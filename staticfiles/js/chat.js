@@ -0,0 +1,159 @@
+// Live conversation: new messages, typing and read receipts over a WebSocket,
+// falling back to long polling when the socket cannot be opened.
+(function () {
+    const box = document.querySelector(".chat-box[data-other]");
+    if (!box) {
+        return;
+    }
+    const me = Number(box.dataset.user);
+    const other = Number(box.dataset.other);
+    const status = document.querySelector(".chat-status");
+    const form = document.querySelector("form.form-card");
+    const csrf = form ? form.querySelector("[name=csrfmiddlewaretoken]").value : "";
+    const input = form ? form.querySelector("textarea, input[type=text]") : null;
+    let lastId = Number(box.dataset.lastId || 0);
+    let socket = null;
+    let statusTimer = null;
+    let lastTypingSent = 0;
+
+    function showStatus(text, duration) {
+        if (!status) {
+            return;
+        }
+        status.textContent = text;
+        status.hidden = false;
+        clearTimeout(statusTimer);
+        if (duration) {
+            statusTimer = setTimeout(function () { status.hidden = true; }, duration);
+        }
+    }
+
+    function formatDate(iso) {
+        const date = new Date(iso);
+        const pad = function (n) { return String(n).padStart(2, "0"); };
+        return pad(date.getDate()) + "/" + pad(date.getMonth() + 1) + "/" + date.getFullYear()
+            + " " + pad(date.getHours()) + ":" + pad(date.getMinutes());
+    }
+
+    function appendMessage(event) {
+        const empty = box.querySelector(".chat-empty");
+        if (empty) {
+            empty.remove();
+        }
+        const line = document.createElement("div");
+        line.className = "chat-line " + (event.sender === me ? "me" : "them");
+        line.dataset.id = event.id;
+        const bubble = document.createElement("div");
+        bubble.className = "bubble";
+        const date = document.createElement("p");
+        date.className = "muted";
+        date.textContent = formatDate(event.created_at);
+        const content = document.createElement("p");
+        content.textContent = event.content;
+        bubble.append(date, content);
+        if (event.attachment) {
+            const link = document.createElement("a");
+            link.className = "link";
+            link.href = event.attachment;
+            link.target = "_blank";
+            link.textContent = "Pièce jointe";
+            bubble.append(link);
+        }
+        line.append(bubble);
+        box.append(line);
+        line.scrollIntoView({ block: "end" });
+    }
+
+    function signal(type) {
+        if (socket && socket.readyState === WebSocket.OPEN) {
+            socket.send(JSON.stringify({ type: type, to: other }));
+            return;
+        }
+        const body = new URLSearchParams({ type: type });
+        fetch(box.dataset.signalUrl, {
+            method: "POST",
+            body: body,
+            credentials: "same-origin",
+            headers: { "X-CSRFToken": csrf },
+        });
+    }
+
+    function handle(event) {
+        if (event.type === "message") {
+            const inThread = (event.sender === other && event.receiver === me)
+                || (event.sender === me && event.receiver === other);
+            if (!inThread || box.querySelector('.chat-line[data-id="' + event.id + '"]')) {
+                lastId = Math.max(lastId, event.id);
+                return;
+            }
+            lastId = Math.max(lastId, event.id);
+            appendMessage(event);
+            if (event.sender === other) {
+                if (status) {
+                    status.hidden = true;
+                }
+                signal("read");
+            }
+        } else if (event.type === "typing" && event.from === other) {
+            showStatus("En train d'écrire…", 4000);
+        } else if (event.type === "read" && event.by === other) {
+            showStatus("Lu", 0);
+        }
+    }
+
+    async function poll(wait) {
+        const url = box.dataset.pollUrl + "?after=" + lastId + (wait ? "" : "&wait=0");
+        const response = await fetch(url, { credentials: "same-origin" });
+        if (!response.ok) {
+            throw new Error(response.status);
+        }
+        (await response.json()).events.forEach(handle);
+    }
+
+    async function longPoll() {
+        for (;;) {
+            try {
+                await poll(true);
+            } catch (error) {
+                await new Promise(function (resolve) { setTimeout(resolve, 5000); });
+            }
+        }
+    }
+
+    function connect() {
+        if (!("WebSocket" in window)) {
+            longPoll();
+            return;
+        }
+        const scheme = location.protocol === "https:" ? "wss://" : "ws://";
+        let opened = false;
+        socket = new WebSocket(scheme + location.host + box.dataset.wsPath);
+        socket.onopen = function () {
+            opened = true;
+            // Catch up on anything sent while the socket was down.
+            poll(false).catch(function () {});
+        };
+        socket.onmessage = function (message) {
+            handle(JSON.parse(message.data));
+        };
+        socket.onclose = function () {
+            socket = null;
+            if (opened) {
+                setTimeout(connect, 2000);
+            } else {
+                longPoll();
+            }
+        };
+    }
+
+    if (input) {
+        input.addEventListener("input", function () {
+            const now = Date.now();
+            if (now - lastTypingSent > 3000) {
+                lastTypingSent = now;
+                signal("typing");
+            }
+        });
+    }
+    connect();
+})();
@@ -0,0 +1,120 @@
+// Resumable chunked upload of the files of a form marked with
+// data-upload-url: each file gets an upload session, chunks are retried on
+// failure, and a session interrupted by a reload resumes where it stopped.
+(function () {
+    const form = document.querySelector("form[data-upload-url]");
+    if (!form || !window.fetch || !window.Blob) {
+        return;
+    }
+    const input = form.querySelector("input[type=file]");
+    const csrf = form.querySelector("[name=csrfmiddlewaretoken]").value;
+    const progress = document.createElement("p");
+    progress.className = "muted upload-progress";
+    form.append(progress);
+
+    async function request(url, options) {
+        const response = await fetch(url, Object.assign({ credentials: "same-origin" }, options));
+        const data = await response.json().catch(function () { return {}; });
+        if (!response.ok) {
+            const error = new Error(typeof data.error === "string" ? data.error : "Échec du téléversement.");
+            error.status = response.status;
+            throw error;
+        }
+        return data;
+    }
+
+    async function sha256(blob) {
+        if (!window.crypto || !crypto.subtle) {
+            return "";
+        }
+        const digest = await crypto.subtle.digest("SHA-256", await blob.arrayBuffer());
+        return Array.from(new Uint8Array(digest)).map(function (b) { return b.toString(16).padStart(2, "0"); }).join("");
+    }
+
+    function storageKey(file) {
+        return "upload:" + form.dataset.uploadUrl + ":" + form.dataset.uploadBien + ":" + file.name + ":" + file.size + ":" + file.lastModified;
+    }
+
+    async function openSession(file) {
+        const saved = localStorage.getItem(storageKey(file));
+        if (saved) {
+            try {
+                const state = await request(form.dataset.uploadUrl + saved + "/");
+                if (state.status === "EN_COURS") {
+                    return state;
+                }
+            } catch (error) {
+                // Expired or purged: start over.
+            }
+        }
+        const body = new FormData();
+        body.append("target", "BIEN_MEDIA");
+        body.append("bien", form.dataset.uploadBien);
+        body.append("filename", file.name);
+        body.append("size", file.size);
+        body.append("content_type", file.type);
+        const state = await request(form.dataset.uploadUrl, {
+            method: "POST",
+            body: body,
+            headers: { "X-CSRFToken": csrf },
+        });
+        localStorage.setItem(storageKey(file), state.id);
+        return state;
+    }
+
+    async function sendChunk(state, file, index) {
+        const blob = file.slice(index * state.chunk_size, (index + 1) * state.chunk_size);
+        const checksum = await sha256(blob);
+        for (let attempt = 0; ; attempt++) {
+            try {
+                return await request(form.dataset.uploadUrl + state.id + "/morceaux/" + index + "/", {
+                    method: "PUT",
+                    body: blob,
+                    headers: { "X-CSRFToken": csrf, "X-Chunk-Sha256": checksum },
+                });
+            } catch (error) {
+                if (attempt >= 4 || (error.status && error.status < 500)) {
+                    throw error;
+                }
+                await new Promise(function (resolve) { setTimeout(resolve, 1000 * 2 ** attempt); });
+            }
+        }
+    }
+
+    async function upload(file, position, total) {
+        const state = await openSession(file);
+        let done = Object.keys(state.received).length;
+        for (let index = 0; index < state.chunks; index++) {
+            if (String(index) in state.received) {
+                continue;
+            }
+            await sendChunk(state, file, index);
+            done += 1;
+            progress.textContent = "Fichier " + position + "/" + total + " : " + Math.round(100 * done / state.chunks) + " %";
+        }
+        await request(form.dataset.uploadUrl + state.id + "/finaliser/", {
+            method: "POST",
+            headers: { "X-CSRFToken": csrf },
+        });
+        localStorage.removeItem(storageKey(file));
+    }
+
+    form.addEventListener("submit", async function (event) {
+        const files = Array.from(input.files || []);
+        if (!files.length) {
+            return;
+        }
+        event.preventDefault();
+        const button = form.querySelector("button[type=submit]");
+        button.disabled = true;
+        try {
+            for (let i = 0; i < files.length; i++) {
+                await upload(files[i], i + 1, files.length);
+            }
+            window.location.reload();
+        } catch (error) {
+            progress.textContent = error.message + " Renvoyez le formulaire pour reprendre.";
+            button.disabled = false;
+        }
+    });
+})();